@@ -0,0 +1,140 @@
+"""
+Admin API — on-demand CPU profiling, memory snapshots, token-estimator calibration, budgets and cache.
+
+Every route requires the X-Admin-Token header to match ADMIN_TOKEN.
+"""
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.core.cache import cache
+from app.core.config import settings
+from app.core.security import require_admin
+from app.services.budget_service import budget_service
+from app.services.profiling_service import profiling_service
+from app.services.telemetry_store import telemetry_store
+from app.services.token_service import token_estimator
+
+router = APIRouter(dependencies=[Depends(require_admin)])
+
+MAX_PROFILE_SECONDS = 120
+
+
+@router.post("/admin/profile/cpu")
+async def profile_cpu(
+    duration: float = Query(default=10.0, gt=0, le=MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(default=settings.PROFILE_INTERVAL_MS, ge=1.0, le=100.0),
+):
+    """Sample every thread of this worker for `duration` seconds, then store the profile."""
+    if not profiling_service.try_acquire_cpu():
+        raise HTTPException(status_code=409, detail="A CPU profile is already running")
+    try:
+        profiler = profiling_service.start_sampler(interval_ms / 1000)
+        try:
+            await asyncio.sleep(duration)
+        finally:
+            await asyncio.to_thread(profiler.stop)
+        profile_id = profiling_service.store_profile(profiler, f"worker {duration:g}s")
+    finally:
+        profiling_service.release_cpu()
+    return {"id": profile_id, **profiler.summary()}
+
+
+@router.get("/admin/profiles")
+async def list_profiles():
+    """Recent CPU profiles, newest first."""
+    return profiling_service.list_profiles()
+
+
+@router.get("/admin/profile/{profile_id}")
+async def download_profile(profile_id: str, format: str = Query(default="speedscope", pattern="^(speedscope|collapsed)$")):
+    """Download a stored profile as speedscope JSON or collapsed stacks."""
+    profiler = profiling_service.get_profile(profile_id)
+    if profiler is None:
+        raise HTTPException(status_code=404, detail="Unknown profile id")
+    if format == "collapsed":
+        return PlainTextResponse(
+            profiler.collapsed(),
+            headers={"Content-Disposition": f'attachment; filename="{profile_id}.collapsed.txt"'},
+        )
+    return JSONResponse(
+        profiler.speedscope(name=profile_id),
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.speedscope.json"'},
+    )
+
+
+@router.post("/admin/tracemalloc/start")
+async def tracemalloc_start(frames: int = Query(default=25, ge=1, le=100)):
+    """Start tracing allocations (adds overhead until stopped)."""
+    return profiling_service.tracemalloc_start(frames)
+
+
+@router.post("/admin/tracemalloc/stop")
+async def tracemalloc_stop():
+    """Stop tracing and drop stored snapshots."""
+    return profiling_service.tracemalloc_stop()
+
+
+@router.get("/admin/tracemalloc")
+async def tracemalloc_status():
+    return profiling_service.tracemalloc_status()
+
+
+@router.post("/admin/tracemalloc/snapshot")
+async def tracemalloc_snapshot(top: int = Query(default=20, ge=1, le=200)):
+    """Take a snapshot and return the largest allocation sites."""
+    try:
+        return await asyncio.to_thread(profiling_service.tracemalloc_snapshot, top)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/admin/tracemalloc/diff")
+async def tracemalloc_diff(
+    from_id: str = Query(alias="from"),
+    to_id: str = Query(alias="to"),
+    top: int = Query(default=20, ge=1, le=200),
+):
+    """Allocation growth between two stored snapshots."""
+    try:
+        return await asyncio.to_thread(profiling_service.tracemalloc_diff, from_id, to_id, top)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/admin/tokens/calibration")
+async def token_calibration():
+    """Current per-family calibration scales of the local token estimator."""
+    return token_estimator.stats()
+
+
+@router.post("/admin/tokens/calibrate")
+async def calibrate_tokens(limit: int = Query(default=5000, ge=1, le=100000)):
+    """Refit the token estimator against provider-reported counts in logged telemetry."""
+    rows = await asyncio.to_thread(telemetry_store.get_all_telemetry, limit)
+    return token_estimator.calibrate(rows)
+
+
+@router.get("/admin/budgets")
+async def budgets():
+    """Current spend per key, team and default scope."""
+    return budget_service.snapshot()
+
+
+@router.post("/admin/budgets/reload")
+async def reload_budgets():
+    """Re-read BUDGETS_FILE; accumulated spend is kept."""
+    await asyncio.to_thread(budget_service.load)
+    return budget_service.snapshot()
+
+
+@router.get("/admin/cache")
+async def cache_stats():
+    """Entries per tier and this worker's hit/miss counts per namespace."""
+    return await asyncio.to_thread(cache.stats)
+
+
+@router.post("/admin/cache/clear")
+async def clear_cache(namespace: str = Query(default=None)):
+    """Drop one namespace (or everything) from both tiers; other workers' LRUs expire on their own."""
+    await asyncio.to_thread(cache.clear, namespace)
+    return await asyncio.to_thread(cache.stats)
@@ -1,16 +1,90 @@
-from fastapi import APIRouter
-from app.services.supabase_service import supabase_service
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query
+from app.core.responses import FastJSONResponse
+from app.services.export_service import export_response
+from app.services.telemetry_store import TELEMETRY_EXPORT_COLUMNS, telemetry_store
 
 router = APIRouter()
 
 
 @router.get("/analytics")
-async def get_analytics():
-    """Get aggregated analytics from Supabase telemetry."""
-    return supabase_service.get_analytics_summary()
+async def get_analytics(limit: Optional[int] = Query(default=None, ge=1)):
+    """Get aggregated analytics from the telemetry store (totals cover every row; `limit` caps `data`)."""
+    return FastJSONResponse(await asyncio.to_thread(telemetry_store.get_analytics_summary, limit))
 
 
 @router.get("/analytics/history")
-async def get_history():
+async def get_history(
+    limit: Optional[int] = Query(default=None, ge=1),
+    hydrate: bool = Query(default=True, description="False returns prompt_hash / response_hash instead of text"),
+):
     """Get raw telemetry history."""
-    return supabase_service.get_all_telemetry()
+    return FastJSONResponse(await asyncio.to_thread(telemetry_store.get_all_telemetry, limit, hydrate))
+
+
+@router.get("/analytics/blobs/{digest}")
+async def get_blob(digest: str):
+    """Prompt or response text by the content hash an unhydrated history row carries."""
+    text = await asyncio.to_thread(telemetry_store.get_blob, digest)
+    if text is None:
+        raise HTTPException(status_code=404, detail=f"Unknown blob: {digest}")
+    return {"hash": digest, "text": text}
+
+
+@router.get("/analytics/group-by")
+async def group_by(
+    column: str = Query(default="model_id"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Requests, cost, tokens and mean latency per provider, model_id or use_case."""
+    try:
+        return await asyncio.to_thread(telemetry_store.group_by, column, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/analytics/percentiles")
+async def percentiles(
+    column: str = Query(default="latency_ms"),
+    p: List[float] = Query(default=[50, 95, 99]),
+    group_by: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Nearest-rank percentiles of a metric column, optionally per group."""
+    if any(not 0 < q <= 100 for q in p):
+        raise HTTPException(status_code=400, detail="Percentiles must be in (0, 100]")
+    try:
+        return await asyncio.to_thread(telemetry_store.percentiles, column, tuple(p), group_by, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/analytics/timeseries")
+async def timeseries(
+    bucket: int = Query(default=3600, ge=1, description="Bucket width in seconds"),
+    group_by: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Totals per time bucket, optionally split by provider, model_id or use_case."""
+    try:
+        return await asyncio.to_thread(telemetry_store.time_buckets, bucket, group_by, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/analytics/export")
+async def export_telemetry(
+    format: str = Query(default="ndjson", description="ndjson, csv, parquet or arrow"),
+    columns: Optional[str] = Query(default=None, description="Comma-separated subset of columns"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Stream telemetry in [since, until), oldest first, page by page."""
+    return export_response(
+        telemetry_store.iter_telemetry, TELEMETRY_EXPORT_COLUMNS, "telemetry", format, columns, since, until
+    )
@@ -1,48 +1,75 @@
-import json
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, BackgroundTasks, Response
 from typing import Optional, List
 from app.models.schemas import ChatRequest, ChatResponse
-from app.core.model_matrix import get_model_id, recommend_model, CAPABILITY_KEYS
+from app.core.model_matrix import (
+    get_generation_profile, get_model_id, get_models_by_tags, recommend_model,
+)
+from app.core.metrics import TELEMETRY_QUEUE_DEPTH, TELEMETRY_WRITES
+from app.core.timing import StageTimer, detached, span, start_timer
 from app.services.ai_service import ai_service
-from app.services.pricing_service import PricingService
-from app.services.supabase_service import supabase_service
-from app.api.endpoints.tagging import WORKLOAD_CLASSIFIER_PROMPT
+from app.services.budget_service import BudgetAccount, BudgetExceeded, Hold, budget_account
+from app.services.cascade_service import build_ladder, path_totals, run_cascade
+from app.services.telemetry_store import telemetry_store
+from app.services.token_service import estimate_cost, token_estimator
+from app.api.endpoints.tagging import classify_workload
 
 router = APIRouter()
 
 
 @router.post("/chat", response_model=ChatResponse)
-async def chat(request: ChatRequest, background_tasks: BackgroundTasks):
+async def chat(
+    request: ChatRequest, background_tasks: BackgroundTasks, response: Response,
+    account: BudgetAccount = Depends(budget_account),
+):
     """
     Unified chat endpoint (text-only).
-    Supports auto_select mode for intelligent model routing.
+    Supports auto_select mode for intelligent model routing; routing_mode="budget"
+    auto-selects the best model whose predicted cost fits the caller's remaining budget,
+    and routing_mode="cascade" answers with the cheapest capable model, escalating only
+    when its answer fails the acceptance check.
     """
-    if request.auto_select:
-        return await _process_chat_auto(prompt=request.prompt, background_tasks=background_tasks)
+    timer = start_timer()
+    overrides = {"max_tokens": request.max_tokens, "temperature": request.temperature, "stop": request.stop}
+    if request.auto_select or request.routing_mode in ("budget", "cascade"):
+        return await _process_chat_auto(
+            prompt=request.prompt, background_tasks=background_tasks,
+            timer=timer, response=response, account=account,
+            routing_mode=request.routing_mode, overrides=overrides,
+        )
     return await _process_chat(
         provider=request.provider,
         use_case=request.use_case,
         prompt=request.prompt,
         model_id=request.model_id,
         background_tasks=background_tasks,
+        timer=timer,
+        response=response,
+        account=account,
+        overrides=overrides,
     )
 
 
 @router.post("/chat/vision", response_model=ChatResponse)
 async def chat_vision(
     background_tasks: BackgroundTasks,
+    response: Response,
     provider: str = Form(...),
     use_case: str = Form(default="vision"),
     prompt: str = Form(...),
     model_id: Optional[str] = Form(default=None),
+    max_tokens: Optional[int] = Form(default=None),
+    temperature: Optional[float] = Form(default=None),
     image: UploadFile = File(...),
+    account: BudgetAccount = Depends(budget_account),
 ):
     """
     Vision chat endpoint — accepts an image via multipart/form-data.
     Image is read into memory, passed to the model, and discarded. Nothing stored.
     """
+    timer = start_timer()
     # Read image bytes into memory
-    image_bytes = await image.read()
+    with span("upload"):
+        image_bytes = await image.read()
     mime_type = image.content_type or "image/png"
 
     return await _process_chat(
@@ -53,6 +80,10 @@ async def chat_vision(
         image_bytes=image_bytes,
         mime_type=mime_type,
         background_tasks=background_tasks,
+        timer=timer,
+        response=response,
+        account=account,
+        overrides={"max_tokens": max_tokens, "temperature": temperature},
     )
 
 
@@ -61,29 +92,58 @@ async def _process_chat(
     use_case: str,
     prompt: str,
     background_tasks: BackgroundTasks,
+    timer: StageTimer,
+    response: Response,
+    account: BudgetAccount,
     model_id: Optional[str] = None,
     image_bytes: Optional[bytes] = None,
     mime_type: Optional[str] = None,
+    overrides: Optional[dict] = None,
 ) -> ChatResponse:
     """Shared logic for text and vision chat."""
     try:
         # Step 1: Resolve model
-        resolved_model = model_id or get_model_id(provider, use_case)
+        with span("route"):
+            resolved_model = model_id or _fit_to_context(
+                provider, get_model_id(provider, use_case), prompt, image_bytes is not None, use_case, overrides
+            )
 
-        # Step 2: Call the AI provider
-        result = await ai_service.generate(
-            provider, resolved_model, prompt,
-            image_bytes=image_bytes, mime_type=mime_type,
-        )
+        # Step 2: Reserve the predicted cost, then call the AI provider
+        hold = await _reserve(account, resolved_model, prompt, image_bytes is not None, use_case, overrides)
+        async with hold:
+            result = await ai_service.generate(
+                provider, resolved_model, prompt,
+                image_bytes=image_bytes, mime_type=mime_type,
+                task=use_case, overrides=overrides,
+            )
+            await hold.asettle(_spend(resolved_model, result))
+        await _attach_budget(account, response)
 
-        # Step 3: Calculate cost
-        cost = PricingService.calculate_cost(
-            resolved_model, result["input_tokens"], result["output_tokens"]
-        )
+        # Step 3: Cost (priced by the AI service)
+        cost = result["cost"]
+
+        # Step 4: Build response
+        with span("serialize"):
+            chat_response = ChatResponse(
+                response=result["text"],
+                provider=provider,
+                model_id=resolved_model,
+                use_case=use_case,
+                metrics={
+                    "input_tokens": result["input_tokens"],
+                    "cached_input_tokens": result["cached_input_tokens"],
+                    "output_tokens": result["output_tokens"],
+                    "cost": cost,
+                    "predicted_cost": result["predicted_cost"],
+                    "tokens_estimated": result["tokens_estimated"],
+                    "latency_ms": result["latency_ms"],
+                },
+            )
+        timings = _attach_timings(timer, response, chat_response)
 
-        # Step 4: Log to Supabase (prompt only, NOT the image) in background
-        background_tasks.add_task(
-            supabase_service.log_telemetry,
+        # Step 5: Log telemetry (prompt only, NOT the image) in background
+        _enqueue_telemetry(
+            background_tasks,
             {
                 "provider": provider,
                 "model_id": resolved_model,
@@ -92,100 +152,212 @@ async def _process_chat(
                 "response": result["text"],
                 "input_tokens": result["input_tokens"],
                 "output_tokens": result["output_tokens"],
+                "cached_input_tokens": result["cached_input_tokens"],
                 "cost": cost,
                 "latency_ms": result["latency_ms"],
+                "timings": timings,
             }
         )
+        return chat_response
 
-        # Step 5: Return response
-        return ChatResponse(
-            response=result["text"],
-            provider=provider,
-            model_id=resolved_model,
-            use_case=use_case,
-            metrics={
-                "input_tokens": result["input_tokens"],
-                "output_tokens": result["output_tokens"],
-                "cost": cost,
-                "latency_ms": result["latency_ms"],
-            },
-        )
-
+    except BudgetExceeded as e:
+        raise e.to_http()
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Model invocation failed: {str(e)}")
 
 
+def _fit_to_context(provider: str, model_id: str, prompt: str, has_image: bool,
+                    task: str = None, overrides: dict = None) -> str:
+    """Reroute a matrix-selected model to a same-provider model whose context window fits the prompt.
+
+    Explicitly requested models are never rerouted; AIService rejects them if they don't fit.
+    """
+    preflight = token_estimator.preflight(model_id, prompt, has_image, task=task, overrides=overrides)
+    if preflight.fits:
+        return model_id
+    needed = preflight.input_tokens + preflight.max_output_tokens
+    candidates = [
+        m for m in get_models_by_tags(["vision"] if has_image else [], min_context=needed)
+        if m["provider"] == provider
+    ]
+    if not candidates:
+        return model_id
+    candidates.sort(key=lambda m: (-m["quality_score"], m["cost_per_1k"]))
+    return candidates[0]["model_id"]
+
+
+async def _reserve(account: BudgetAccount, model_id: str, prompt: str, has_image: bool,
+                   task: str = None, overrides: dict = None) -> Hold:
+    """Hold the worst-case cost of a call against the caller's budgets (in the shared ledger)."""
+    if not account.limited:
+        return await account.areserve(0.0)
+    with span("budget"):
+        preflight = token_estimator.preflight(model_id, prompt, has_image, task=task, overrides=overrides)
+        return await account.areserve(preflight.predicted_cost)
+
+
+def _spend(model_id: str, result: dict) -> float:
+    """Amount charged to budgets; unpriced models are charged at their registry rate."""
+    return result["cost"] or estimate_cost(model_id, result["input_tokens"], result["output_tokens"])
+
+
+async def _recommend_within_budget(tags: List[str], prompt: str, min_context: int, account: BudgetAccount,
+                             overrides: dict = None) -> dict:
+    """Highest-quality capable model whose predicted cost fits the remaining budget.
+
+    As the budget runs down, expensive candidates stop fitting and selection
+    degrades to cheaper models until even the cheapest no longer fits.
+    """
+    candidates = get_models_by_tags(tags, min_context=min_context)
+    if not candidates:
+        return None
+    candidates.sort(key=lambda m: (-m["quality_score"], m["latency"], m["cost_per_1k"]))
+    remaining = await account.aremaining()
+    for model in candidates:
+        preflight = token_estimator.preflight(model["model_id"], prompt, task=tags[0], overrides=overrides)
+        if remaining is None or preflight.predicted_cost <= remaining:
+            return model
+    raise BudgetExceeded(
+        f"No model for tags {tags} fits the remaining budget of ${remaining:.6f}", status_code=402
+    )
+
+
+async def _attach_budget(account: BudgetAccount, response: Response):
+    if account.limited:
+        response.headers["X-Budget-Remaining"] = f"{await account.aremaining():.6f}"
+
+
+def _attach_timings(timer: StageTimer, response: Response, chat_response: ChatResponse) -> dict:
+    """Expose the stage breakdown in response metrics and the Server-Timing header."""
+    timings = timer.as_dict()
+    chat_response.metrics["timings"] = timings
+    response.headers["Server-Timing"] = timer.server_timing(timings)
+    return timings
+
+
+def _enqueue_telemetry(background_tasks: BackgroundTasks, data: dict):
+    """Queue a telemetry write to run after the response is sent."""
+    TELEMETRY_QUEUE_DEPTH.inc()
+    background_tasks.add_task(_write_telemetry, data)
+
+
+def _write_telemetry(data: dict):
+    try:
+        telemetry_store.log_telemetry(data)
+        TELEMETRY_WRITES.labels("ok").inc()
+    except Exception as e:
+        TELEMETRY_WRITES.labels("error").inc()
+        print(f"Telemetry logging error: {e}")
+    finally:
+        TELEMETRY_QUEUE_DEPTH.dec()
+
+
 async def _classify_prompt(prompt: str) -> List[str]:
     """Classify prompt into workload tags using a fast model."""
     try:
-        result = await ai_service.generate(
-            provider="Google",
-            model_id="gemini-2.5-flash",
-            prompt=f"{WORKLOAD_CLASSIFIER_PROMPT}\n\nUser Prompt:\n{prompt}",
-        )
-        text = result["text"].strip()
-        if text.startswith("```"):
-            text = text.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-        parsed = json.loads(text)
-        tags = [t for t in parsed.get("tags", []) if t in CAPABILITY_KEYS]
-        return tags if tags else ["reasoning"]
+        return await classify_workload(prompt)
     except Exception:
         return ["reasoning"]
 
 
-async def _process_chat_auto(prompt: str, background_tasks: BackgroundTasks) -> ChatResponse:
+async def _process_chat_auto(
+    prompt: str, background_tasks: BackgroundTasks, timer: StageTimer, response: Response,
+    account: BudgetAccount, routing_mode: Optional[str] = None, overrides: Optional[dict] = None,
+) -> ChatResponse:
     """Auto-select the best model based on workload tags, then execute."""
     try:
-        # Step 1: Classify the prompt
-        tags = await _classify_prompt(prompt)
+        # Step 1: Classify the prompt (its own provider stages roll up into "classify")
+        with span("classify"), detached():
+            tags = await _classify_prompt(prompt)
 
-        # Step 2: Recommend model
-        best = recommend_model(tags)
+        # Step 2: Recommend model, skipping any whose context window the prompt cannot fit
+        with span("route"):
+            min_context = (
+                token_estimator.estimate_prompt("generic", prompt)[1]
+                + get_generation_profile("*", tags[0], overrides)["max_tokens"]
+            )
+            ladder = None
+            if routing_mode == "budget":
+                best = await _recommend_within_budget(tags, prompt, min_context, account, overrides)
+            elif routing_mode == "cascade":
+                ladder = build_ladder(tags, min_context=min_context)
+                best = ladder[-1] if ladder else None
+            else:
+                best = recommend_model(tags, min_context=min_context)
         if not best:
-            raise ValueError(f"No model found for tags: {tags}")
+            raise ValueError(f"No model found for tags {tags} with a context window of ~{min_context} tokens")
 
+        # Step 3: Execute (each cascade rung and verifier call reserves and settles its own cost)
+        async def call(model: dict) -> dict:
+            hold = await _reserve(account, model["model_id"], prompt, False, tags[0], overrides)
+            async with hold:
+                result = await ai_service.generate(
+                    model["provider"], model["model_id"], prompt, task=tags[0], overrides=overrides,
+                )
+                await hold.asettle(_spend(model["model_id"], result))
+            return result
+
+        cascade_path = None
+        if ladder:
+            best, result, cascade_path = await run_cascade(
+                prompt, tags, ladder, call, overrides,
+                reserve=lambda model_id, check_prompt: _reserve(account, model_id, check_prompt, False, "cascade_check"),
+            )
+        else:
+            result = await call(best)
+        await _attach_budget(account, response)
         provider = best["provider"]
         model_id = best["model_id"]
 
-        # Step 3: Execute
-        result = await ai_service.generate(provider, model_id, prompt)
+        # Step 4: Cost (priced by the AI service); a cascade reports what the whole path spent
+        usage = path_totals(cascade_path) if cascade_path else result
+        cost = usage["cost"]
 
-        # Step 4: Cost
-        cost = PricingService.calculate_cost(
-            model_id, result["input_tokens"], result["output_tokens"]
-        )
+        # Step 5: Build response
+        with span("serialize"):
+            chat_response = ChatResponse(
+                response=result["text"],
+                provider=provider,
+                model_id=model_id,
+                use_case=",".join(tags),
+                metrics={
+                    "input_tokens": usage["input_tokens"],
+                    "cached_input_tokens": result["cached_input_tokens"],
+                    "output_tokens": usage["output_tokens"],
+                    "cost": cost,
+                    "predicted_cost": result["predicted_cost"],
+                    "tokens_estimated": result["tokens_estimated"],
+                    "latency_ms": usage["latency_ms"],
+                },
+                workload_tags=tags,
+            )
+            if cascade_path:
+                chat_response.metrics["cascade_path"] = cascade_path
+        timings = _attach_timings(timer, response, chat_response)
 
-        # Step 5: Telemetry in background
-        background_tasks.add_task(
-            supabase_service.log_telemetry,
+        # Step 6: Telemetry in background
+        _enqueue_telemetry(
+            background_tasks,
             {
                 "provider": provider,
                 "model_id": model_id,
                 "use_case": ",".join(tags),
                 "prompt": prompt,
                 "response": result["text"],
-                "input_tokens": result["input_tokens"],
-                "output_tokens": result["output_tokens"],
+                "input_tokens": usage["input_tokens"],
+                "output_tokens": usage["output_tokens"],
+                "cached_input_tokens": result["cached_input_tokens"],
                 "cost": cost,
-                "latency_ms": result["latency_ms"],
+                "latency_ms": usage["latency_ms"],
+                "timings": timings,
+                **({"cascade_path": cascade_path} if cascade_path else {}),
             }
         )
-
-        return ChatResponse(
-            response=result["text"],
-            provider=provider,
-            model_id=model_id,
-            use_case=",".join(tags),
-            metrics={
-                "input_tokens": result["input_tokens"],
-                "output_tokens": result["output_tokens"],
-                "cost": cost,
-                "latency_ms": result["latency_ms"],
-            },
-            workload_tags=tags,
-        )
+        return chat_response
+    except BudgetExceeded as e:
+        raise e.to_http()
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
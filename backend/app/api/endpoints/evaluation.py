@@ -1,96 +1,331 @@
 """
 Evaluation API — run evaluations, generate manual forms, get AI scores.
 """
-from fastapi import APIRouter, HTTPException
+import asyncio
+import uuid
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from app.core.config import settings
+from app.core.responses import FastJSONResponse
 from app.models.schemas import (
-    EvalRequest, EvalResponse, EvalResponseItem,
+    EvalRequest, EvalResponse,
     AIScoreRequest, AIScoreResponse, AIScoreItem,
     ManualScoreFormResponse, ManualScoreFormItem,
     SaveScoresRequest,
 )
-from app.services.evaluation_service import evaluation_service
-from app.services.supabase_service import supabase_service
-import statistics
+from app.services.adaptive_eval import OBJECTIVES, run_adaptive
+from app.services.budget_service import BudgetAccount, BudgetExceeded, budget_account
+from app.services.checkpoint_service import checkpoint_service
+from app.services.eval_summary import summarize, summarize_cascade
+from app.services.evaluation_service import evaluation_service, parse_judges
+from app.services.export_service import export_response
+from app.services.leaderboard_service import leaderboard_service
+from app.services.persistence_service import persistence_service
+from app.services.telemetry_store import EVALUATION_EXPORT_COLUMNS, telemetry_store
+from app.services.token_service import estimate_cost, token_estimator
 
 router = APIRouter()
 
 
 @router.post("/eval/run", response_model=EvalResponse)
-async def run_eval(request: EvalRequest):
+async def run_eval(request: EvalRequest, account: BudgetAccount = Depends(budget_account)):
     """Run multiple prompts against multiple models."""
-    try:
-        model_configs = [m.model_dump() for m in request.models]
-        judge_cfg = None
-        if request.scoring_type == "AI" and request.judge_model:
-            judge_cfg = {
-                "judge_model": request.judge_model,
-                "judge_provider": request.judge_provider
-            }
-
-        eval_data = await evaluation_service.run_evaluation(
-            prompts=request.prompts,
-            models=model_configs,
-            criteria=request.criteria,
-            judge_cfg=judge_cfg
+    # A caller-chosen batch_id lets a request that timed out be resumed with /eval/resume/{batch_id}
+    batch_id = request.batch_id or str(uuid.uuid4())
+    if request.batch_id and await asyncio.to_thread(telemetry_store.get_evaluation_run, batch_id):
+        raise HTTPException(status_code=409, detail=f"Batch {batch_id} exists; use /eval/resume/{batch_id}")
+    judge_cfg = None
+    if request.scoring_type == "AI" and request.judge_model:
+        judge_cfg = {
+            "judge_model": request.judge_model,
+            "judge_provider": request.judge_provider
+        }
+    if request.judge_cascade:
+        if judge_cfg is None:
+            raise HTTPException(status_code=400, detail="judge_cascade needs AI scoring (a judge model to escalate to)")
+        cheap = (
+            [m.model_dump() for m in request.cheap_judges] if request.cheap_judges
+            else parse_judges(settings.JUDGE_CASCADE_JUDGES)
         )
-        
-        results_raw = eval_data["results"]
-        prompt_metadata = eval_data["prompt_metadata"]
-        
-        # Convert to EvalResponseItem
-        results = [EvalResponseItem(**r) for r in results_raw]
-        
-        # Calculate summary metrics per model
-        model_stats = {}
-        for r in results:
-            m_key = f"{r.provider}:{r.model_id}"
-            if m_key not in model_stats:
-                model_stats[m_key] = {"latencies": [], "costs": [], "tokens": []}
-            model_stats[m_key]["latencies"].append(r.metrics["latency_ms"])
-            model_stats[m_key]["costs"].append(r.metrics["cost"])
-            model_stats[m_key]["tokens"].append(r.metrics["output_tokens"])
-            
-        summary = {}
-        for m_key, stats in model_stats.items():
-            summary[m_key] = {
-                "avg_latency": round(statistics.mean(stats["latencies"]), 0),
-                "avg_cost": round(statistics.mean(stats["costs"]), 6),
-                "avg_tokens": round(statistics.mean(stats["tokens"]), 0)
-            }
-            
-        # Prepare for Supabase logging
-        import uuid
-        batch_id = str(uuid.uuid4())
-        log_entries = []
-        for r in results_raw:
-            log_entries.append({
-                "batch_id": batch_id,
-                "prompt": r["prompt"],
-                "provider": r["provider"],
-                "model_id": r["model_id"],
-                "response": r["response"],
-                "input_tokens": r["metrics"]["input_tokens"],
-                "output_tokens": r["metrics"]["output_tokens"],
-                "cost": r["metrics"]["cost"],
-                "latency_ms": r["metrics"]["latency_ms"],
-                "scores": r["scores"],
-                "ai_evaluations": r["ai_evaluations"],
-                "prompt_quality": r["prompt_quality"],
-                "criteria": request.criteria
-            })
-        
-        # Log to Supabase
-        supabase_service.log_evaluation(log_entries)
-            
-        return EvalResponse(results=results, summary_metrics=summary, prompt_metadata=prompt_metadata)
+        if not cheap:
+            raise HTTPException(status_code=400, detail="judge_cascade needs at least one cheap judge")
+        # Kept in the run spec so a resumed batch scores its remaining cells the same way
+        judge_cfg["cascade"] = cheap
+    adaptive = None
+    if request.mode == "adaptive":
+        if request.objective not in OBJECTIVES:
+            raise HTTPException(status_code=400, detail=f"objective must be one of {', '.join(OBJECTIVES)}")
+        if request.objective == "quality" and judge_cfg is None:
+            raise HTTPException(status_code=400, detail="The quality objective needs AI scoring (a judge model)")
+        adaptive = {"objective": request.objective, "confidence": request.confidence}
+    elif request.mode not in (None, "full"):
+        raise HTTPException(status_code=400, detail=f"Unknown mode: {request.mode}")
+    run = {
+        "prompts": request.prompts,
+        "models": [m.model_dump() for m in request.models],
+        "criteria": request.criteria,
+        "judge_cfg": judge_cfg,
+        "adaptive": adaptive,
+    }
+    try:
+        # Saved before any call is made, so every checkpointed cell can be resumed
+        await asyncio.to_thread(telemetry_store.save_evaluation_run, batch_id, run)
+        return await _execute_batch(batch_id, run, list(range(len(request.prompts) * len(request.models))), {}, account)
+    except BudgetExceeded as e:
+        raise e.to_http()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/eval/resume/{batch_id}", response_model=EvalResponse)
+async def resume_eval(
+    batch_id: str,
+    retry_failed_only: bool = Query(default=False, description="Recompute failed cells only, not missing ones"),
+    account: BudgetAccount = Depends(budget_account),
+):
+    """Finish a checkpointed batch: recompute only its missing and failed cells, reusing the rest.
+    An adaptive batch replays its race over the checkpoints, so it resumes where it stopped."""
+    run = await asyncio.to_thread(telemetry_store.get_evaluation_run, batch_id)
+    if run is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id}")
+    checkpoints = await asyncio.to_thread(telemetry_store.get_checkpoints, batch_id)
+    cells, reuse = checkpoint_service.plan(run, checkpoints, retry_failed_only)
+    # No await between this check and _execute_batch opening the checkpoint
+    if checkpoint_service.is_active(batch_id):
+        raise HTTPException(status_code=409, detail=f"Batch {batch_id} is still running")
+    try:
+        return await _execute_batch(batch_id, run, cells, reuse, account)
+    except BudgetExceeded as e:
+        raise e.to_http()
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def cell_spend(result: dict) -> float:
+    """What one evaluation cell cost: generation (unpriced models at their registry rate) plus judging."""
+    metrics = result.get("metrics") or {}
+    cost = metrics.get("cost") or estimate_cost(
+        result["model_id"], metrics.get("input_tokens") or 0, metrics.get("output_tokens") or 0,
+    )
+    return cost + (metrics.get("judge_cost") or 0.0)
+
+
+def predict_batch_cost(run: dict, cells: list) -> float:
+    """Worst-case cost of `cells`: generation, every judge call (a cascade may call all of its
+    judges) and prompt analyses not made yet."""
+    prompts, models, judge_cfg = run["prompts"], run["models"], run["judge_cfg"]
+    judges = []
+    if judge_cfg:
+        judges = [j["model_id"] for j in judge_cfg.get("cascade") or []] + [judge_cfg["judge_model"]]
+    total = 0.0
+    for i in cells:
+        prompt = prompts[i // len(models)]
+        generation = token_estimator.preflight(models[i % len(models)]["model_id"], prompt)
+        total += generation.predicted_cost
+        for judge in judges:
+            # The judge reads the prompt and a response of up to the generation's output budget
+            judged = token_estimator.preflight(judge, prompt, task="judge")
+            total += judged.predicted_cost + estimate_cost(judge, generation.max_output_tokens, 0)
+    if judge_cfg and run.get("prompt_metadata") is None:
+        total += sum(
+            token_estimator.preflight(judge_cfg["judge_model"], p, task="prompt_analysis").predicted_cost
+            for p in {prompts[i // len(models)] for i in cells}
+        )
+    return total
+
+
+async def _execute_batch(batch_id: str, run: dict, cells: list, reuse: dict, account: BudgetAccount):
+    """Compute `cells` of a batch with per-cell checkpoints (or let the adaptive race pick them),
+    merge them with the reused checkpoints, then summarise and persist whatever has not been
+    persisted yet."""
+    prompts, models, criteria, judge_cfg = run["prompts"], run["models"], run["criteria"], run["judge_cfg"]
+    adaptive = run.get("adaptive")
+    by_cell = {i: c["result"] for i, c in reuse.items()}
+    computed, planned = [], set(range(len(prompts) * len(models))) if not adaptive else set()
+    report = None
+    spent = [0.0]   # Actual spend so far: generation, judging and prompt analysis
+
+    def on_spend(cost: float):
+        spent[0] += cost
+
+    def on_cell(cell: int, result: dict):
+        on_spend(cell_spend(result))
+        checkpoint.record(cell, result)
+
+    async def compute(batch: list) -> list:
+        planned.update(batch)
+        todo = [i for i in batch if i not in by_cell]
+        if todo:
+            eval_data = await evaluation_service.run_evaluation(
+                prompts=prompts,
+                models=models,
+                criteria=criteria,
+                judge_cfg=judge_cfg,
+                cells=todo,
+                on_cell=on_cell,
+                prompt_metadata=run["prompt_metadata"],
+                on_spend=on_spend,
+            )
+            by_cell.update(zip(todo, eval_data["results"]))
+            computed.extend(todo)
+        return [by_cell[i] for i in batch]
+
+    # Hold the predicted cost of everything still to run (an adaptive run holds the full matrix)
+    # against the daily and monthly budgets; a batch is many calls, so per_request does not apply
+    to_hold = [i for i in range(len(prompts) * len(models)) if i not in by_cell] if adaptive else cells
+    predicted = predict_batch_cost(run, to_hold) if account.limited else 0.0
+    hold = await account.areserve(predicted, per_request=False)
+    checkpoint = checkpoint_service.open(batch_id)
+    try:
+        if run.get("prompt_metadata") is None:
+            run["prompt_metadata"] = await evaluation_service.analyze_prompts(prompts, judge_cfg, on_spend=on_spend)
+            await asyncio.to_thread(telemetry_store.save_evaluation_run, batch_id, run)
+        if adaptive:
+            report = await run_adaptive(
+                len(prompts), models, compute, adaptive["objective"], adaptive["confidence"], judge_cfg is not None,
+            )
+        else:
+            await compute(cells)
+        if report is not None:
+            # Cells the race never asked for are skipped, not missing
+            run["adaptive_cells"] = report["calls"]["cells_run"]
+            await asyncio.to_thread(telemetry_store.save_evaluation_run, batch_id, run)
+    finally:
+        # Charged even when the batch fails partway: finished cells were paid for
+        await hold.asettle(spent[0])
+        await checkpoint.close()
+
+    results_raw = [by_cell[i] for i in sorted(by_cell) if i in planned]
+    prompt_metadata = run["prompt_metadata"]
+
+    # Per-model latency percentiles, throughput, error rate, cost per quality point, judge overhead
+    summary = summarize(results_raw)
+    cascade = summarize_cascade(results_raw)
+
+    # Prepare for logging: cells computed now, plus reused ones whose rows were never written
+    unpersisted = [i for i in sorted(by_cell) if i not in reuse or not reuse[i]["persisted"]]
+    log_entries = []
+    for i in unpersisted:
+        r = by_cell[i]
+        log_entries.append({
+            "batch_id": batch_id,
+            "prompt": r["prompt"],
+            "provider": r["provider"],
+            "model_id": r["model_id"],
+            "response": r["response"],
+            "input_tokens": r["metrics"]["input_tokens"],
+            "output_tokens": r["metrics"]["output_tokens"],
+            "cost": r["metrics"]["cost"],
+            "latency_ms": r["metrics"]["latency_ms"],
+            "scores": r["scores"],
+            "ai_evaluations": r["ai_evaluations"],
+            "prompt_quality": r["prompt_quality"],
+            "criteria": criteria
+        })
+
+    def after():
+        # Rows are only marked once every chunk landed; a partial write is re-sent by the next resume
+        if (persistence_service.status(batch_id) or {}).get("state") == "done":
+            telemetry_store.mark_checkpoints_persisted(batch_id, unpersisted)
+        leaderboard_service.refresh()
+
+    # Persist in the background (chunked, concurrent inserts), then fold the batch into the leaderboard.
+    # A resume that recomputed nothing has nothing new to write.
+    if not log_entries:
+        persistence = await asyncio.to_thread(persistence_service.status, batch_id)
+    else:
+        persistence = persistence_service.submit(batch_id, log_entries, {
+            "batch_id": batch_id,
+            "prompts": len(prompts),
+            "models": [f"{m['provider']}:{m['model_id']}" for m in models],
+            "criteria": criteria,
+            "judge": f"{judge_cfg['judge_provider']}:{judge_cfg['judge_model']}" if judge_cfg else None,
+            "summary_metrics": summary,
+            "resumed_cells": len(computed) if reuse else 0,
+            "adaptive": report,
+            "judge_cascade": cascade,
+        }, after=after)
+
+    # The cells are already in EvalResponse shape: render them directly instead of
+    # rebuilding (and re-validating) them as Pydantic models
+    return FastJSONResponse({
+        "batch_id": batch_id,
+        "results": results_raw,
+        "summary_metrics": summary,
+        "prompt_metadata": prompt_metadata,
+        "persistence": persistence,
+        "resume": {"reused": len(reuse), "recomputed": len(computed), "missing": len(planned - by_cell.keys())},
+        "adaptive": report,
+        "judge_cascade": cascade,
+    })
+
+
 @router.get("/evaluation/history")
-async def get_evaluation_history():
+async def get_evaluation_history(
+    limit: int = Query(default=100, ge=1),
+    hydrate: bool = Query(default=True, description="False returns prompt_hash / response_hash instead of text"),
+):
     """Fetch recent evaluation runs."""
-    return supabase_service.get_evaluations()
+    return FastJSONResponse(await asyncio.to_thread(telemetry_store.get_evaluations, limit, hydrate))
+
+
+@router.get("/evaluation/batch/{batch_id}")
+async def get_evaluation_batch(batch_id: str):
+    """Batch record of one /eval/run, including its summary metrics."""
+    batch = await asyncio.to_thread(telemetry_store.get_evaluation_batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id}")
+    return batch
+
+
+@router.get("/evaluation/batch/{batch_id}/checkpoints")
+async def get_evaluation_batch_checkpoints(batch_id: str):
+    """Checkpointed cells of a batch: ok, failed, missing and persisted counts."""
+    progress = await asyncio.to_thread(checkpoint_service.progress, batch_id)
+    if progress is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id}")
+    return progress
+
+
+@router.get("/evaluation/batch/{batch_id}/status")
+async def get_evaluation_batch_status(batch_id: str):
+    """Background persistence progress of a batch: pending, running, done, partial or failed."""
+    status = await asyncio.to_thread(persistence_service.status, batch_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Unknown batch: {batch_id}")
+    return status
+
+
+@router.get("/evaluation/leaderboard")
+async def leaderboard(
+    criterion: Optional[str] = Query(default=None, description="Rank by this criterion's mean score"),
+    provider: Optional[str] = None,
+):
+    """Per-model scores, latency and cost over the whole evaluation history (precomputed snapshot)."""
+    snapshot = leaderboard_service.snapshot
+    models = snapshot["models"]
+    if provider:
+        models = [m for m in models if m["provider"] == provider]
+    if criterion:
+        models = sorted(
+            (m for m in models if criterion in m["criteria"]),
+            key=lambda m: -m["criteria"][criterion]["mean"],
+        )
+    return {**snapshot, "models": models}
+
+
+@router.get("/evaluation/export")
+async def export_evaluations(
+    format: str = Query(default="ndjson", description="ndjson, csv, parquet or arrow"),
+    columns: Optional[str] = Query(default=None, description="Comma-separated subset of columns"),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+):
+    """Stream evaluation results in [since, until), oldest first, page by page."""
+    return export_response(
+        telemetry_store.iter_evaluations, EVALUATION_EXPORT_COLUMNS, "evaluations", format, columns, since, until
+    )
 
 
 @router.post("/eval/manual-form", response_model=ManualScoreFormResponse)
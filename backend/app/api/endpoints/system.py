@@ -0,0 +1,27 @@
+"""
+System API — runtime introspection of the gateway process.
+"""
+from fastapi import APIRouter
+from app.services.connection_manager import connection_manager
+from app.services.region_service import region_router
+from app.services.replay_service import replay_service
+
+router = APIRouter()
+
+
+@router.get("/system/connections")
+async def get_connection_stats():
+    """Connection-pool utilization and wait-time metrics for every gateway pool."""
+    return connection_manager.stats()
+
+
+@router.get("/system/regions")
+async def get_region_health():
+    """Probe latency and availability per regional endpoint, and models cooling down after failures."""
+    return region_router.stats()
+
+
+@router.get("/system/replay")
+async def get_replay_stats():
+    """Gateway mode and cassette contents for record/replay runs."""
+    return replay_service.stats()
@@ -1,15 +1,17 @@
 """
 Tagging & Model Selection API — workload classification + model recommendation.
 """
-import json
 from fastapi import APIRouter, HTTPException
 from app.models.schemas import (
     ClassifyPromptRequest, ClassifyPromptResponse,
     RecommendModelRequest, RecommendModelResponse,
-    ModelRegistryEntry,
+    ModelRegistryEntry, TokenEstimateRequest, TokenEstimateResponse,
 )
+from app.core.cache import cache, cache_key
+from app.core.json_extract import JSONExtractError, structured_result
 from app.core.model_matrix import MODEL_REGISTRY, get_models_by_tags, recommend_model, CAPABILITY_KEYS
 from app.services.ai_service import ai_service
+from app.services.token_service import token_estimator
 
 router = APIRouter()
 
@@ -54,6 +56,40 @@ Return output in JSON format ONLY, no extra text:
 {"tags": ["tag1", "tag2"]}
 """
 
+WORKLOAD_CLASSIFIER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tags": {"type": "array", "items": {"type": "string", "enum": list(CAPABILITY_KEYS)}},
+    },
+    "required": ["tags"],
+    "additionalProperties": False,
+}
+
+
+async def classify_workload(prompt_text: str) -> list[str]:
+    """Workload tags for a prompt, from the shared cache when it has been classified before.
+
+    Raises JSONExtractError if the classifier's answer cannot be parsed.
+    """
+    key = cache_key("gemini-2.5-flash", WORKLOAD_CLASSIFIER_PROMPT, prompt_text)
+    tags = await cache.aget("classify", key)
+    if tags is not None:
+        return tags
+    # Use a fast, cheap model for classification
+    result = await ai_service.generate(
+        provider="Google",
+        model_id="gemini-2.5-flash",
+        prompt=f"User Prompt:\n{prompt_text}",
+        system_prompt=WORKLOAD_CLASSIFIER_PROMPT,
+        task="classify",
+        response_schema=WORKLOAD_CLASSIFIER_SCHEMA,
+    )
+    parsed = structured_result(result, "classify", "gemini-2.5-flash")
+    # Validate tags against known capabilities
+    tags = [t for t in parsed.get("tags", []) if t in CAPABILITY_KEYS] or ["reasoning"]
+    await cache.aset("classify", key, tags)
+    return tags
+
 
 @router.get("/models/registry", response_model=list[ModelRegistryEntry])
 async def list_models():
@@ -65,35 +101,23 @@ async def list_models():
 async def classify_prompt(request: ClassifyPromptRequest):
     """Classify a prompt into workload tags using a fast LLM."""
     try:
-        # Use a fast, cheap model for classification
-        result = await ai_service.generate(
-            provider="Google",
-            model_id="gemini-2.5-flash",
-            prompt=f"{WORKLOAD_CLASSIFIER_PROMPT}\n\nUser Prompt:\n{request.prompt_text}",
-        )
-        
-        # Parse JSON from the model response
-        response_text = result["text"].strip()
-        # Handle markdown code blocks
-        if response_text.startswith("```"):
-            response_text = response_text.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-        
-        parsed = json.loads(response_text)
-        tags = parsed.get("tags", [])
-        
-        # Validate tags against known capabilities
-        valid_tags = [t for t in tags if t in CAPABILITY_KEYS]
-        if not valid_tags:
-            valid_tags = ["reasoning"]  # Fallback
-        
-        return ClassifyPromptResponse(tags=valid_tags)
-    except json.JSONDecodeError:
+        return ClassifyPromptResponse(tags=await classify_workload(request.prompt_text))
+    except JSONExtractError:
         # If the model doesn't return valid JSON, default to reasoning
         return ClassifyPromptResponse(tags=["reasoning"])
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Classification failed: {str(e)}")
 
 
+@router.post("/tokens/estimate", response_model=TokenEstimateResponse)
+async def estimate_tokens(request: TokenEstimateRequest):
+    """Local token estimate, context-window check and worst-case cost, without calling the model."""
+    preflight = token_estimator.preflight(
+        request.model_id, request.prompt, request.has_image, request.max_output_tokens, task=request.task
+    )
+    return TokenEstimateResponse(**preflight.as_dict())
+
+
 @router.post("/tag/recommend-model", response_model=RecommendModelResponse)
 async def recommend(request: RecommendModelRequest):
     """Recommend the best model for the given workload tags."""
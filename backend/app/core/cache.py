@@ -0,0 +1,329 @@
+"""
+Cache — two-tier key/value cache shared by the services.
+
+Every lookup goes to a small in-process LRU first and then to a shared tier
+that all uvicorn workers on the host see and that survives restarts:
+
+    CACHE_BACKEND=sqlite   SQLite file in WAL mode at CACHE_PATH (default, no external service)
+    CACHE_BACKEND=redis    Any Redis-protocol server at CACHE_REDIS_URL (needs the `redis` package)
+    CACHE_BACKEND=memory   In-process LRU only
+
+Entries live in a namespace ("classify", "judge", "oauth", ...) and carry a
+TTL. Values must be JSON-serializable. The LRU is bounded by entry count and
+the SQLite tier by CACHE_SHARED_MAX_MB (least recently used rows are evicted);
+Redis size is bounded by the server's own maxmemory policy. Hits per tier and
+misses are counted per namespace.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Optional, Tuple
+from app.core.config import settings
+from app.core.metrics import CACHE_REQUESTS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value BLOB NOT NULL,
+    expires_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+)
+"""
+_MISSING = object()
+
+
+def cache_key(*parts) -> str:
+    """Stable short key for arbitrary JSON-serializable parts (prompts, model ids, ...)."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()[:32]
+
+
+class MemoryTier:
+    """Thread-safe LRU of (namespace, key) → (value, expires_at)."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return _MISSING
+            if entry[1] <= time.time():
+                del self._entries[(namespace, key)]
+                return _MISSING
+            self._entries.move_to_end((namespace, key))
+            return entry[0]
+
+    def set(self, namespace: str, key: str, value: Any, expires_at: float):
+        with self._lock:
+            self._entries[(namespace, key)] = (value, expires_at)
+            self._entries.move_to_end((namespace, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            self._entries.pop((namespace, key), None)
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            if namespace is None:
+                self._entries.clear()
+            else:
+                for k in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[k]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteTier:
+    """Shared tier in a WAL-mode SQLite file; safe across processes on one host."""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._conn = None
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=5.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(_SCHEMA)
+            conn.commit()
+            # Holds OAuth tokens among other things: owner-only
+            os.chmod(self.path, 0o600)
+            self._conn = conn
+        return self._conn
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+                (namespace, key, now),
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+            db.commit()
+        return json.loads(row[0]), row[1]
+
+    def set(self, namespace: str, key: str, value: Any, expires_at: float):
+        payload = json.dumps(value, separators=(",", ":")).encode()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                (namespace, key, payload, expires_at, time.time()),
+            )
+            db.commit()
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict(db)
+
+    def _evict(self, db: sqlite3.Connection):
+        """Drop expired rows, then least recently used ones until under max_bytes."""
+        db.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        (size,) = db.execute("SELECT COALESCE(SUM(LENGTH(value) + LENGTH(key)), 0) FROM entries").fetchone()
+        if size > self.max_bytes:
+            excess = size - int(self.max_bytes * 0.9)
+            db.execute(
+                """DELETE FROM entries WHERE rowid IN (
+                       SELECT rowid FROM (
+                           SELECT rowid, LENGTH(value) + LENGTH(key) AS size,
+                                  SUM(LENGTH(value) + LENGTH(key)) OVER (ORDER BY accessed_at, rowid) AS running
+                           FROM entries
+                       ) WHERE running - size < ?
+                   )""",
+                (excess,),
+            )
+        db.commit()
+
+    def delete(self, namespace: str, key: str):
+        with self._lock:
+            db = self._db()
+            db.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            db.commit()
+
+    def clear(self, namespace: str = None):
+        with self._lock:
+            db = self._db()
+            if namespace is None:
+                db.execute("DELETE FROM entries")
+            else:
+                db.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT namespace, COUNT(*), SUM(LENGTH(value)) FROM entries WHERE expires_at > ? GROUP BY namespace",
+                (time.time(),),
+            ).fetchall()
+        return {
+            "backend": self.name, "path": self.path, "max_bytes": self.max_bytes,
+            "namespaces": {ns: {"entries": n, "bytes": size} for ns, n, size in rows},
+        }
+
+
+class RedisTier:
+    """Shared tier on a Redis-protocol server (Redis, Valkey, KeyDB, ...)."""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str = "cache:"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requires the `redis` package") from e
+        self.url = url
+        self.prefix = prefix
+        self._client = redis.Redis.from_url(url)
+
+    def _key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get(self, namespace: str, key: str) -> Optional[Tuple[Any, float]]:
+        pipe = self._client.pipeline()
+        pipe.get(self._key(namespace, key))
+        pipe.pttl(self._key(namespace, key))
+        payload, pttl = pipe.execute()
+        if payload is None:
+            return None
+        return json.loads(payload), time.time() + max(pttl, 0) / 1000
+
+    def set(self, namespace: str, key: str, value: Any, expires_at: float):
+        ttl_ms = int((expires_at - time.time()) * 1000)
+        if ttl_ms > 0:
+            self._client.set(self._key(namespace, key), json.dumps(value, separators=(",", ":")), px=ttl_ms)
+
+    def delete(self, namespace: str, key: str):
+        self._client.delete(self._key(namespace, key))
+
+    def clear(self, namespace: str = None):
+        pattern = f"{self.prefix}{namespace}:*" if namespace else f"{self.prefix}*"
+        for batch_key in self._client.scan_iter(match=pattern, count=500):
+            self._client.delete(batch_key)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "url": self.url.split("@")[-1], "prefix": self.prefix}
+
+
+class TieredCache:
+    """In-process LRU in front of an optional shared tier, with per-namespace stats."""
+
+    def __init__(self, memory: MemoryTier, shared=None):
+        self.memory = memory
+        self.shared = shared
+        self._stats = defaultdict(lambda: {"memory_hits": 0, "shared_hits": 0, "misses": 0, "errors": 0})
+
+    def _count(self, namespace: str, result: str):
+        self._stats[namespace][result] += 1
+        CACHE_REQUESTS.labels(namespace, result).inc()
+
+    def _shared_get(self, namespace: str, key: str) -> Any:
+        try:
+            found = self.shared.get(namespace, key)
+        except Exception as e:
+            self._count(namespace, "errors")
+            print(f"Shared cache read error ({namespace}): {e}")
+            return _MISSING
+        if found is None:
+            return _MISSING
+        value, expires_at = found
+        self.memory.set(namespace, key, value, expires_at)
+        return value
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        value = self.memory.get(namespace, key)
+        if value is not _MISSING:
+            self._count(namespace, "memory_hits")
+            return value
+        if self.shared is not None:
+            value = self._shared_get(namespace, key)
+            if value is not _MISSING:
+                self._count(namespace, "shared_hits")
+                return value
+        self._count(namespace, "misses")
+        return default
+
+    def set(self, namespace: str, key: str, value: Any, ttl: float = None):
+        expires_at = time.time() + (ttl if ttl is not None else settings.CACHE_DEFAULT_TTL)
+        self.memory.set(namespace, key, value, expires_at)
+        if self.shared is not None:
+            try:
+                self.shared.set(namespace, key, value, expires_at)
+            except Exception as e:
+                self._count(namespace, "errors")
+                print(f"Shared cache write error ({namespace}): {e}")
+
+    async def aget(self, namespace: str, key: str, default: Any = None) -> Any:
+        """`get` for async callers: memory hits stay on the loop, shared lookups go to a thread."""
+        value = self.memory.get(namespace, key)
+        if value is not _MISSING:
+            self._count(namespace, "memory_hits")
+            return value
+        if self.shared is not None:
+            value = await asyncio.to_thread(self._shared_get, namespace, key)
+            if value is not _MISSING:
+                self._count(namespace, "shared_hits")
+                return value
+        self._count(namespace, "misses")
+        return default
+
+    async def aset(self, namespace: str, key: str, value: Any, ttl: float = None):
+        await asyncio.to_thread(self.set, namespace, key, value, ttl)
+
+    def delete(self, namespace: str, key: str):
+        self.memory.delete(namespace, key)
+        if self.shared is not None:
+            self.shared.delete(namespace, key)
+
+    def clear(self, namespace: str = None):
+        self.memory.clear(namespace)
+        if self.shared is not None:
+            self.shared.clear(namespace)
+
+    def stats(self) -> dict:
+        return {
+            "memory": {"entries": len(self.memory), "max_entries": self.memory.max_entries},
+            "shared": self.shared.stats() if self.shared is not None else None,
+            "namespaces": {ns: dict(counts) for ns, counts in self._stats.items()},
+        }
+
+
+def _build_cache() -> TieredCache:
+    memory = MemoryTier(settings.CACHE_MEMORY_MAX_ENTRIES)
+    backend = settings.CACHE_BACKEND
+    if backend == "sqlite":
+        shared = SQLiteTier(settings.CACHE_PATH, int(settings.CACHE_SHARED_MAX_MB * 1024 * 1024))
+    elif backend == "redis":
+        shared = RedisTier(settings.CACHE_REDIS_URL)
+    elif backend == "memory":
+        shared = None
+    else:
+        raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+    return TieredCache(memory, shared)
+
+
+cache = _build_cache()
@@ -20,6 +20,98 @@ class Settings(BaseSettings):
     AWS_ACCESS_KEY_ID: str = ""
     AWS_SECRET_ACCESS_KEY: str = ""
     AWS_REGION: str = "us-east-1"
+    BEDROCK_REGIONS: str = ""        # Comma-separated Bedrock candidate regions (default: AWS_REGION)
+
+    # Multi-region routing (Vertex MaaS and Bedrock)
+    MODEL_REGIONS: dict = {}         # JSON: model_id → candidate regions, overriding the model matrix
+    REGION_PROBE_INTERVAL: float = 30.0   # Seconds between health probes; 0 disables the prober
+    REGION_PROBE_TIMEOUT: float = 5.0
+    REGION_COOLDOWN: float = 30.0    # Base back-off for a (model, region) after a retryable failure
+
+    # Endpoint overrides (e.g. point every gateway at tests/loadtest/mock_provider.py)
+    OPENAI_BASE_URL: str = ""
+    GENAI_BASE_URL: str = ""
+    VERTEX_MAAS_BASE_URL: str = ""   # Replaces https://{region}-aiplatform.googleapis.com
+    BEDROCK_ENDPOINT_URL: str = ""
+    GOOGLE_ACCESS_TOKEN: str = ""    # Static Vertex MaaS token instead of ADC
+
+    # Record / replay
+    GATEWAY_MODE: str = "live"       # "live", "record" (live + write cassettes) or "replay" (cassettes only)
+    CASSETTE_PATH: str = "cassettes/gateway.sqlite"
+    REPLAY_LATENCY: bool = False     # Sleep for the recorded latency when replaying
+
+    # Token estimation
+    ENFORCE_CONTEXT_WINDOW: bool = True  # Reject prompts that cannot fit the model before dispatch
+
+    # Provider prompt caching
+    PROMPT_CACHE_ENABLED: bool = True          # Send cache hints (Bedrock cachePoint, OpenAI prompt_cache_key, Gemini caches)
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS: int = 4096  # Smaller system prompts rely on Gemini implicit caching
+    GEMINI_CONTEXT_CACHE_TTL: int = 3600
+
+    # Shared cache (classifications, judge verdicts, OAuth tokens, Gemini cache names)
+    CACHE_BACKEND: str = "sqlite"    # "sqlite" (shared across workers via a WAL file), "redis" or "memory"
+    CACHE_PATH: str = "cache/shared.sqlite"
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_MEMORY_MAX_ENTRIES: int = 4096
+    CACHE_SHARED_MAX_MB: float = 256.0
+    CACHE_DEFAULT_TTL: float = 86400.0
+
+    # Telemetry / analytics store
+    TELEMETRY_BACKEND: str = "supabase"   # "supabase" or "sqlite" (embedded, works offline)
+    TELEMETRY_DB_PATH: str = "telemetry/telemetry.sqlite"
+    EVAL_PERSIST_CHUNK_SIZE: int = 250    # Evaluation rows per insert
+    EVAL_PERSIST_CONCURRENCY: int = 4     # Concurrent chunk inserts per batch
+    EVAL_PERSIST_RETRIES: int = 2
+    EVAL_CHECKPOINT_FLUSH_MS: int = 200   # Finished cells are buffered this long before being checkpointed
+    EVAL_ADAPTIVE_ROUND_PROMPTS: int = 5  # mode="adaptive": prompts per round between eliminations
+    EVAL_ADAPTIVE_MIN_PROMPTS: int = 10   # Paired prompts needed before a model can be eliminated
+
+    # Judge cascade (judge_cascade=true): cheap judges first, the requested judge only when they are unsure
+    JUDGE_CASCADE_JUDGES: str = "Google:gemini-2.5-flash-lite"   # "Provider:model,..."; two run in parallel
+    JUDGE_CASCADE_LOW: int = 2            # A criterion scored strictly between LOW and HIGH escalates
+    JUDGE_CASCADE_HIGH: int = 4
+    JUDGE_CASCADE_MAX_SPREAD: int = 2     # Wider spread across one verdict's criteria escalates
+    JUDGE_CASCADE_MAX_DISAGREEMENT: int = 1   # Larger per-criterion gap between two cheap judges escalates
+
+    # Cascade routing (routing_mode="cascade"): cheapest capable model first, escalate on a rejected answer
+    CHAT_CASCADE_MAX_TIERS: int = 3       # Rungs tried at most; the best-quality model is always the last
+    CHAT_CASCADE_VERIFIER: str = ""       # "Provider:model" that rates answers 1-5; empty = local checks only
+    CHAT_CASCADE_MIN_CONFIDENCE: int = 4  # Verifier rating needed to accept an answer without escalating
+
+    # Model leaderboard
+    LEADERBOARD_REFRESH_INTERVAL: float = 60.0   # Seconds between tails of the evaluations table
+    LEADERBOARD_SNAPSHOT_PATH: str = "leaderboard/snapshot.json"
+    LEADERBOARD_BOOTSTRAP_SAMPLES: int = 2000
+
+    # Budgets
+    BUDGETS_FILE: str = ""           # JSON with per-key / per-team limits; empty disables budgets
+    BUDGET_LEDGER_PATH: str = "budgets/ledger.sqlite"   # Spend shared by all workers on the host
+    BUDGET_HOLD_TTL: float = 3600.0  # Holds left by a crashed worker stop counting after this many seconds
+    REQUIRE_API_KEY: bool = False    # Reject callers whose X-API-Key is not in BUDGETS_FILE
+
+    # Connection pools (shared by all gateways)
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 50
+    HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    HTTP_TIMEOUT: float = 120.0
+    HTTP_CONNECT_TIMEOUT: float = 10.0
+    HTTP2_ENABLED: bool = True
+    BEDROCK_MAX_POOL_CONNECTIONS: int = 64
+    PROVIDER_MAX_CONCURRENCY: int = 64  # Worker threads for blocking SDK calls
+
+    # Response compression (brotli needs the optional `brotli` package, gzip is always available)
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MIN_BYTES: int = 1024
+    COMPRESSION_GZIP_LEVEL: int = 4       # ~6x on eval JSON at under half the CPU of level 6
+    COMPRESSION_BROTLI_QUALITY: int = 4   # 0-11
+
+    # Admin / profiling
+    ADMIN_TOKEN: str = ""            # Required in X-Admin-Token for /api/admin/*; empty disables admin routes
+    PROFILING_ENABLED: bool = False  # Install the per-request profiling middleware
+    PROFILE_INTERVAL_MS: float = 5.0
+
+    # Startup
+    WARMUP_GATEWAYS: bool = True  # Build SDK clients for configured providers at startup
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,143 @@
+"""
+JSON extraction — recover structured results from free-text model output.
+
+Models asked for JSON often wrap it in markdown fences or prose, leave trailing
+commas, or get cut off at the token limit. `JSONExtractor` scans text
+incrementally (it can be fed streamed chunks) for the first complete JSON
+object or array, tracking string and bracket state so braces inside strings
+don't confuse it. If the output ends mid-value it closes open strings and
+brackets and drops a dangling key, so truncated judge verdicts are still
+usable.
+"""
+import json
+import re
+from typing import Any
+from app.core.metrics import STRUCTURED_OUTPUTS
+
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_DANGLING_KEY = re.compile(r',?\s*"(?:[^"\\]|\\.)*"\s*:?$')
+_LAST_STRING = re.compile(r'"(?:[^"\\]|\\.)*"$')
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class JSONExtractError(ValueError):
+    """No JSON value could be recovered from the text."""
+
+
+def _loads_lenient(candidate: str) -> Any:
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return json.loads(_TRAILING_COMMA.sub(r"\1", candidate))
+
+
+class JSONExtractor:
+    """Incremental scanner for the first JSON object/array in a text stream."""
+
+    def __init__(self):
+        self._text = ""
+        self._pos = 0
+        self._start = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self.value = None
+        self.complete = False
+
+    def feed(self, chunk: str) -> bool:
+        """Consume more text; True once a complete value has been parsed."""
+        if self.complete:
+            return True
+        self._text += chunk
+        text = self._text
+        while self._pos < len(text):
+            ch = text[self._pos]
+            self._pos += 1
+            if self._start is None:
+                if ch in _CLOSERS:
+                    self._start = self._pos - 1
+                    self._stack = [ch]
+                continue
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in _CLOSERS:
+                self._stack.append(ch)
+            elif ch in "}]":
+                if not self._stack or _CLOSERS[self._stack[-1]] != ch:
+                    self._restart()
+                    continue
+                self._stack.pop()
+                if not self._stack:
+                    try:
+                        self.value = _loads_lenient(text[self._start:self._pos])
+                        self.complete = True
+                        return True
+                    except json.JSONDecodeError:
+                        self._restart()
+        return False
+
+    def _restart(self):
+        """The candidate wasn't JSON (e.g. "{name}" in prose): rescan after its opening bracket."""
+        self._pos = self._start + 1
+        self._start = None
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+
+    def _drop_dangling_key(self, partial: str) -> str:
+        """Remove an object key that was cut off before (or right after) its colon."""
+        if partial.endswith(":"):
+            return _DANGLING_KEY.sub("", partial)
+        if self._stack and self._stack[-1] == "{":
+            match = _LAST_STRING.search(partial)
+            if match and partial[:match.start()].rstrip()[-1:] in ("{", ","):
+                return _DANGLING_KEY.sub("", partial)
+        return partial
+
+    def result(self) -> Any:
+        """The parsed value, repairing a truncated trailing value if needed."""
+        if self.complete:
+            return self.value
+        if self._start is None:
+            raise JSONExtractError("No JSON object found in model output")
+        partial = self._text[self._start:]
+        if self._in_string:
+            partial += '"'
+        partial = self._drop_dangling_key(partial.rstrip().rstrip(","))
+        partial += "".join(_CLOSERS[opener] for opener in reversed(self._stack))
+        try:
+            return _loads_lenient(partial)
+        except json.JSONDecodeError as e:
+            raise JSONExtractError(f"Model output is not recoverable JSON: {e}") from e
+
+
+def extract_json(text: str) -> Any:
+    """First JSON value in `text` (fenced, embedded in prose, or truncated)."""
+    extractor = JSONExtractor()
+    extractor.feed(text or "")
+    return extractor.result()
+
+
+def structured_result(result: dict, task: str, model_id: str) -> Any:
+    """Parsed output of a structured call, recording how it was obtained per (task, model).
+
+    `native`: the provider enforced the schema; `recovered`: extracted from
+    free text; `failed`: nothing usable (raises JSONExtractError).
+    """
+    if result.get("parsed") is not None:
+        STRUCTURED_OUTPUTS.labels(task, model_id, "native").inc()
+        return result["parsed"]
+    try:
+        value = extract_json(result.get("text"))
+    except JSONExtractError:
+        STRUCTURED_OUTPUTS.labels(task, model_id, "failed").inc()
+        raise
+    STRUCTURED_OUTPUTS.labels(task, model_id, "recovered").inc()
+    return value
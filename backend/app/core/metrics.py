@@ -0,0 +1,353 @@
+"""
+Metrics — a small in-process Prometheus registry.
+
+Counters, gauges and histograms keyed by label values, rendered in the
+Prometheus text exposition format at /metrics. Label children are cached, so
+the hot path is a dict lookup, a lock and an add.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# ASGI scope of the request being served; lets deep code label metrics by endpoint
+_request_scope: ContextVar = ContextVar("request_scope", default=None)
+
+_PROCESS_START = time.time()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_name = ""
+    suffix = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self.labels()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def labels(self, *values):
+        """Return the child for these label values (positional, in labelnames order)."""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def collect(self) -> list:
+        raise NotImplementedError
+
+
+class _ValueChild:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Counter(_Metric):
+    type_name = "counter"
+    suffix = "_total"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def collect(self) -> list:
+        return [
+            f"{self.name}_total{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class Gauge(_Metric):
+    type_name = "gauge"
+
+    def _new_child(self):
+        return _ValueChild()
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+    def collect(self) -> list:
+        return [
+            f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(child.value)}"
+            for values, child in list(self._children.items())
+        ]
+
+
+class _HistogramChild:
+    __slots__ = ("bounds", "counts", "sum", "count", "_lock")
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=(), registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def collect(self) -> list:
+        lines = []
+        for values, child in list(self._children.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+            lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class Registry:
+    """Holds metrics and renders them in Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric: _Metric):
+        self._metrics.append(metric)
+
+    def add_collector(self, fn):
+        """Register a callable invoked at scrape time (for values sampled on demand)."""
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in self._collectors:
+            fn()
+        lines = []
+        for metric in self._metrics:
+            name = metric.name + metric.suffix
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (16, 64, 256, 1024, 4096, 16384, 65536, 262144)
+COST_BUCKETS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+
+LLM_LABELS = ("provider", "gateway", "model", "endpoint")
+
+# ── HTTP ────────────────────────────────────────────────────
+HTTP_REQUESTS = Counter("http_requests", "HTTP requests served", ("method", "endpoint", "status"))
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ("method", "endpoint"), LATENCY_BUCKETS
+)
+
+# ── Provider calls ──────────────────────────────────────────
+LLM_REQUESTS = Counter("llm_requests", "Provider calls", LLM_LABELS)
+LLM_ERRORS = Counter("llm_errors", "Failed provider calls", LLM_LABELS + ("error_type",))
+LLM_LATENCY = Histogram("llm_request_duration_seconds", "Provider call latency", LLM_LABELS, LATENCY_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens", "Tokens processed", LLM_LABELS + ("direction",))
+LLM_TOKENS_PER_REQUEST = Histogram(
+    "llm_tokens_per_request", "Tokens per provider call", LLM_LABELS + ("direction",), TOKEN_BUCKETS
+)
+LLM_COST = Counter("llm_cost_usd", "Provider spend in USD", LLM_LABELS)
+LLM_COST_PER_REQUEST = Histogram("llm_cost_per_request_usd", "Cost per provider call", LLM_LABELS, COST_BUCKETS)
+REGION_FAILOVERS = Counter("region_failovers", "Provider calls retried in another region", ("gateway", "region"))
+REGION_PROBE_LATENCY = Histogram(
+    "region_probe_duration_seconds", "Health-probe round trip per regional endpoint", ("family", "region"), LATENCY_BUCKETS
+)
+
+# ── Background work ─────────────────────────────────────────
+TELEMETRY_QUEUE_DEPTH = Gauge("telemetry_queue_depth", "Telemetry writes queued but not yet persisted")
+TELEMETRY_WRITES = Counter("telemetry_writes", "Telemetry write attempts", ("status",))
+EVAL_PERSIST_CHUNKS = Counter("eval_persist_chunks", "Evaluation row chunk inserts by outcome", ("status",))
+CACHE_REQUESTS = Counter("cache_requests", "Cache lookups by namespace and tier hit", ("cache", "result"))
+STRUCTURED_OUTPUTS = Counter(
+    "structured_outputs", "Structured (JSON) results of internal calls by how they were parsed", ("task", "model", "result")
+)
+BUDGET_REJECTIONS = Counter("budget_rejections", "Requests rejected by spend budgets", ("window",))
+CHAT_CASCADE_STEPS = Counter(
+    "chat_cascade_steps", "Cascade routing attempts by tier and outcome (accepted or rejection reason)", ("tier", "outcome")
+)
+EVAL_CELLS = Counter("eval_cells", "Evaluation cells (prompt x model) completed", ("status",))
+EVAL_CELL_LATENCY = Histogram(
+    "eval_cell_duration_seconds", "Evaluation cell duration incl. judging", (), LATENCY_BUCKETS
+)
+
+# ── Process ─────────────────────────────────────────────────
+PROCESS_RSS = Gauge("process_resident_memory_bytes", "Resident memory size")
+PROCESS_CPU = Counter("process_cpu_seconds", "Total user and system CPU time spent in seconds")
+PROCESS_START = Gauge("process_start_time_seconds", "Process start time (unix epoch)")
+
+
+def _collect_process():
+    PROCESS_START.set(_PROCESS_START)
+    if resource is None:
+        return
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # Cumulative, so exposed as a counter (process_cpu_seconds_total) sampled from the OS
+    PROCESS_CPU.labels().set(usage.ru_utime + usage.ru_stime)
+    try:
+        with open("/proc/self/statm") as f:
+            PROCESS_RSS.set(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE"))
+    except OSError:
+        # No procfs (macOS): fall back to peak RSS, reported in bytes there
+        PROCESS_RSS.set(usage.ru_maxrss)
+
+
+REGISTRY.add_collector(_collect_process)
+
+
+def current_endpoint() -> str:
+    """Route template of the request being served, or 'internal' outside a request."""
+    scope = _request_scope.get()
+    if scope is None:
+        return "internal"
+    route = scope.get("route")
+    return getattr(route, "path", "unmatched")
+
+
+_llm_children = {}
+
+
+def _llm_children_for(labels: tuple) -> tuple:
+    """Resolve (and cache) every child touched by one provider call."""
+    children = _llm_children.get(labels)
+    if children is None:
+        children = _llm_children[labels] = (
+            LLM_REQUESTS.labels(*labels),
+            LLM_LATENCY.labels(*labels),
+            LLM_TOKENS.labels(*labels, "input"),
+            LLM_TOKENS.labels(*labels, "output"),
+            LLM_TOKENS.labels(*labels, "cached_input"),
+            LLM_TOKENS_PER_REQUEST.labels(*labels, "input"),
+            LLM_TOKENS_PER_REQUEST.labels(*labels, "output"),
+            LLM_COST.labels(*labels),
+            LLM_COST_PER_REQUEST.labels(*labels),
+        )
+    return children
+
+
+def record_llm_call(provider: str, gateway: str, model: str, latency_s: float,
+                    input_tokens: int, output_tokens: int, cost: float, cached_input_tokens: int = 0):
+    (requests, latency, tokens_in, tokens_out, tokens_cached,
+     per_req_in, per_req_out, cost_total, cost_per_req) = _llm_children_for(
+        (provider, gateway, model, current_endpoint())
+    )
+    requests.inc()
+    latency.observe(latency_s)
+    tokens_in.inc(input_tokens)
+    tokens_out.inc(output_tokens)
+    if cached_input_tokens:
+        tokens_cached.inc(cached_input_tokens)
+    per_req_in.observe(input_tokens)
+    per_req_out.observe(output_tokens)
+    cost_total.inc(cost)
+    cost_per_req.observe(cost)
+
+
+def record_llm_error(provider: str, gateway: str, model: str, error: Exception):
+    LLM_ERRORS.labels(provider, gateway, model, current_endpoint(), type(error).__name__).inc()
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: HTTP request metrics plus the request scope for endpoint labels."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        token = _request_scope.set(scope)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_scope.reset(token)
+            route = scope.get("route")
+            endpoint = getattr(route, "path", "unmatched")
+            HTTP_REQUESTS.labels(scope["method"], endpoint, status[0]).inc()
+            HTTP_LATENCY.labels(scope["method"], endpoint).observe(time.perf_counter() - start)
@@ -7,6 +7,7 @@ Each entry contains:
   - Performance metadata: latency (ms), cost_per_1k tokens, quality_score (0-5)
   - context_window (tokens)
 """
+from app.core.config import settings
 
 MODEL_REGISTRY = [
     # ── Google ──────────────────────────────────────────────
@@ -371,12 +372,48 @@ MODEL_MATRIX = {
     },
 }
 
-# DeepSeek models need specific regions
-MODEL_REGION_MAP = {
-    "deepseek-ai/deepseek-v3.2-maas": "global",
-    "deepseek-ai/deepseek-r1-0528-maas": "us-central1",
+# Candidate regions for Vertex MaaS and Bedrock models, in preference order. Calls go to
+# the fastest healthy candidate (see region_service); the MODEL_REGIONS setting overrides
+# these per model. Bedrock models without an entry use BEDROCK_REGIONS / AWS_REGION.
+MODEL_REGIONS = {
+    "meta/llama-3.3-70b-instruct-maas": ["us-central1"],
+    "meta/llama-4-scout-17b-16e-instruct-maas": ["us-east5"],
+    "deepseek-ai/deepseek-v3.2-maas": ["global"],
+    "deepseek-ai/deepseek-r1-0528-maas": ["us-central1"],
 }
 
+# Fallback candidates for Vertex MaaS models missing from MODEL_REGIONS
+DEFAULT_REGIONS = {
+    "vertex_openai": ["us-central1"],
+    "vertex_openai_deepseek": ["global"],
+}
+
+# Generation profiles: (model_id or "*", use case / internal task or "*") → parameters.
+# Internal tasks are "classify", "judge" and "prompt_analysis". Profiles merge
+# from least to most specific: ("*", "*") < ("*", task) < (model, "*") < (model, task),
+# and per-request overrides win over all of them. A None value means "don't send".
+#   max_tokens       visible output limit
+#   temperature      sampling temperature
+#   stop             stop sequences
+#   thinking_budget  Gemini 2.5 thinking tokens (None = model default); added on top of max_tokens
+GENERATION_PROFILES = {
+    ("*", "*"): {"max_tokens": 1024, "temperature": 0.7, "stop": None, "thinking_budget": None},
+    ("*", "summarization"): {"max_tokens": 512, "temperature": 0.3},
+    ("*", "structured output"): {"temperature": 0.2},
+    ("*", "reasoning"): {"max_tokens": 2048},
+    ("*", "classify"): {"max_tokens": 64, "temperature": 0.0, "thinking_budget": 0},
+    ("*", "judge"): {"max_tokens": 512, "temperature": 0.0, "thinking_budget": 0},
+    ("*", "prompt_analysis"): {"max_tokens": 256, "temperature": 0.0, "thinking_budget": 0},
+    ("*", "cascade_check"): {"max_tokens": 32, "temperature": 0.0, "thinking_budget": 0},
+    # Reasoning models: hidden reasoning tokens count against the limit, and
+    # temperature / stop sequences are not accepted
+    ("o1-preview", "*"): {"max_tokens": 8192, "temperature": None, "stop": None},
+    ("o1-mini", "*"): {"max_tokens": 8192, "temperature": None, "stop": None},
+    ("deepseek-ai/deepseek-r1-0528-maas", "*"): {"max_tokens": 4096},
+}
+
+GENERATION_PARAMS = ("max_tokens", "temperature", "stop", "thinking_budget")
+
 
 def get_model_id(provider: str, use_case: str) -> str:
     """Look up the model ID for a given provider and use case."""
@@ -391,8 +428,25 @@ def get_model_id(provider: str, use_case: str) -> str:
     return model_id
 
 
+def get_generation_profile(model_id: str, task: str = None, overrides: dict = None) -> dict:
+    """Resolve max tokens, temperature, stop sequences and thinking budget for a call."""
+    profile = {}
+    for key in (("*", "*"), ("*", task), (model_id, "*"), (model_id, task)):
+        profile.update(GENERATION_PROFILES.get(key, {}))
+    if overrides:
+        profile.update({k: v for k, v in overrides.items() if k in GENERATION_PARAMS and v is not None})
+    return profile
+
+
 def get_gateway(provider: str) -> str:
     """Determine which gateway/SDK to use for a provider."""
+    if settings.GATEWAY_MODE == "replay":
+        return "replay"
+    return get_live_gateway(provider)
+
+
+def get_live_gateway(provider: str) -> str:
+    """Gateway that actually talks to the provider, ignoring replay mode."""
     if provider == "Google":
         return "vertex_genai"
     elif provider == "OpenAI":
@@ -407,20 +461,32 @@ def get_gateway(provider: str) -> str:
         raise ValueError(f"No gateway configured for provider: {provider}")
 
 
-def get_models_by_tags(tags: list[str]) -> list[dict]:
-    """Return all models that support ALL the given capability tags."""
+def get_model_info(model_id: str) -> dict | None:
+    """Registry entry for a model ID, if it is registered."""
+    for model in MODEL_REGISTRY:
+        if model["model_id"] == model_id:
+            return model
+    return None
+
+
+def get_models_by_tags(tags: list[str], min_context: int = 0) -> list[dict]:
+    """Return all models that support ALL the given capability tags (and fit `min_context` tokens).
+
+    Tags are spelled as in CAPABILITY_KEYS ("structured output") or as registry keys ("structured_output").
+    """
+    keys = [tag.replace(" ", "_") for tag in tags]
     results = []
     for model in MODEL_REGISTRY:
-        if all(model.get(tag, False) for tag in tags):
+        if all(model.get(key, False) for key in keys) and model["context_window"] >= min_context:
             results.append(model)
     return results
 
 
-def recommend_model(tags: list[str]) -> dict | None:
+def recommend_model(tags: list[str], min_context: int = 0) -> dict | None:
     """
     Pick the best model for a set of workload tags.
     """
-    candidates = get_models_by_tags(tags)
+    candidates = get_models_by_tags(tags, min_context)
     if not candidates:
         return None
 
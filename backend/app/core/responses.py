@@ -0,0 +1,160 @@
+"""
+Responses — fast JSON rendering and negotiated compression for API payloads.
+
+`FastJSONResponse` renders with orjson (datetimes, numpy values and non-string
+keys included). Endpoints that return large, already-shaped dicts (evaluation
+results, history, analytics) return it directly, which skips FastAPI's
+response-model validation and `jsonable_encoder` walk.
+
+`CompressionMiddleware` compresses responses of at least COMPRESSION_MIN_BYTES
+with brotli (when the optional `brotli` package is installed) or gzip,
+whichever the client prefers in Accept-Encoding. Streaming responses (exports)
+are compressed chunk by chunk and flushed after every chunk, so they still
+arrive progressively. Bodies that are already compressed (Parquet, images,
+anything with a Content-Encoding) pass through untouched.
+"""
+import asyncio
+import gzip
+import zlib
+from typing import Any, Optional
+import orjson
+from fastapi.responses import JSONResponse
+from app.core.config import settings
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Whole bodies larger than this are compressed in the worker pool instead of on the event loop
+OFFLOAD_BYTES = 256 * 1024
+
+# Content types that are compressed already or must not be buffered by an encoder
+_SKIP_CONTENT_TYPES = (
+    "image/", "video/", "audio/", "application/zip", "application/gzip",
+    "application/vnd.apache.parquet", "text/event-stream",
+)
+
+
+class FastJSONResponse(JSONResponse):
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(
+            content, default=str, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+        )
+
+
+def negotiate_encoding(accept_encoding: str) -> Optional[str]:
+    """"br" or "gzip" from an Accept-Encoding header (by q-value, then server preference)."""
+    offered = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        offered[name.strip().lower()] = q
+    wildcard = offered.get("*", 0.0)
+    candidates = (["br"] if brotli is not None else []) + ["gzip"]
+    ranked = sorted(
+        ((offered.get(e, wildcard), -i, e) for i, e in enumerate(candidates)), reverse=True,
+    )
+    q, _, encoding = ranked[0]
+    return encoding if q > 0 else None
+
+
+class _Encoder:
+    """Incremental compressor with a flush per chunk."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data) + self._compressor.flush()
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """Pure ASGI middleware: brotli/gzip responses above a size threshold."""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = next((v.decode("latin-1") for k, v in scope["headers"] if k == b"accept-encoding"), "")
+        encoding = negotiate_encoding(accept) if accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        encoder = None    # Set once a streaming response is being compressed
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, encoder, passthrough
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+            body, more_body = message.get("body", b""), message.get("more_body", False)
+
+            if encoder is not None:
+                data = encoder.chunk(body) if body else b""
+                if not more_body:
+                    data += encoder.finish()
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            headers = [(k, v) for k, v in start["headers"]]
+            content_type = next((v.decode("latin-1") for k, v in headers if k == b"content-type"), "")
+            if (
+                any(k == b"content-encoding" for k, _ in headers)
+                or content_type.startswith(_SKIP_CONTENT_TYPES)
+                or (not more_body and len(body) < self.minimum_size)
+            ):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            headers = [(k, v) for k, v in headers if k != b"content-length"]
+            headers += [(b"content-encoding", encoding.encode()), (b"vary", b"Accept-Encoding")]
+            if more_body:
+                encoder = _Encoder(encoding)
+                data = encoder.chunk(body)
+            else:
+                if len(body) > OFFLOAD_BYTES:
+                    data = await asyncio.to_thread(compress, body, encoding)
+                else:
+                    data = compress(body, encoding)
+                headers.append((b"content-length", str(len(data)).encode()))
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": data, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
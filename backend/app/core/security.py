@@ -0,0 +1,22 @@
+"""
+Security — admin authentication for operational endpoints.
+"""
+import hmac
+from typing import Optional
+from fastapi import Header, HTTPException
+from app.core.config import settings
+
+
+def is_admin_token(token: Optional[str]) -> bool:
+    """Constant-time check against ADMIN_TOKEN. Admin access is off while it is unset."""
+    if not settings.ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), settings.ADMIN_TOKEN.encode())
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(default=None)):
+    """FastAPI dependency guarding admin-only routes."""
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Admin API is disabled")
+    if not is_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
@@ -0,0 +1,77 @@
+"""
+Timing — per-stage latency breakdown for a request.
+
+A StageTimer is bound to the current context with `start_timer()`. Code anywhere
+below it (including SDK calls running in worker threads, which inherit the
+context) records monotonic perf_counter spans with `span("stage")`. When no
+timer is bound, `span` is a no-op.
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_timer: ContextVar = ContextVar("stage_timer", default=None)
+
+
+class StageTimer:
+    """Accumulates named stage durations (ms) in first-seen order."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages = {}
+
+    def add(self, name: str, elapsed_ms: float):
+        self.stages[name] = self.stages.get(name, 0.0) + elapsed_ms
+
+    @contextmanager
+    def span(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, (time.perf_counter() - start) * 1000)
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def as_dict(self) -> dict:
+        timings = {name: round(ms, 2) for name, ms in self.stages.items()}
+        timings["total"] = round(self.total_ms(), 2)
+        return timings
+
+    def server_timing(self, timings: dict = None) -> str:
+        """Value for the Server-Timing response header."""
+        timings = timings if timings is not None else self.as_dict()
+        return ", ".join(f"{name};dur={ms}" for name, ms in timings.items())
+
+
+def start_timer() -> StageTimer:
+    """Bind a fresh timer to the current context and return it."""
+    timer = StageTimer()
+    _current_timer.set(timer)
+    return timer
+
+
+def current_timer():
+    return _current_timer.get()
+
+
+@contextmanager
+def span(name: str):
+    """Time a stage on the current timer, if any."""
+    timer = _current_timer.get()
+    if timer is None:
+        yield
+        return
+    with timer.span(name):
+        yield
+
+
+@contextmanager
+def detached():
+    """Run a block without a timer, so its inner stages don't leak into the parent's."""
+    token = _current_timer.set(None)
+    try:
+        yield
+    finally:
+        _current_timer.reset(token)
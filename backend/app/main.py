@@ -1,12 +1,60 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from app.core.config import settings
+from app.core.metrics import REGISTRY, MetricsMiddleware
+from app.core.responses import CompressionMiddleware
 from app.api.endpoints.chat import router as chat_router
 from app.api.endpoints.analytics import router as analytics_router
 from app.api.endpoints.evaluation import router as evaluation_router
 from app.api.endpoints.tagging import router as tagging_router
+from app.api.endpoints.system import router as system_router
+from app.api.endpoints.admin import router as admin_router
+from app.services.ai_service import ai_service
+from app.services.budget_service import budget_service
+from app.services.connection_manager import connection_manager
+from app.services.leaderboard_service import leaderboard_service
+from app.services.persistence_service import persistence_service
+from app.services.pricing_service import load_pricing_data
+from app.services.profiling_service import RequestProfilingMiddleware
+from app.services.region_service import region_router
+from app.services.telemetry_store import telemetry_store
 
-app = FastAPI(title=settings.PROJECT_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Size the SDK worker pool, load budgets, start the leaderboard, warm up gateways and probe regions."""
+    executor = ThreadPoolExecutor(
+        max_workers=settings.PROVIDER_MAX_CONCURRENCY, thread_name_prefix="provider"
+    )
+    asyncio.get_running_loop().set_default_executor(executor)
+    await asyncio.to_thread(budget_service.load)
+    leaderboard_task = None
+    if telemetry_store.is_configured():
+        await asyncio.to_thread(leaderboard_service.load_snapshot)
+        leaderboard_task = asyncio.create_task(leaderboard_service.run_refresh())
+    if settings.WARMUP_GATEWAYS:
+        await asyncio.to_thread(load_pricing_data)
+        await asyncio.to_thread(ai_service.warm_up)
+        await asyncio.to_thread(telemetry_store.warm_up)
+    regional = ai_service.regional_gateways()
+    probe_task = None
+    if regional and settings.REGION_PROBE_INTERVAL > 0:
+        probe_task = asyncio.create_task(region_router.run_prober(regional))
+    yield
+    if probe_task:
+        probe_task.cancel()
+    await persistence_service.drain()
+    if leaderboard_task:
+        leaderboard_task.cancel()
+    connection_manager.close()
+    executor.shutdown(wait=False)
+
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
 # CORS — allow frontend to connect
 app.add_middleware(
@@ -16,13 +64,25 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+if settings.COMPRESSION_ENABLED:
+    app.add_middleware(CompressionMiddleware, minimum_size=settings.COMPRESSION_MIN_BYTES)
+app.add_middleware(MetricsMiddleware)
+if settings.PROFILING_ENABLED:
+    app.add_middleware(RequestProfilingMiddleware, interval=settings.PROFILE_INTERVAL_MS / 1000)
 
 # Register routers
 app.include_router(chat_router, prefix="/api", tags=["Chat"])
 app.include_router(analytics_router, prefix="/api", tags=["Analytics"])
 app.include_router(evaluation_router, prefix="/api", tags=["Evaluation"])
 app.include_router(tagging_router, prefix="/api", tags=["Tagging"])
+app.include_router(system_router, prefix="/api", tags=["System"])
+app.include_router(admin_router, prefix="/api", tags=["Admin"])
+
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus scrape endpoint."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 
 @app.get("/")
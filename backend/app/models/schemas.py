@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, Any, List
 
 
@@ -8,6 +8,12 @@ class ChatRequest(BaseModel):
     prompt: str
     model_id: Optional[str] = None  # Override auto-selected model
     auto_select: bool = False       # Enable workload-based auto-selection
+    routing_mode: Optional[str] = None  # "budget": auto-select within the caller's remaining budget;
+                                        # "cascade": cheapest capable model first, escalate on a rejected answer
+    # Generation overrides (default: the model's generation profile for this use case)
+    max_tokens: Optional[int] = None
+    temperature: Optional[float] = None
+    stop: Optional[List[str]] = None
 
 
 class ChatResponse(BaseModel):
@@ -39,6 +45,12 @@ class EvalRequest(BaseModel):
     scoring_type: Optional[str] = "Manual"  # "Manual" or "AI"
     judge_model: Optional[str] = None
     judge_provider: Optional[str] = None
+    batch_id: Optional[str] = None   # Caller-chosen id, so a timed-out run can be resumed
+    mode: Optional[str] = None       # "adaptive": race the models and stop calling dominated ones
+    objective: str = "quality"       # Adaptive objective: quality, latency or cost
+    confidence: float = Field(default=0.95, gt=0.5, lt=1.0)
+    judge_cascade: bool = False      # Cheap judges first; the judge above only for uncertain cells
+    cheap_judges: Optional[list[EvalModelConfig]] = None   # Defaults to JUDGE_CASCADE_JUDGES
 
 
 class AIScoreItem(BaseModel):
@@ -64,9 +76,14 @@ class EvalResponseItem(BaseModel):
 
 
 class EvalResponse(BaseModel):
+    batch_id: Optional[str] = None
     results: list[EvalResponseItem]
     summary_metrics: Dict[str, Any] = {}
     prompt_metadata: Optional[Dict[str, Any]] = None
+    persistence: Optional[Dict[str, Any]] = None   # Initial status; poll /evaluation/batch/{batch_id}/status
+    resume: Optional[Dict[str, Any]] = None        # Cells reused from checkpoints vs recomputed
+    adaptive: Optional[Dict[str, Any]] = None      # Ranking, its confidence and calls saved (mode="adaptive")
+    judge_cascade: Optional[Dict[str, Any]] = None # Escalations, judge agreement and savings (judge_cascade=true)
 
 
 # ── Tagging & Model Selection Schemas ──────────────────────
@@ -92,6 +109,23 @@ class RecommendModelResponse(BaseModel):
     latency: int
 
 
+class TokenEstimateRequest(BaseModel):
+    model_id: str
+    prompt: str
+    has_image: bool = False
+    task: Optional[str] = None               # Use case / internal task selecting the generation profile
+    max_output_tokens: Optional[int] = None  # Default: the generation profile's max_tokens
+
+
+class TokenEstimateResponse(BaseModel):
+    model_id: str
+    estimated_input_tokens: int
+    max_output_tokens: int
+    context_window: Optional[int] = None
+    fits: bool
+    predicted_cost: float
+
+
 class ModelRegistryEntry(BaseModel):
     model_id: str
     provider: str
@@ -0,0 +1,203 @@
+"""
+Adaptive Evaluation — race models over the prompts and stop spending on dominated ones.
+
+With mode="adaptive", /eval/run feeds the prompts to the models in rounds of
+EVAL_ADAPTIVE_ROUND_PROMPTS. This is successive elimination, a bandit-style
+race. After each round, every model still in the race is compared with the
+current leader, prompt by prompt. A model is eliminated once both of these hold:
+
+    - it has EVAL_ADAPTIVE_MIN_PROMPTS paired observations with the leader;
+    - the leader's mean advantage on the objective is positive at the requested
+      confidence. The test is a paired Student-t bound.
+
+The test is repeated after every round against a leader picked from the same
+data, so the requested error rate 1 - confidence is split Bonferroni-style
+across every look at which an elimination is possible and every ordered
+pair of models. Any single leader-vs-rival test is one of those. So the
+chance that any model is dropped while it is actually no worse than the
+winner stays below 1 - confidence over the whole race.
+
+An eliminated model gets no further generation or judge calls. The race stops
+when one model is left or the prompts run out.
+
+Objectives, all oriented so that higher is better:
+
+    quality   mean judge score over the criteria. A failed cell scores 0.
+    latency   generation latency_ms, lower is better.
+    cost      generation cost in USD, lower is better.
+
+For latency and cost, a failed cell takes the worst value observed so far.
+"""
+import math
+from statistics import NormalDist, mean, stdev
+from typing import Awaitable, Callable, Dict, List, Optional
+from app.core.config import settings
+from app.services.checkpoint_service import is_failed
+
+OBJECTIVES = ("quality", "latency", "cost")
+
+
+def cell_value(result: dict, objective: str) -> Optional[float]:
+    """The cell's objective value (higher is better); None for a failed latency/cost cell."""
+    if objective == "quality":
+        if is_failed(result):
+            return 0.0
+        scored = [float(v) for v in (result.get("scores") or {}).values() if v]
+        return sum(scored) / len(scored) if scored else 0.0
+    if is_failed(result):
+        return None
+    metrics = result["metrics"]
+    return -float(metrics.get("latency_ms" if objective == "latency" else "cost") or 0)
+
+
+def _p_better(diffs: List[float]) -> float:
+    """Normal-approximation probability that the mean paired difference is positive."""
+    if not diffs:
+        return 0.5
+    d = mean(diffs)
+    se = stdev(diffs) / math.sqrt(len(diffs)) if len(diffs) > 1 else 0.0
+    if se == 0:
+        return 1.0 if d > 0 else 0.0 if d < 0 else 0.5
+    return NormalDist().cdf(d / se)
+
+
+def _t_quantile(p: float, df: int) -> float:
+    """Student-t quantile (Cornish-Fisher expansion around the normal one).
+
+    Paired samples are as small as EVAL_ADAPTIVE_MIN_PROMPTS, where the normal
+    quantile understates the bound."""
+    z = NormalDist().inv_cdf(p)
+    return (
+        z
+        + (z ** 3 + z) / (4 * df)
+        + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * df ** 2)
+        + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * df ** 3)
+    )
+
+
+def elimination_looks(n_prompts: int, round_prompts: int, min_prompts: int) -> int:
+    """Rounds after which the race can eliminate (enough paired prompts have been seen)."""
+    rounds = math.ceil(n_prompts / round_prompts)
+    return sum(1 for r in range(1, rounds + 1) if min(n_prompts, r * round_prompts) >= min_prompts)
+
+
+class Race:
+    def __init__(self, n_prompts: int, n_models: int, objective: str, confidence: float, min_prompts: int,
+                 round_prompts: int = 1):
+        self.n_prompts, self.n_models = n_prompts, n_models
+        self.objective, self.confidence, self.min_prompts = objective, confidence, min_prompts
+        self.round_prompts = round_prompts
+        # Error rate per test: 1 - confidence over every possible look and ordered model pair
+        tests = max(1, elimination_looks(n_prompts, round_prompts, min_prompts)) * max(1, n_models * (n_models - 1))
+        self.p_test = 1 - (1 - confidence) / tests
+        self.alive = list(range(n_models))
+        self.values = [{} for _ in range(n_models)]   # model → {prompt index: value or None}
+        self.eliminated = {}                            # model → prompts seen when eliminated
+        self.prompts_done = 0
+        self.rounds = 0
+        self.cells_run = 0
+
+    def next_cells(self, round_prompts: int) -> List[int]:
+        """Cells (prompt-major) of the next round, empty when the race is over."""
+        if len(self.alive) < 2 and self.prompts_done:
+            return []
+        prompts = range(self.prompts_done, min(self.n_prompts, self.prompts_done + round_prompts))
+        return [p * self.n_models + m for p in prompts for m in self.alive]
+
+    def observe(self, cells: List[int], results: List[dict]):
+        for cell, result in zip(cells, results):
+            p, m = divmod(cell, self.n_models)
+            self.values[m][p] = cell_value(result, self.objective)
+            self.prompts_done = max(self.prompts_done, p + 1)
+        self.rounds += 1
+        self.cells_run += len(cells)
+
+    def _filled(self) -> List[Dict[int, float]]:
+        # Failed latency/cost cells take the worst value observed so far
+        observed = [v for values in self.values for v in values.values() if v is not None]
+        worst = min(observed) if observed else 0.0
+        return [{p: worst if v is None else v for p, v in values.items()} for values in self.values]
+
+    @staticmethod
+    def _diffs(a: Dict[int, float], b: Dict[int, float]) -> List[float]:
+        return [a[p] - b[p] for p in a if p in b]
+
+    def _leader(self, filled: List[Dict[int, float]], models: List[int]) -> int:
+        return max(models, key=lambda m: mean(filled[m].values()) if filled[m] else float("-inf"))
+
+    def eliminate(self) -> List[int]:
+        """Drop models the leader dominates at the requested confidence; returns them."""
+        if len(self.alive) < 2:
+            return []
+        filled = self._filled()
+        leader = self._leader(filled, self.alive)
+        dropped = []
+        for m in self.alive:
+            if m == leader:
+                continue
+            diffs = self._diffs(filled[leader], filled[m])
+            if len(diffs) < self.min_prompts:
+                continue
+            se = stdev(diffs) / math.sqrt(len(diffs))
+            if mean(diffs) - _t_quantile(self.p_test, len(diffs) - 1) * se > 0:
+                dropped.append(m)
+                self.eliminated[m] = self.prompts_done
+        self.alive = [m for m in self.alive if m not in dropped]
+        return dropped
+
+    def report(self, names: List[str], judged: bool) -> dict:
+        filled = self._filled()
+        survivors = sorted(self.alive, key=lambda m: -mean(filled[m].values()) if filled[m] else math.inf)
+        # Eliminated models rank below the survivors, later eliminations first
+        eliminated = sorted(self.eliminated, key=lambda m: (-self.eliminated[m], -mean(filled[m].values())))
+        order = survivors + eliminated + [m for m in range(self.n_models) if m not in survivors + eliminated]
+        winner = order[0]
+        sign = 1 if self.objective == "quality" else -1
+        ranking = []
+        for rank, m in enumerate(order, 1):
+            entry = {
+                "rank": rank,
+                "model": names[m],
+                # In the objective's own units (latency_ms, USD, score)
+                "objective_mean": round(sign * mean(filled[m].values()), 6) if filled[m] else None,
+                "prompts": len(self.values[m]),
+                "status": "winner" if m == winner else "eliminated" if m in self.eliminated else "survivor",
+                "eliminated_after_prompts": self.eliminated.get(m),
+            }
+            if m != winner:
+                entry["p_winner_better"] = round(_p_better(self._diffs(filled[winner], filled[m])), 4)
+            ranking.append(entry)
+        planned = self.n_prompts * self.n_models
+        saved = planned - self.cells_run
+        return {
+            "objective": self.objective,
+            "confidence": self.confidence,
+            "rounds": self.rounds,
+            "prompts_used": self.prompts_done,
+            # Probability the winner beats its closest rival; 1.0 with a single model
+            "ranking_confidence": min((r["p_winner_better"] for r in ranking[1:]), default=1.0),
+            "ranking": ranking,
+            "calls": {
+                "planned_cells": planned,
+                "cells_run": self.cells_run,
+                "generation_calls_saved": saved,
+                "judge_calls_saved": saved if judged else 0,
+                "saved_share": round(saved / planned, 4) if planned else 0.0,
+            },
+        }
+
+
+async def run_adaptive(n_prompts: int, models: List[dict], compute: Callable[[List[int]], Awaitable[List[dict]]],
+                       objective: str, confidence: float, judged: bool) -> dict:
+    """Race the models over the prompts; `compute(cells)` runs (or reuses) a round's cells."""
+    round_prompts = max(1, settings.EVAL_ADAPTIVE_ROUND_PROMPTS)
+    race = Race(
+        n_prompts, len(models), objective, confidence, max(2, settings.EVAL_ADAPTIVE_MIN_PROMPTS), round_prompts,
+    )
+    while True:
+        cells = race.next_cells(round_prompts)
+        if not cells:
+            break
+        race.observe(cells, await compute(cells))
+        race.eliminate()
+    return race.report([f"{m['provider']}:{m['model_id']}" for m in models], judged)
@@ -1,60 +1,152 @@
+import asyncio
 import time
 import base64
-import google.auth
-import google.auth.transport.requests
-import boto3
-from google import genai
-from google.genai import types as genai_types
-from openai import OpenAI
+import hashlib
+import json
+import threading
+from datetime import datetime, timezone
 from app.core.config import settings
-from app.core.model_matrix import get_gateway, MODEL_REGION_MAP
+from app.core.cache import cache, cache_key
+from app.core.metrics import record_llm_call, record_llm_error
+from app.core.timing import span
+from app.services.connection_manager import connection_manager
+from app.services.pricing_service import PricingService
+from app.services.region_service import region_router, vertex_root
+from app.services.replay_service import cassette_key, replay_service
+from app.services.token_service import token_estimator
+from app.core.model_matrix import get_gateway, get_generation_profile
 
-# Meta models need specific regions on Vertex AI
-META_REGION_MAP = {
-    "meta/llama-3.3-70b-instruct-maas": "us-central1",
-    "meta/llama-4-scout-17b-16e-instruct-maas": "us-east5",
-}
+# Gemini models that cannot switch thinking off entirely
+GEMINI_MIN_THINKING_BUDGET = {"gemini-2.5-pro": 128}
+
+# OpenAI models without `response_format` support (structured output falls back to extraction)
+# or the system role (a system prompt is sent at the top of the user message)
+OPENAI_NO_RESPONSE_FORMAT = ("o1-preview", "o1-mini")
+
+# Bedrock models that can be forced to answer through a tool, giving schema-shaped JSON
+BEDROCK_TOOL_SCHEMA_PREFIXES = ("amazon.nova", "us.amazon.nova", "anthropic.claude", "us.anthropic.claude")
+
+# Bedrock models that accept a `cachePoint` after the system prompt (Converse prompt caching)
+BEDROCK_PROMPT_CACHE_PREFIXES = ("amazon.nova", "us.amazon.nova", "anthropic.claude", "us.anthropic.claude")
 
 
 class AIService:
-    """Unified AI service that routes requests to the correct provider SDK."""
+    """Unified AI service that routes requests to the correct provider SDK.
+
+    Provider SDKs are imported and their clients built on first use (or during
+    startup warm-up for configured gateways), so a deployment only pays for the
+    providers it actually calls.
+    """
 
     def __init__(self):
-        # Google Gemini client via Vertex AI
-        self._vertex_genai_client = genai.Client(
-            vertexai=True,
-            api_key=settings.GOOGLE_API_KEY,
-        )
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._google_creds = None
 
-        # OpenAI direct client
-        self._openai_client = OpenAI(api_key=settings.OPENAI_API_KEY)
+    def _client(self, gateway: str, *variant):
+        """Return the client for a gateway, building it on first use.
 
-        # Meta Llama client (Vertex AI OpenAI-compatible endpoint)
-        self._meta_client = None  # Lazy init because OAuth token expires
+        `variant` (e.g. region and retry policy for Bedrock) is passed to the builder
+        and keys a separate client.
+        """
+        key = (gateway, *variant) if variant else gateway
+        client = self._clients.get(key)
+        if client is None:
+            with span("client"), self._lock:
+                client = self._clients.get(key)
+                if client is None:
+                    client = self._clients[key] = _CLIENT_BUILDERS[gateway](*variant)
+        return client
 
-        # AWS Bedrock client
-        self._bedrock_client = boto3.client(
-            service_name="bedrock-runtime",
-            region_name=settings.AWS_REGION,
-            aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
-            aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
-        )
+    def configured_gateways(self) -> list:
+        """Gateways whose credentials are present in settings."""
+        gateways = []
+        if settings.GOOGLE_API_KEY:
+            gateways.append("vertex_genai")
+        if settings.OPENAI_API_KEY:
+            gateways.append("openai_direct")
+        if settings.AWS_ACCESS_KEY_ID:
+            gateways.append("bedrock")
+        return gateways
 
-    def _get_meta_client(self, model_id: str) -> OpenAI:
-        """Create/refresh the Meta Llama client with fresh OAuth token and correct region."""
-        creds, _ = google.auth.default()
-        auth_req = google.auth.transport.requests.Request()
-        creds.refresh(auth_req)
+    def regional_gateways(self) -> list:
+        """Configured gateways whose calls are routed per region (see region_service)."""
+        gateways = ["bedrock"] if settings.AWS_ACCESS_KEY_ID else []
+        if settings.GOOGLE_CLOUD_PROJECT:
+            gateways += ["vertex_openai", "vertex_openai_deepseek"]
+        return gateways
 
-        region = META_REGION_MAP.get(model_id, "us-central1")
-        return OpenAI(
-            base_url=f"https://{region}-aiplatform.googleapis.com/v1beta1/projects/{settings.GOOGLE_CLOUD_PROJECT}/locations/{region}/endpoints/openapi",
-            api_key=creds.token,
-        )
+    def warm_up(self) -> list:
+        """Build clients for configured gateways. Failures are reported, not raised."""
+        warmed = []
+        for gateway in self.configured_gateways():
+            try:
+                if gateway == "bedrock":
+                    # One client per candidate region, so failover never waits on client setup
+                    for region in region_router.regions(gateway, ""):
+                        self._client(gateway, region, True)
+                else:
+                    self._client(gateway)
+                warmed.append(gateway)
+            except Exception as e:
+                print(f"WARNING: could not initialise {gateway} gateway: {e}")
+        if settings.GOOGLE_CLOUD_PROJECT:
+            # Vertex MaaS clients carry a short-lived token, so only the SDKs are preloaded
+            import google.auth.transport.requests  # noqa: F401
+            import openai  # noqa: F401
+        return warmed
+
+    def _google_access_token(self) -> str:
+        """OAuth token for Vertex MaaS endpoints, refreshed only when it is about to expire.
+
+        The token is kept in the shared cache until five minutes before expiry, so
+        one refresh serves every worker.
+        """
+        if settings.GOOGLE_ACCESS_TOKEN:
+            return settings.GOOGLE_ACCESS_TOKEN
+        key = cache_key(settings.GOOGLE_CLOUD_PROJECT)
+        token = cache.get("oauth", key)
+        if token:
+            return token
+
+        import google.auth
+        import google.auth.transport.requests
+
+        with span("auth"), self._lock:
+            if self._google_creds is None:
+                self._google_creds, _ = google.auth.default(
+                    scopes=["https://www.googleapis.com/auth/cloud-platform"]
+                )
+            creds = self._google_creds
+            if not creds.valid:
+                creds.refresh(google.auth.transport.requests.Request())
+            if creds.expiry:
+                # google-auth expiries are naive UTC
+                ttl = (creds.expiry - datetime.now(timezone.utc).replace(tzinfo=None)).total_seconds() - 300
+                if ttl > 0:
+                    cache.set("oauth", key, creds.token, ttl)
+            return creds.token
+
+    def _vertex_openai_client(self, region: str, sdk_retries: bool = True):
+        """OpenAI-compatible Vertex MaaS client for a region, on the shared connection pool."""
+        from openai import OpenAI
+
+        root = vertex_root(region)
+        token = self._google_access_token()
+        with span("client"):
+            return OpenAI(
+                base_url=f"{root}/v1beta1/projects/{settings.GOOGLE_CLOUD_PROJECT}/locations/{region}/endpoints/openapi",
+                api_key=token,
+                http_client=connection_manager.http_client(),
+                # Without SDK retries a failing region hands over to the next candidate at once
+                max_retries=2 if sdk_retries else 0,
+            )
 
     async def generate(
         self, provider: str, model_id: str, prompt: str,
-        image_bytes: bytes = None, mime_type: str = None
+        image_bytes: bytes = None, mime_type: str = None,
+        system_prompt: str = None, task: str = None, overrides: dict = None,
+        response_schema: dict = None,
     ) -> dict:
         """
         Route to the correct provider and return a normalized response.
@@ -65,192 +157,449 @@ class AIService:
             prompt: Text prompt
             image_bytes: Optional raw image bytes for vision tasks
             mime_type: Image MIME type (e.g. "image/png")
+            system_prompt: Optional fixed instructions, sent as a stable system/prefix
+                segment so providers can serve it from their prompt cache
+            task: Use case or internal task ("classify", "judge", ...) selecting the
+                generation profile (max tokens, temperature, stop sequences)
+            overrides: Per-request generation parameters that win over the profile
+            response_schema: JSON Schema for the answer. Enforced natively where the
+                gateway supports it (Gemini response schema, OpenAI json_schema
+                response format, Bedrock forced tool use); the parsed value is then
+                returned in "parsed". Elsewhere callers extract JSON from "text".
         
         Returns:
             {
                 "text": str,
-                "input_tokens": int,
+                "input_tokens": int,          # Total prompt tokens, including cached ones
+                "cached_input_tokens": int,   # Served from the provider's prompt cache
                 "output_tokens": int,
                 "latency_ms": int,
+                "cost": float,
+                "tokens_estimated": bool,   # True if the provider omitted usage
+                "predicted_cost": float,    # Pre-flight upper bound
+                "parsed": Any,              # Only for natively structured responses
             }
+
+        Raises:
+            ContextWindowExceeded: the prompt cannot fit the model's context window
+                (checked locally, before anything is sent, when ENFORCE_CONTEXT_WINDOW is set).
         """
+        with span("preflight"):
+            profile = get_generation_profile(model_id, task, overrides)
+            preflight = token_estimator.preflight(
+                model_id, prompt, has_image=image_bytes is not None,
+                max_output_tokens=profile["max_tokens"], system_prompt=system_prompt,
+            )
+            if settings.ENFORCE_CONTEXT_WINDOW:
+                token_estimator.check(preflight)
+
         gateway = get_gateway(provider)
-        start_time = time.time()
+        key = None
+        if settings.GATEWAY_MODE != "live":
+            key = cassette_key(
+                provider, model_id, prompt, image_bytes,
+                mime_type=mime_type, system_prompt=system_prompt, profile=profile,
+                response_schema=response_schema,
+            )
+        start_time = time.perf_counter()
+
+        try:
+            if gateway == "replay":
+                result = await replay_service.replay(key)
+            else:
+                # SDK calls are blocking: run them in the worker pool so concurrent requests
+                # actually overlap and the shared connection pools are used in parallel.
+                result = await asyncio.to_thread(
+                    self._dispatch, gateway, model_id, prompt, image_bytes, mime_type,
+                    system_prompt, profile, response_schema,
+                )
+        except Exception as e:
+            record_llm_error(provider, gateway, model_id, e)
+            raise
 
+        elapsed = time.perf_counter() - start_time
+        result["latency_ms"] = int(elapsed * 1000)
+        self._reconcile_usage(result, model_id, preflight, has_image=image_bytes is not None)
+        with span("price"):
+            result.setdefault("cached_input_tokens", 0)
+            result.setdefault("cache_write_tokens", 0)
+            result["cost"] = PricingService.calculate_cost(
+                model_id, result["input_tokens"], result["output_tokens"],
+                result["cached_input_tokens"], result["cache_write_tokens"],
+            )
+        record_llm_call(
+            provider, gateway, model_id, elapsed,
+            result["input_tokens"], result["output_tokens"], result["cost"], result["cached_input_tokens"],
+        )
+        if settings.GATEWAY_MODE == "record":
+            await asyncio.to_thread(replay_service.record, key, provider, model_id, result)
+        return result
+
+    @staticmethod
+    def _reconcile_usage(result: dict, model_id: str, preflight, has_image: bool):
+        """Fill in usage the provider omitted, and calibrate the estimator on usage it reported."""
+        result["predicted_cost"] = preflight.predicted_cost
+        result["tokens_estimated"] = False
+        if not result.get("input_tokens"):
+            result["input_tokens"] = preflight.input_tokens
+            result["tokens_estimated"] = True
+        elif not has_image and not result.get("recorded_latency_ms"):
+            token_estimator.observe(model_id, preflight.raw_input_tokens, result["input_tokens"])
+        if result.get("output_tokens") is None:
+            result["output_tokens"] = token_estimator.estimate(result.get("text") or "", model_id)
+            result["tokens_estimated"] = True
+
+    def _dispatch(self, gateway: str, model_id: str, prompt: str, image_bytes: bytes = None,
+                  mime_type: str = None, system_prompt: str = None, profile: dict = None,
+                  response_schema: dict = None) -> dict:
+        profile = profile or get_generation_profile(model_id)
         if gateway == "vertex_genai":
-            result = self._call_gemini(model_id, prompt, image_bytes, mime_type)
+            result = self._call_gemini(model_id, prompt, profile, image_bytes, mime_type, system_prompt, response_schema)
         elif gateway == "openai_direct":
-            result = self._call_openai(model_id, prompt, image_bytes, mime_type)
+            result = self._call_openai(model_id, prompt, profile, image_bytes, mime_type, system_prompt, response_schema)
+        # Regional gateways run in the fastest healthy candidate region, failing over on capacity errors
         elif gateway == "vertex_openai":
-            result = self._call_meta(model_id, prompt, image_bytes, mime_type)
+            result = region_router.call(gateway, model_id, lambda region, last: self._call_meta(
+                model_id, prompt, profile, image_bytes, mime_type, system_prompt, region=region, sdk_retries=last,
+            ))
         elif gateway == "bedrock":
-            result = self._call_bedrock(model_id, prompt, image_bytes, mime_type)
+            result = region_router.call(gateway, model_id, lambda region, last: self._call_bedrock(
+                model_id, prompt, profile, image_bytes, mime_type, system_prompt, response_schema,
+                region=region, sdk_retries=last,
+            ))
         elif gateway == "vertex_openai_deepseek":
-            result = self._call_deepseek(model_id, prompt)
+            result = region_router.call(gateway, model_id, lambda region, last: self._call_deepseek(
+                model_id, prompt, profile, system_prompt, region=region, sdk_retries=last,
+            ))
         else:
             raise ValueError(f"Unknown gateway: {gateway}")
-
-        elapsed_ms = int((time.time() - start_time) * 1000)
-        result["latency_ms"] = elapsed_ms
         return result
 
-    def _call_gemini(self, model_id: str, prompt: str, image_bytes: bytes = None, mime_type: str = None) -> dict:
+    def _gemini_cached_content(self, client, model_id: str, system_prompt: str):
+        """Explicit Gemini context cache for a long system prompt, or None to rely on implicit caching.
+
+        Explicit caches have a minimum size and bill storage per hour, so only
+        prefixes of at least GEMINI_CONTEXT_CACHE_MIN_TOKENS are cached. A
+        failed creation is remembered for one TTL rather than retried per call.
+        Cache names live in the shared cache so workers reuse one cached content.
+        """
+        from google.genai import types as genai_types
+
+        if token_estimator.estimate(system_prompt, model_id) < settings.GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        key = cache_key(model_id, system_prompt)
+        name = cache.get("gemini_context", key)
+        if name is not None:
+            return name or None
+        ttl = settings.GEMINI_CONTEXT_CACHE_TTL
+        try:
+            with span("cache_create"):
+                cached = client.caches.create(
+                    model=model_id,
+                    config=genai_types.CreateCachedContentConfig(system_instruction=system_prompt, ttl=f"{ttl}s"),
+                )
+            name = cached.name
+        except Exception as e:
+            print(f"WARNING: Gemini context cache unavailable for {model_id}: {e}")
+            name = None
+        # Expire our entry a minute before the server-side cache does
+        cache.set("gemini_context", key, name or "", ttl - 60)
+        return name
+
+    def _call_gemini(self, model_id: str, prompt: str, profile: dict, image_bytes: bytes = None,
+                     mime_type: str = None, system_prompt: str = None, response_schema: dict = None) -> dict:
         """Call Google Gemini via standard AI SDK (Original Implementation)."""
+        from google.genai import types as genai_types
+
         try:
-            if image_bytes and mime_type:
-                # Vision: pass raw bytes and mime type directly
-                contents = [
-                    genai_types.Content(
-                        role="user",
-                        parts=[
-                            genai_types.Part.from_text(text=prompt),
-                            genai_types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
-                        ],
-                    )
-                ]
-            else:
-                contents = prompt
+            client = self._client("vertex_genai")
+            cached_content = None
+            if system_prompt and settings.PROMPT_CACHE_ENABLED:
+                cached_content = self._gemini_cached_content(client, model_id, system_prompt)
 
-            response = self._vertex_genai_client.models.generate_content(
-                model=model_id,
-                contents=contents,
-                config=genai_types.GenerateContentConfig(
-                    max_output_tokens=1024,
-                    temperature=0.7,
-                ),
-            )
-            
-            # Simple token extraction (approximated for SDK consistency)
-            return {
-                "text": response.text,
-                "input_tokens": getattr(response.usage_metadata, "prompt_token_count", 0),
-                "output_tokens": getattr(response.usage_metadata, "candidates_token_count", 0),
-            }
+            with span("encode"):
+                if image_bytes and mime_type:
+                    # Vision: pass raw bytes and mime type directly
+                    contents = [
+                        genai_types.Content(
+                            role="user",
+                            parts=[
+                                genai_types.Part.from_text(text=prompt),
+                                genai_types.Part.from_bytes(data=image_bytes, mime_type=mime_type),
+                            ],
+                        )
+                    ]
+                else:
+                    contents = prompt
+                # Thinking tokens count against max_output_tokens on Gemini 2.5, so a
+                # fixed thinking budget is added on top of the visible output limit
+                max_output_tokens = profile["max_tokens"]
+                thinking = None
+                budget = profile.get("thinking_budget")
+                if budget is not None and "gemini-2.5" in model_id:
+                    budget = max(budget, GEMINI_MIN_THINKING_BUDGET.get(model_id, 0))
+                    thinking = genai_types.ThinkingConfig(thinking_budget=budget)
+                    max_output_tokens += budget
+                config = genai_types.GenerateContentConfig(
+                    max_output_tokens=max_output_tokens,
+                    temperature=profile["temperature"],
+                    stop_sequences=profile["stop"],
+                    thinking_config=thinking,
+                    # A fixed system instruction is a stable prefix for implicit caching
+                    system_instruction=None if cached_content else system_prompt,
+                    cached_content=cached_content,
+                    response_mime_type="application/json" if response_schema else None,
+                    response_json_schema=response_schema,
+                )
+
+            with span("provider_call"):
+                response = client.models.generate_content(
+                    model=model_id,
+                    contents=contents,
+                    config=config,
+                )
+
+            with span("parse"):
+                # usage_metadata can be missing; None lets generate() fill in local estimates
+                usage = response.usage_metadata
+                return {
+                    "text": response.text,
+                    "input_tokens": getattr(usage, "prompt_token_count", None),
+                    "cached_input_tokens": getattr(usage, "cached_content_token_count", None) or 0,
+                    "output_tokens": getattr(usage, "candidates_token_count", None),
+                    "parsed": _json_or_none(response.text) if response_schema else None,
+                }
         except Exception as e:
             print(f"ERROR: Google Gemini SDK call failed: {str(e)}")
             raise ValueError(f"Google Gemini SDK error: {str(e)}")
 
-    def _call_openai(self, model_id: str, prompt: str, image_bytes: bytes = None, mime_type: str = None) -> dict:
-        """Call OpenAI directly. Supports vision with base64 image."""
-        if image_bytes and mime_type:
-            # Vision: encode image to base64 server-side and send in message
-            b64_image = base64.b64encode(image_bytes).decode("utf-8")
-            messages = [{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{mime_type};base64,{b64_image}",
+    @staticmethod
+    def _openai_messages(prompt: str, image_bytes: bytes = None, mime_type: str = None,
+                         system_prompt: str = None, system_role: bool = True) -> list:
+        """Build OpenAI chat messages; images are base64-encoded server-side as data URLs.
+
+        A system prompt goes first so it forms the cacheable prefix of every request:
+        as a system message, or without `system_role` ahead of the prompt in the user message.
+        """
+        if system_prompt and not system_role:
+            prompt, system_prompt = f"{system_prompt}\n\n{prompt}", None
+        system = [{"role": "system", "content": system_prompt}] if system_prompt else []
+        with span("encode"):
+            if image_bytes and mime_type:
+                b64_image = base64.b64encode(image_bytes).decode("utf-8")
+                return system + [{
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:{mime_type};base64,{b64_image}",
+                            },
                         },
-                    },
-                ],
-            }]
-        else:
-            messages = [{"role": "user", "content": prompt}]
+                    ],
+                }]
+            return system + [{"role": "user", "content": prompt}]
 
-        response = self._openai_client.chat.completions.create(
-            model=model_id,
-            messages=messages,
-        )
-        return {
-            "text": response.choices[0].message.content,
-            "input_tokens": response.usage.prompt_tokens,
-            "output_tokens": response.usage.completion_tokens,
-        }
+    @staticmethod
+    def _openai_params(profile: dict, max_tokens_field: str = "max_tokens") -> dict:
+        """Generation profile as OpenAI chat-completions parameters (unset values are omitted)."""
+        params = {max_tokens_field: profile["max_tokens"], "temperature": profile["temperature"], "stop": profile["stop"]}
+        return {k: v for k, v in params.items() if v is not None}
 
-    def _call_meta(self, model_id: str, prompt: str, image_bytes: bytes = None, mime_type: str = None) -> dict:
-        """Call Meta Llama via Vertex AI OpenAI-compatible endpoint. Supports vision with Llama 4 Scout."""
-        client = self._get_meta_client(model_id)
-
-        if image_bytes and mime_type:
-            # Vision: Llama 4 Scout supports OpenAI-style image_url with base64
-            b64_image = base64.b64encode(image_bytes).decode("utf-8")
-            messages = [{
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:{mime_type};base64,{b64_image}",
-                        },
-                    },
-                ],
-            }]
-        else:
-            messages = [{"role": "user", "content": prompt}]
+    @staticmethod
+    def _openai_result(response) -> dict:
+        with span("parse"):
+            usage = response.usage
+            details = getattr(usage, "prompt_tokens_details", None)
+            return {
+                "text": response.choices[0].message.content,
+                "input_tokens": getattr(usage, "prompt_tokens", None),
+                "cached_input_tokens": getattr(details, "cached_tokens", None) or 0,
+                "output_tokens": getattr(usage, "completion_tokens", None),
+            }
 
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=messages,
-            max_tokens=1024,
+    def _call_openai(self, model_id: str, prompt: str, profile: dict, image_bytes: bytes = None,
+                     mime_type: str = None, system_prompt: str = None, response_schema: dict = None) -> dict:
+        """Call OpenAI directly. Supports vision with base64 image."""
+        messages = self._openai_messages(
+            prompt, image_bytes, mime_type, system_prompt, system_role=model_id not in OPENAI_NO_RESPONSE_FORMAT,
         )
-        return {
-            "text": response.choices[0].message.content,
-            "input_tokens": response.usage.prompt_tokens,
-            "output_tokens": response.usage.completion_tokens,
-        }
+        client = self._client("openai_direct")
+        # max_completion_tokens also covers the hidden reasoning tokens of o-series models
+        extra = self._openai_params(profile, "max_completion_tokens")
+        if system_prompt and settings.PROMPT_CACHE_ENABLED:
+            # Routes requests sharing the prefix to the same cache shard
+            extra["prompt_cache_key"] = hashlib.sha256(system_prompt.encode()).hexdigest()[:16]
+        structured = bool(response_schema) and model_id not in OPENAI_NO_RESPONSE_FORMAT
+        if structured:
+            extra["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": response_schema, "strict": True},
+            }
+        with span("provider_call"):
+            response = client.chat.completions.create(
+                model=model_id,
+                messages=messages,
+                **extra,
+            )
+        result = self._openai_result(response)
+        if structured:
+            result["parsed"] = _json_or_none(result["text"])
+        return result
+
+    def _call_meta(self, model_id: str, prompt: str, profile: dict, image_bytes: bytes = None,
+                   mime_type: str = None, system_prompt: str = None, region: str = "us-central1",
+                   sdk_retries: bool = True) -> dict:
+        """Call Meta Llama via Vertex AI OpenAI-compatible endpoint. Supports vision with Llama 4 Scout."""
+        client = self._vertex_openai_client(region, sdk_retries)
+        # Llama 4 Scout supports OpenAI-style image_url with base64
+        messages = self._openai_messages(prompt, image_bytes, mime_type, system_prompt)
+        with span("provider_call"):
+            response = client.chat.completions.create(
+                model=model_id,
+                messages=messages,
+                **self._openai_params(profile),
+            )
+        return self._openai_result(response)
 
-    def _call_bedrock(self, model_id: str, prompt: str, image_bytes: bytes = None, mime_type: str = None) -> dict:
+    def _call_bedrock(self, model_id: str, prompt: str, profile: dict, image_bytes: bytes = None,
+                      mime_type: str = None, system_prompt: str = None, response_schema: dict = None,
+                      region: str = None, sdk_retries: bool = True) -> dict:
         """Call Mistral/Amazon via AWS Bedrock Converse API. Supports vision with image bytes."""
-        content = [{"text": prompt}]
-
-        if image_bytes and mime_type:
-            # Map MIME to Bedrock format (jpeg, png, gif, webp)
-            fmt = mime_type.split("/")[-1]
-            if fmt == "jpg":
-                fmt = "jpeg"
-            content.insert(0, {
-                "image": {
-                    "format": fmt,
-                    "source": {"bytes": image_bytes},
-                }
-            })
+        with span("encode"):
+            content = [{"text": prompt}]
 
-        response = self._bedrock_client.converse(
-            modelId=model_id,
-            messages=[
-                {
-                    "role": "user",
-                    "content": content,
+            if image_bytes and mime_type:
+                # Map MIME to Bedrock format (jpeg, png, gif, webp)
+                fmt = mime_type.split("/")[-1]
+                if fmt == "jpg":
+                    fmt = "jpeg"
+                content.insert(0, {
+                    "image": {
+                        "format": fmt,
+                        "source": {"bytes": image_bytes},
+                    }
+                })
+
+            inference = {"maxTokens": profile["max_tokens"]}
+            if profile["temperature"] is not None:
+                inference["temperature"] = profile["temperature"]
+            if profile["stop"]:
+                inference["stopSequences"] = profile["stop"]
+
+            extra = {}
+            if system_prompt:
+                extra["system"] = [{"text": system_prompt}]
+                if settings.PROMPT_CACHE_ENABLED and model_id.startswith(BEDROCK_PROMPT_CACHE_PREFIXES):
+                    extra["system"].append({"cachePoint": {"type": "default"}})
+            if response_schema and model_id.startswith(BEDROCK_TOOL_SCHEMA_PREFIXES):
+                # Forcing a single tool makes the model answer with schema-shaped tool input
+                extra["toolConfig"] = {
+                    "tools": [{"toolSpec": {
+                        "name": "respond",
+                        "description": "Return the answer in the required structure.",
+                        "inputSchema": {"json": response_schema},
+                    }}],
+                    "toolChoice": {"tool": {"name": "respond"}},
                 }
-            ],
-            inferenceConfig={"maxTokens": 1024},
-        )
-        text = response["output"]["message"]["content"][0]["text"]
-        usage = response["usage"]
-        return {
-            "text": text,
-            "input_tokens": usage["inputTokens"],
-            "output_tokens": usage["outputTokens"],
-        }
-
-    def _call_deepseek(self, model_id: str, prompt: str) -> dict:
+
+        client = self._client("bedrock", region or settings.AWS_REGION, sdk_retries)
+        with span("provider_call"), connection_manager.track(connection_manager.bedrock_stats):
+            response = client.converse(
+                modelId=model_id,
+                messages=[
+                    {
+                        "role": "user",
+                        "content": content,
+                    }
+                ],
+                inferenceConfig=inference,
+                **extra,
+            )
+        with span("parse"):
+            blocks = response["output"]["message"]["content"]
+            parsed = next((b["toolUse"]["input"] for b in blocks if "toolUse" in b), None)
+            if parsed is not None:
+                text = json.dumps(parsed)
+            else:
+                text = "".join(b.get("text", "") for b in blocks)
+            usage = response["usage"]
+            # Converse reports cache reads/writes separately from inputTokens
+            cache_read = usage.get("cacheReadInputTokens", 0)
+            cache_write = usage.get("cacheWriteInputTokens", 0)
+            return {
+                "text": text,
+                "input_tokens": usage["inputTokens"] + cache_read + cache_write,
+                "cached_input_tokens": cache_read,
+                "cache_write_tokens": cache_write,
+                "output_tokens": usage["outputTokens"],
+                "parsed": parsed,
+            }
+
+    def _call_deepseek(self, model_id: str, prompt: str, profile: dict, system_prompt: str = None,
+                       region: str = "global", sdk_retries: bool = True) -> dict:
         """Call DeepSeek via Vertex AI OpenAI-compatible endpoint. No vision support."""
-        creds, _ = google.auth.default()
-        auth_req = google.auth.transport.requests.Request()
-        creds.refresh(auth_req)
+        client = self._vertex_openai_client(region, sdk_retries)
+        messages = self._openai_messages(prompt, system_prompt=system_prompt)
+        with span("provider_call"):
+            response = client.chat.completions.create(
+                model=model_id,
+                messages=messages,
+                **self._openai_params(profile),
+            )
+        return self._openai_result(response)
 
-        region = MODEL_REGION_MAP.get(model_id, "global")
-        if region == "global":
-            base_url = f"https://aiplatform.googleapis.com/v1beta1/projects/{settings.GOOGLE_CLOUD_PROJECT}/locations/global/endpoints/openapi"
-        else:
-            base_url = f"https://{region}-aiplatform.googleapis.com/v1beta1/projects/{settings.GOOGLE_CLOUD_PROJECT}/locations/{region}/endpoints/openapi"
 
-        client = OpenAI(base_url=base_url, api_key=creds.token)
-        response = client.chat.completions.create(
-            model=model_id,
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=1024,
-        )
-        return {
-            "text": response.choices[0].message.content,
-            "input_tokens": response.usage.prompt_tokens,
-            "output_tokens": response.usage.completion_tokens,
-        }
+def _json_or_none(text: str):
+    try:
+        return json.loads(text) if text else None
+    except json.JSONDecodeError:
+        return None
+
+
+def _build_genai_client():
+    from google import genai
+    from google.genai import types as genai_types
+    return genai.Client(
+        vertexai=True,
+        api_key=settings.GOOGLE_API_KEY,
+        http_options=genai_types.HttpOptions(
+            base_url=settings.GENAI_BASE_URL or None,
+            httpx_client=connection_manager.http_client(),
+        ),
+    )
+
+
+def _build_openai_client():
+    from openai import OpenAI
+    return OpenAI(
+        api_key=settings.OPENAI_API_KEY,
+        base_url=settings.OPENAI_BASE_URL or None,
+        http_client=connection_manager.http_client(),
+    )
+
+
+def _build_bedrock_client(region: str = None, sdk_retries: bool = True):
+    import boto3
+    return boto3.client(
+        service_name="bedrock-runtime",
+        region_name=region or settings.AWS_REGION,
+        aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
+        aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
+        endpoint_url=settings.BEDROCK_ENDPOINT_URL or None,
+        # A region that is not the last candidate fails fast so the next one is tried at once
+        config=connection_manager.botocore_config(max_attempts=3 if sdk_retries else 1),
+    )
+
+
+# Gateway name → client factory. Vertex MaaS gateways build per-call clients.
+_CLIENT_BUILDERS = {
+    "vertex_genai": _build_genai_client,
+    "openai_direct": _build_openai_client,
+    "bedrock": _build_bedrock_client,
+}
 
 
-# Singleton instance
+# Singleton instance (cheap: no SDK is imported until a gateway is used)
 ai_service = AIService()
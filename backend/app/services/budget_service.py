@@ -0,0 +1,381 @@
+"""
+Budget Service — per-API-key and per-team spend quotas, shared by every worker on the host.
+
+Limits come from the JSON file named by BUDGETS_FILE:
+
+    {
+      "default": {"per_request": 0.02, "daily": 1.0, "monthly": 20.0},
+      "teams":   {"research": {"daily": 50.0, "monthly": 1000.0}},
+      "keys":    {"<api key>": {"name": "alice", "team": "research", "per_request": 0.25, "daily": 10.0}}
+    }
+
+Callers identify themselves with the X-API-Key header; unknown or missing keys
+fall under "default". A request reserves its predicted (worst-case) cost
+against every scope it belongs to before dispatch and settles the actual cost
+afterwards, so concurrent requests cannot overspend a budget.
+
+Spend and open holds live in a WAL-mode SQLite ledger at BUDGET_LEDGER_PATH.
+Each check-and-reserve is a single write transaction, so all uvicorn workers
+on a host share one budget and checks never add a network round trip. Workers
+on different hosts do not share the file, so each host enforces its limits on
+its own. A hold whose worker died stops counting after BUDGET_HOLD_TTL seconds.
+Request handlers use the `a`-prefixed methods, which run ledger transactions in
+a worker thread so a contended ledger lock never blocks the event loop.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from fastapi import Header, HTTPException
+from app.core.config import settings
+from app.core.metrics import BUDGET_REJECTIONS
+
+
+class BudgetExceeded(Exception):
+    """A request's predicted cost does not fit one of the caller's budgets."""
+
+    def __init__(self, message: str, status_code: int = 429, retry_after: int = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+    def to_http(self) -> HTTPException:
+        headers = {"Retry-After": str(self.retry_after)} if self.retry_after else None
+        return HTTPException(status_code=self.status_code, detail=str(self), headers=headers)
+
+
+@dataclass
+class Limits:
+    per_request: Optional[float] = None
+    daily: Optional[float] = None
+    monthly: Optional[float] = None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Limits":
+        return cls(data.get("per_request"), data.get("daily"), data.get("monthly"))
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ledger (
+    scope TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    day_spend REAL NOT NULL,
+    month TEXT NOT NULL,
+    month_spend REAL NOT NULL,
+    requests INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS holds (
+    id INTEGER PRIMARY KEY,
+    scope TEXT NOT NULL,
+    amount REAL NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS holds_scope ON holds (scope, expires_at);
+"""
+
+# Day and month windows roll over by comparing the stored period with the current one
+_SETTLE = """
+INSERT INTO ledger (scope, day, day_spend, month, month_spend, requests) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT (scope) DO UPDATE SET
+    day_spend = CASE WHEN day = excluded.day THEN day_spend + excluded.day_spend ELSE excluded.day_spend END,
+    day = excluded.day,
+    month_spend = CASE WHEN month = excluded.month THEN month_spend + excluded.month_spend
+                       ELSE excluded.month_spend END,
+    month = excluded.month,
+    requests = requests + excluded.requests
+"""
+
+
+def _periods(now: datetime) -> tuple:
+    return now.strftime("%Y-%m-%d"), now.strftime("%Y-%m")
+
+
+def _seconds_until_tomorrow(now: datetime) -> int:
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((tomorrow - now).total_seconds()) + 1
+
+
+def _seconds_until_next_month(now: datetime) -> int:
+    first = (now.replace(day=28) + timedelta(days=4)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return int((first - now).total_seconds()) + 1
+
+
+class Hold:
+    """A reservation against an account; settle with the actual cost or release on exit."""
+
+    def __init__(self, account: "BudgetAccount", amount: float, hold_ids: list):
+        self.account = account
+        self.amount = amount
+        self._hold_ids = hold_ids
+        self._open = True
+
+    def settle(self, actual_cost: float):
+        if self._open:
+            self._open = False
+            self.account._service._settle(self.account.scopes, self._hold_ids, actual_cost)
+
+    def release(self):
+        if self._open:
+            self._open = False
+            self.account._service._settle(self.account.scopes, self._hold_ids, 0.0, count=False)
+
+    async def asettle(self, actual_cost: float):
+        if self._open and self.account.limited:
+            await asyncio.to_thread(self.settle, actual_cost)
+        else:
+            self.settle(actual_cost)
+
+    async def arelease(self):
+        if self._open and self.account.limited:
+            await asyncio.to_thread(self.release)
+        else:
+            self.release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.arelease()
+
+
+class BudgetAccount:
+    """The budget scopes (key, team or default) a request is charged against."""
+
+    def __init__(self, service: "BudgetService", name: str, scopes: list):
+        self._service = service
+        self.name = name
+        self.scopes = scopes   # [(scope_id, Limits)]
+
+    @property
+    def limited(self) -> bool:
+        return bool(self.scopes)
+
+    def remaining(self) -> Optional[float]:
+        """Largest cost the next request may have; None if unlimited."""
+        return self._service._remaining(self.scopes)[0]
+
+    async def aremaining(self) -> Optional[float]:
+        return await asyncio.to_thread(self.remaining) if self.limited else None
+
+    def allows(self, amount: float) -> bool:
+        remaining = self.remaining()
+        return remaining is None or amount <= remaining
+
+    def reserve(self, amount: float, per_request: bool = True) -> Hold:
+        """Hold `amount` against every scope. per_request=False checks only the daily and
+        monthly windows, for work that spans many calls (evaluation batches)."""
+        return Hold(self, amount, self._service._reserve(self.scopes, amount, per_request))
+
+    async def areserve(self, amount: float, per_request: bool = True) -> Hold:
+        if not self.limited:
+            return Hold(self, amount, [])
+        return await asyncio.to_thread(self.reserve, amount, per_request)
+
+    def charge(self, amount: float):
+        """Record spend that was not reserved up front."""
+        self._service._settle(self.scopes, [], amount)
+
+
+class BudgetService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self._default = None
+        self._teams = {}
+        self._keys = {}
+        self.enabled = False
+
+    # ── Configuration ───────────────────────────────────────
+
+    def load(self):
+        """Read limits from BUDGETS_FILE (spend is kept in the ledger)."""
+        path = settings.BUDGETS_FILE
+        if not path or not os.path.exists(path):
+            self.enabled = False
+            return
+        with open(path) as f:
+            config = json.load(f)
+        with self._lock:
+            self._default = Limits.from_dict(config["default"]) if config.get("default") else None
+            self._teams = {team: Limits.from_dict(v) for team, v in config.get("teams", {}).items()}
+            self._keys = {
+                _key_id(key): (entry.get("name", _key_id(key)), entry.get("team"), Limits.from_dict(entry))
+                for key, entry in config.get("keys", {}).items()
+            }
+            self.enabled = True
+            self._db()
+
+    def is_known_key(self, api_key: Optional[str]) -> bool:
+        return bool(api_key) and _key_id(api_key) in self._keys
+
+    def account(self, api_key: Optional[str]) -> BudgetAccount:
+        if not self.enabled:
+            return BudgetAccount(self, "anonymous", [])
+        key_id = _key_id(api_key) if api_key else None
+        if key_id in self._keys:
+            name, team, limits = self._keys[key_id]
+            scopes = [(f"key:{key_id}", limits)]
+            if team and team in self._teams:
+                scopes.append((f"team:{team}", self._teams[team]))
+            return BudgetAccount(self, name, scopes)
+        if self._default is not None:
+            return BudgetAccount(self, "default", [("default", self._default)])
+        return BudgetAccount(self, "anonymous", [])
+
+    # ── Ledger ──────────────────────────────────────────────
+
+    def _db(self) -> sqlite3.Connection:
+        """Ledger connection; callers hold self._lock. Transactions are explicit."""
+        if self._conn is None:
+            directory = os.path.dirname(settings.BUDGET_LEDGER_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(
+                settings.BUDGET_LEDGER_PATH, check_same_thread=False, timeout=10.0, isolation_level=None,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _spend(db: sqlite3.Connection, scope_id: str, now: datetime) -> tuple:
+        """(day spend, month spend, requests, pending holds) of a scope in the current windows."""
+        day, month = _periods(now)
+        row = db.execute(
+            "SELECT day, day_spend, month, month_spend, requests FROM ledger WHERE scope = ?", (scope_id,)
+        ).fetchone()
+        (pending,) = db.execute(
+            "SELECT COALESCE(SUM(amount), 0) FROM holds WHERE scope = ? AND expires_at > ?",
+            (scope_id, now.timestamp()),
+        ).fetchone()
+        if row is None:
+            return 0.0, 0.0, 0, pending
+        return (row[1] if row[0] == day else 0.0), (row[3] if row[2] == month else 0.0), row[4], pending
+
+    # ── Accounting ──────────────────────────────────────────
+
+    def _windows(self, db: sqlite3.Connection, scopes: list, now: datetime, per_request: bool = True) -> tuple:
+        """(remaining allowance, limiting window, seconds until it resets) across all scopes."""
+        best = (None, None, None)
+        for scope_id, limits in scopes:
+            day_spend, month_spend, _, pending = self._spend(db, scope_id, now)
+            windows = (
+                (limits.per_request if per_request else None, "per_request", None),
+                (None if limits.daily is None else limits.daily - day_spend - pending,
+                 "daily", _seconds_until_tomorrow(now)),
+                (None if limits.monthly is None else limits.monthly - month_spend - pending,
+                 "monthly", _seconds_until_next_month(now)),
+            )
+            for amount, window, reset in windows:
+                if amount is not None and (best[0] is None or amount < best[0]):
+                    best = (max(amount, 0.0), window, reset)
+        return best
+
+    def _remaining(self, scopes: list, now: datetime = None) -> tuple:
+        if not scopes:
+            return None, None, None
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            return self._windows(self._db(), scopes, now)
+
+    def _reserve(self, scopes: list, amount: float, per_request: bool = True) -> list:
+        """Check and hold `amount` in one write transaction (serialized across workers); hold ids."""
+        if not scopes:
+            return []
+        now = datetime.now(timezone.utc)
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM holds WHERE expires_at <= ?", (now.timestamp(),))
+                remaining, window, reset = self._windows(db, scopes, now, per_request)
+                if remaining is not None and amount > remaining:
+                    db.execute("COMMIT")
+                    BUDGET_REJECTIONS.labels(window).inc()
+                    if window == "per_request":
+                        raise BudgetExceeded(
+                            f"Predicted cost ${amount:.6f} exceeds the per-request limit of ${remaining:.6f}",
+                            status_code=402,
+                        )
+                    raise BudgetExceeded(
+                        f"{window.capitalize()} budget exhausted: ${remaining:.6f} left, "
+                        f"request needs up to ${amount:.6f}",
+                        status_code=429, retry_after=reset,
+                    )
+                expires_at = time.time() + settings.BUDGET_HOLD_TTL
+                ids = [
+                    db.execute(
+                        "INSERT INTO holds (scope, amount, expires_at) VALUES (?, ?, ?)", (scope_id, amount, expires_at)
+                    ).lastrowid
+                    for scope_id, _ in scopes
+                ]
+                db.execute("COMMIT")
+                return ids
+            except BudgetExceeded:
+                raise
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def _settle(self, scopes: list, hold_ids: list, actual: float, count: bool = True):
+        if not scopes:
+            return
+        day, month = _periods(datetime.now(timezone.utc))
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.executemany("DELETE FROM holds WHERE id = ?", [(i,) for i in hold_ids])
+                db.executemany(_SETTLE, [
+                    (scope_id, day, actual, month, actual, int(count)) for scope_id, _ in scopes
+                ])
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def snapshot(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False, "scopes": {}}
+        now = datetime.now(timezone.utc)
+        day, month = _periods(now)
+        names = {f"key:{key_id}": name for key_id, (name, _, _) in self._keys.items()}
+        with self._lock:
+            db = self._db()
+            scopes = {}
+            for (scope,) in db.execute("SELECT scope FROM ledger UNION SELECT scope FROM holds").fetchall():
+                day_spend, month_spend, requests, pending = self._spend(db, scope, now)
+                scopes[names.get(scope, scope)] = {
+                    "day": day, "day_spend": day_spend, "month": month, "month_spend": month_spend,
+                    "requests": requests, "pending": pending,
+                }
+        return {"enabled": True, "ledger": settings.BUDGET_LEDGER_PATH, "scopes": scopes}
+
+
+def _key_id(api_key: str) -> str:
+    """API keys are never stored or logged; scopes use a short hash."""
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+
+budget_service = BudgetService()
+
+
+async def budget_account(x_api_key: Optional[str] = Header(default=None)) -> BudgetAccount:
+    """FastAPI dependency resolving the caller's budget account from X-API-Key."""
+    if budget_service.enabled and settings.REQUIRE_API_KEY and not budget_service.is_known_key(x_api_key):
+        raise HTTPException(status_code=401, detail="Missing or unknown API key")
+    return budget_service.account(x_api_key)
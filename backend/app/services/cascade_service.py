@@ -0,0 +1,197 @@
+"""
+Cascade Service — answer with the cheapest capable model, escalate only when the answer is not good enough.
+
+With routing_mode="cascade", /chat builds a ladder from the MODEL_REGISTRY
+models that support the prompt's workload tags and fit its context. The
+ladder is ordered by cost_per_1k. A model only joins it if its quality_score
+beats every cheaper rung, and the best-quality model is always the last rung.
+Its length is capped at CHAT_CASCADE_MAX_TIERS by keeping the cheapest rungs
+and the top one.
+
+Each rung's answer goes through an acceptance check. Checks, in order:
+
+    empty           the answer is blank
+    truncated       the answer used the whole max_tokens budget
+    refusal         the answer opens with a refusal or a hedge
+    invalid_json    the prompt was tagged "structured output" and no JSON could be extracted
+    low_confidence  CHAT_CASCADE_VERIFIER (optional) rated the answer below
+                    CHAT_CASCADE_MIN_CONFIDENCE (1-5)
+
+A rejected answer escalates to the next rung, and so does a rung whose call
+fails (reason "error"). The last rung's answer is always returned, and its
+failure is raised. Every attempt is recorded in the request's `cascade_path`.
+Verifier calls are reserved against the caller's budgets like the rungs are.
+"""
+import re
+import time
+from contextlib import nullcontext
+from typing import AsyncContextManager, Awaitable, Callable, List, Optional
+from app.core.config import settings
+from app.core.json_extract import JSONExtractError, extract_json, structured_result
+from app.core.metrics import CHAT_CASCADE_STEPS
+from app.core.model_matrix import get_generation_profile, get_models_by_tags
+from app.services.ai_service import ai_service
+from app.services.budget_service import BudgetExceeded
+from app.services.token_service import estimate_cost
+
+_REFUSAL = re.compile(
+    r"^\s*(i'?m sorry|i am sorry|i cannot|i can'?t|i am unable|i'?m unable|i'?m not sure|i am not sure|"
+    r"as an ai\b|i don'?t know)",
+    re.I,
+)
+
+CHECK_PROMPT = """You are a strict answer checker. Rate how confident you are that the RESPONSE fully and correctly answers the PROMPT, from 1 (wrong or incomplete) to 5 (certainly correct and complete).
+
+Return ONLY a JSON object: {{"confidence": <1-5>}}
+
+PROMPT:
+{prompt}
+
+RESPONSE:
+{response}"""
+
+CHECK_SCHEMA = {
+    "type": "object",
+    "properties": {"confidence": {"type": "integer"}},
+    "required": ["confidence"],
+    "additionalProperties": False,
+}
+
+
+def build_ladder(tags: List[str], min_context: int = 0) -> List[dict]:
+    """Capable models by ascending cost, each one better than every cheaper rung."""
+    candidates = sorted(
+        get_models_by_tags(tags, min_context=min_context),
+        key=lambda m: (m["cost_per_1k"], -m["quality_score"], m["latency"]),
+    )
+    ladder = []
+    for model in candidates:
+        if not ladder or model["quality_score"] > ladder[-1]["quality_score"]:
+            ladder.append(model)
+    max_tiers = max(1, settings.CHAT_CASCADE_MAX_TIERS)
+    if len(ladder) > max_tiers:
+        ladder = ladder[:max_tiers - 1] + ladder[-1:]
+    return ladder
+
+
+def local_check(result: dict, model_id: str, tags: List[str], overrides: dict = None) -> Optional[str]:
+    """Reason to reject the answer without another model call, or None."""
+    text = result.get("text") or ""
+    if not text.strip():
+        return "empty"
+    max_tokens = get_generation_profile(model_id, tags[0], overrides).get("max_tokens")
+    if max_tokens and (result.get("output_tokens") or 0) >= max_tokens:
+        return "truncated"
+    if _REFUSAL.match(text):
+        return "refusal"
+    if "structured output" in tags:
+        try:
+            extract_json(text)
+        except JSONExtractError:
+            return "invalid_json"
+    return None
+
+
+def _verifier() -> Optional[tuple]:
+    provider, _, model_id = settings.CHAT_CASCADE_VERIFIER.partition(":")
+    return (provider, model_id) if provider and model_id else None
+
+
+async def model_check(prompt: str, text: str,
+                      reserve: Callable[[str, str], Awaitable[AsyncContextManager]] = None) -> tuple:
+    """(confidence 1-5 or None, cost, latency_ms) from the configured verifier; confidence is None
+    when it is off or fails. `reserve(model_id, check_prompt)` returns a budget hold for the call,
+    settled with its cost; a call the budget cannot cover is skipped like a failed one."""
+    verifier = _verifier()
+    if verifier is None:
+        return None, 0.0, 0
+    provider, model_id = verifier
+    check_prompt = CHECK_PROMPT.format(prompt=prompt, response=text)
+    try:
+        async with (await reserve(model_id, check_prompt) if reserve else nullcontext()) as hold:
+            result = await ai_service.generate(
+                provider, model_id, check_prompt, task="cascade_check", response_schema=CHECK_SCHEMA,
+            )
+            if hold is not None:
+                await hold.asettle(result["cost"] or estimate_cost(model_id, result["input_tokens"], result["output_tokens"]))
+    except Exception as e:
+        print(f"Cascade check failed ({provider}:{model_id}): {e}")
+        return None, 0.0, 0
+    try:
+        confidence = max(1, min(5, int(structured_result(result, "cascade_check", model_id).get("confidence"))))
+    except (JSONExtractError, AttributeError, TypeError, ValueError):
+        confidence = None
+    return confidence, result["cost"], result["latency_ms"]
+
+
+async def run_cascade(prompt: str, tags: List[str], ladder: List[dict],
+                      call: Callable[[dict], Awaitable[dict]], overrides: dict = None,
+                      reserve: Callable[[str, str], Awaitable[AsyncContextManager]] = None) -> tuple:
+    """Walk the ladder with `call(model)` until an answer is accepted; `reserve` budgets the
+    verifier's calls (see model_check).
+
+    Returns (model, result of the accepted call, cascade_path).
+    """
+    path = []
+    for tier, model in enumerate(ladder):
+        last = tier == len(ladder) - 1
+        start = time.perf_counter()
+        try:
+            result = await call(model)
+        except BudgetExceeded:
+            raise   # the next rung costs more
+        except Exception as e:
+            if last:
+                raise
+            path.append({
+                "tier": tier,
+                "provider": model["provider"],
+                "model_id": model["model_id"],
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "cost": 0.0,
+                "latency_ms": int((time.perf_counter() - start) * 1000),
+                "accepted": False,
+                "reason": "error",
+                "error": f"{type(e).__name__}: {e}",
+            })
+            CHAT_CASCADE_STEPS.labels(str(tier), "error").inc()
+            continue
+        step = {
+            "tier": tier,
+            "provider": model["provider"],
+            "model_id": model["model_id"],
+            "input_tokens": result["input_tokens"],
+            "output_tokens": result["output_tokens"],
+            "cost": result["cost"],
+            "latency_ms": result["latency_ms"],
+        }
+        reason = local_check(result, model["model_id"], tags, overrides)
+        # The verifier only runs where it can still change the outcome
+        if reason is None and not last:
+            confidence, check_cost, check_latency = await model_check(prompt, result["text"], reserve)
+            if check_latency:
+                step["check_cost"], step["check_latency_ms"] = check_cost, check_latency
+            if confidence is not None:
+                step["confidence"] = confidence
+                if confidence < settings.CHAT_CASCADE_MIN_CONFIDENCE:
+                    reason = "low_confidence"
+        step["accepted"] = reason is None or last
+        if reason:
+            step["reason"] = reason
+        CHAT_CASCADE_STEPS.labels(str(tier), "accepted" if step["accepted"] else reason).inc()
+        path.append(step)
+        if step["accepted"]:
+            return model, result, path
+    raise ValueError(f"No cascade for tags {tags}")
+
+
+def path_totals(path: List[dict]) -> dict:
+    """Tokens, spend and model latency of a whole cascade (spend and latency include verifier calls)."""
+    return {
+        "input_tokens": sum(s["input_tokens"] for s in path),
+        "output_tokens": sum(s["output_tokens"] for s in path),
+        "cost": sum(s["cost"] + s.get("check_cost", 0.0) for s in path),
+        "latency_ms": sum(s["latency_ms"] + s.get("check_latency_ms", 0) for s in path),
+    }
+
@@ -0,0 +1,106 @@
+"""
+Checkpoint Service — per-cell checkpoints that make evaluation batches resumable.
+
+`/eval/run` saves its spec (prompts, models, criteria, judge) under the batch_id
+before any call is made, and every cell is checkpointed as soon as it finishes:
+completed cells are buffered for EVAL_CHECKPOINT_FLUSH_MS and written in one
+store call, so a crashed worker or a timed-out request loses at most that
+window. `/eval/resume/{batch_id}` reads the checkpoints back and recomputes only
+the cells that are missing or failed.
+
+Cell i of a batch is prompts[i // len(models)] x models[i % len(models)].
+"""
+import asyncio
+from app.core.config import settings
+from app.services.telemetry_store import telemetry_store
+
+
+def is_failed(result: dict) -> bool:
+    return str(result.get("response", "")).startswith("Error:")
+
+
+class BatchCheckpoint:
+    """Buffers the finished cells of one running batch and writes them in the background."""
+
+    def __init__(self, batch_id: str, service: "CheckpointService"):
+        self.batch_id = batch_id
+        self.written = 0
+        self.failed_writes = 0
+        self._service = service
+        self._pending = []
+        self._flusher = None
+
+    def record(self, cell: int, result: dict):
+        """Queue a finished cell (called on the event loop as each cell completes)."""
+        self._pending.append((cell, not is_failed(result), result))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self):
+        while self._pending:
+            await asyncio.sleep(settings.EVAL_CHECKPOINT_FLUSH_MS / 1000)
+            await self._flush()
+
+    async def _flush(self):
+        cells, self._pending = self._pending, []
+        if not cells:
+            return
+        # Stores report failures by returning None; the cells then just count as missing on resume
+        if await asyncio.to_thread(telemetry_store.checkpoint_cells, self.batch_id, cells) is None:
+            self.failed_writes += len(cells)
+        else:
+            self.written += len(cells)
+
+    async def close(self):
+        """Write whatever is still buffered and release the batch."""
+        try:
+            if self._flusher is not None:
+                await self._flusher
+            await self._flush()
+        finally:
+            self._service._active.discard(self.batch_id)
+            if self.failed_writes:
+                print(f"Evaluation batch {self.batch_id}: {self.failed_writes} cell checkpoints not written")
+
+
+class CheckpointService:
+    def __init__(self):
+        self._active = set()   # Batches running in this worker
+
+    def open(self, batch_id: str) -> BatchCheckpoint:
+        self._active.add(batch_id)
+        return BatchCheckpoint(batch_id, self)
+
+    def is_active(self, batch_id: str) -> bool:
+        return batch_id in self._active
+
+    def plan(self, run: dict, checkpoints: list, retry_failed_only: bool = False) -> tuple:
+        """(cells to compute, checkpoints to reuse by cell) for resuming a batch."""
+        total = len(run["prompts"]) * len(run["models"])
+        done = {c["cell"]: c for c in checkpoints if c["cell"] < total}
+        failed = [i for i, c in done.items() if not c["ok"]]
+        missing = [] if retry_failed_only else [i for i in range(total) if i not in done]
+        cells = sorted(failed + missing)
+        reuse = {i: c for i, c in done.items() if c["ok"]}
+        return cells, reuse
+
+    def progress(self, batch_id: str) -> dict:
+        run = telemetry_store.get_evaluation_run(batch_id)
+        if run is None:
+            return None
+        checkpoints = telemetry_store.get_checkpoints(batch_id)
+        total = run.get("adaptive_cells") or len(run["prompts"]) * len(run["models"])
+        ok = sum(1 for c in checkpoints if c["ok"])
+        return {
+            "batch_id": batch_id,
+            "running": self.is_active(batch_id),
+            "cells": total,
+            "ok": ok,
+            "failed": len(checkpoints) - ok,
+            "missing": total - len(checkpoints),
+            "persisted": sum(1 for c in checkpoints if c["persisted"]),
+        }
+
+
+# Singleton instance
+checkpoint_service = CheckpointService()
@@ -0,0 +1,198 @@
+"""
+Connection Manager — shared, tuned connection pools for every provider gateway.
+
+All OpenAI-compatible endpoints (OpenAI direct, Vertex MaaS for Meta/DeepSeek)
+and the Gemini SDK share one keep-alive, HTTP/2-capable httpx pool. Bedrock gets
+a botocore config sized to the same concurrency. Pool utilization and the time
+requests spend waiting for a free connection are tracked per pool.
+"""
+import threading
+import time
+from contextlib import contextmanager
+import httpx
+from app.core.config import settings
+
+
+class PoolStats:
+    """Thread-safe counters for one connection pool."""
+
+    def __init__(self, name: str, max_connections: int):
+        self.name = name
+        self.max_connections = max_connections
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.requests = 0
+        self.errors = 0
+        self.wait_total_ms = 0.0
+        self.wait_max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            self.in_flight += 1
+            self.requests += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def record_wait(self, wait_ms: float):
+        with self._lock:
+            self.wait_total_ms += wait_ms
+            self.wait_max_ms = max(self.wait_max_ms, wait_ms)
+
+    def end(self, failed: bool = False):
+        with self._lock:
+            self.in_flight -= 1
+            if failed:
+                self.errors += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "max_connections": self.max_connections,
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "utilization": round(self.in_flight / self.max_connections, 4) if self.max_connections else 0.0,
+                "requests": self.requests,
+                "errors": self.errors,
+                "avg_wait_ms": round(self.wait_total_ms / self.requests, 3) if self.requests else 0.0,
+                "max_wait_ms": round(self.wait_max_ms, 3),
+            }
+
+
+class _TrackedStream(httpx.SyncByteStream):
+    """Response body wrapper that releases the in-flight slot when the body is closed."""
+
+    def __init__(self, stream, on_close):
+        self._stream = stream
+        self._on_close = on_close
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            if self._on_close:
+                self._on_close()
+                self._on_close = None
+
+
+class _InstrumentedTransport(httpx.BaseTransport):
+    """httpx transport that measures in-flight requests and connection-pool wait time.
+
+    Wait time is the gap between handing the request to the pool and the first
+    httpcore trace event on a connection (TCP connect for a new socket, request
+    headers for a reused one).
+    """
+
+    def __init__(self, transport: httpx.BaseTransport, stats: PoolStats):
+        self._transport = transport
+        self._stats = stats
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        start = time.perf_counter()
+        waited = []
+        parent_trace = request.extensions.get("trace")
+
+        def trace(event_name, info):
+            if not waited:
+                waited.append((time.perf_counter() - start) * 1000)
+            if parent_trace:
+                parent_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self._stats.begin()
+        try:
+            response = self._transport.handle_request(request)
+        except Exception:
+            self._stats.end(failed=True)
+            raise
+        finally:
+            self._stats.record_wait(waited[0] if waited else (time.perf_counter() - start) * 1000)
+
+        if response.is_closed:
+            # Body already buffered by the transport
+            self._stats.end()
+        else:
+            response.stream = _TrackedStream(response.stream, self._stats.end)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class ConnectionManager:
+    """Owns the shared httpx client and botocore config used by all gateways."""
+
+    def __init__(self):
+        self._http_client = None
+        self._lock = threading.Lock()
+        self.http_stats = PoolStats("http", settings.HTTP_MAX_CONNECTIONS)
+        self.bedrock_stats = PoolStats("bedrock", settings.BEDROCK_MAX_POOL_CONNECTIONS)
+
+    @staticmethod
+    def http2_available() -> bool:
+        if not settings.HTTP2_ENABLED:
+            return False
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def http_client(self) -> httpx.Client:
+        """The process-wide httpx client, built on first use."""
+        if self._http_client is None:
+            with self._lock:
+                if self._http_client is None:
+                    limits = httpx.Limits(
+                        max_connections=settings.HTTP_MAX_CONNECTIONS,
+                        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+                    )
+                    transport = httpx.HTTPTransport(http2=self.http2_available(), limits=limits)
+                    self._http_client = httpx.Client(
+                        transport=_InstrumentedTransport(transport, self.http_stats),
+                        timeout=httpx.Timeout(settings.HTTP_TIMEOUT, connect=settings.HTTP_CONNECT_TIMEOUT),
+                    )
+        return self._http_client
+
+    def botocore_config(self, max_attempts: int = 3):
+        """botocore Config sized to our provider concurrency."""
+        from botocore.config import Config
+        return Config(
+            max_pool_connections=settings.BEDROCK_MAX_POOL_CONNECTIONS,
+            tcp_keepalive=True,
+            connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+            read_timeout=settings.HTTP_TIMEOUT,
+            retries={"max_attempts": max_attempts, "mode": "standard"},
+        )
+
+    @contextmanager
+    def track(self, stats: PoolStats):
+        """Count a call against a pool whose transport we can't instrument (botocore)."""
+        stats.begin()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            stats.end(failed=failed)
+
+    def stats(self) -> dict:
+        return {
+            "http": {**self.http_stats.snapshot(), "http2": self.http2_available()},
+            "bedrock": self.bedrock_stats.snapshot(),
+            "provider_max_concurrency": settings.PROVIDER_MAX_CONCURRENCY,
+        }
+
+    def close(self):
+        if self._http_client is not None:
+            self._http_client.close()
+            self._http_client = None
+
+
+# Singleton instance
+connection_manager = ConnectionManager()
@@ -0,0 +1,168 @@
+"""
+Eval Summary — per-model summary metrics for one /eval/run batch.
+
+The batch's cells are laid out once as a float matrix (one row per prompt x
+model cell, one column per measurement) and every statistic is computed with
+numpy over that matrix: per-model sums via `bincount`, and latency
+percentiles for all models at once from a single (model, latency) sort.
+
+Failed cells count towards `error_rate` only; every other figure is over the
+model's successful cells.
+"""
+from typing import Dict, List
+import numpy as np
+
+PERCENTILES = np.array([50, 90, 99], dtype=np.float64)
+
+# Columns of the result matrix
+LATENCY, INPUT_TOKENS, OUTPUT_TOKENS, COST, QUALITY, JUDGE_LATENCY, JUDGE_COST = range(7)
+
+
+def _quality(scores: dict) -> float:
+    """Mean of the cell's non-zero (scored) criteria, NaN when nothing was scored."""
+    scored = [float(v) for v in (scores or {}).values() if v]
+    return sum(scored) / len(scored) if scored else np.nan
+
+
+def _matrix(results: List[dict]) -> tuple:
+    keys = [f"{r['provider']}:{r['model_id']}" for r in results]
+    names, group = np.unique(keys, return_inverse=True)
+    values = np.array([
+        (
+            m.get("latency_ms") or 0, m.get("input_tokens") or 0, m.get("output_tokens") or 0,
+            m.get("cost") or 0, _quality(r.get("scores")), m.get("judge_latency_ms") or 0, m.get("judge_cost") or 0,
+        )
+        for r in results for m in (r["metrics"],)
+    ], dtype=np.float64).reshape(len(results), 7)
+    failed = np.array([str(r.get("response", "")).startswith("Error:") for r in results], dtype=bool)
+    return names, group, values, failed
+
+
+def _group_percentiles(latency: np.ndarray, group: np.ndarray, n_groups: int) -> np.ndarray:
+    """(n_groups, len(PERCENTILES)) linearly interpolated percentiles; NaN for empty groups."""
+    counts = np.bincount(group, minlength=n_groups)
+    out = np.full((n_groups, len(PERCENTILES)), np.nan)
+    if not len(latency):
+        return out
+    ordered = latency[np.lexsort((latency, group))]
+    starts = np.cumsum(counts) - counts
+    position = starts[:, None] + PERCENTILES / 100 * np.maximum(counts - 1, 0)[:, None]
+    low = np.floor(position).astype(np.int64).clip(0, len(ordered) - 1)
+    high = np.ceil(position).astype(np.int64).clip(0, len(ordered) - 1)
+    values = ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+    out[counts > 0] = values[counts > 0]
+    return out
+
+
+def _num(value, digits: int):
+    return None if not np.isfinite(value) else round(float(value), digits)
+
+
+def summarize(results: List[dict]) -> Dict[str, dict]:
+    """`{"provider:model_id": {...}}` for a list of evaluation cells as returned by run_evaluation."""
+    if not results:
+        return {}
+    names, group, values, failed = _matrix(results)
+    n = len(names)
+    ok = ~failed
+
+    def total(column, mask=ok):
+        return np.bincount(group, weights=np.where(mask, values[:, column], 0.0), minlength=n)
+
+    runs = np.bincount(group, minlength=n)
+    successes = np.bincount(group, weights=ok, minlength=n)
+    scored = ok & ~np.isnan(values[:, QUALITY])
+    scored_cells = np.bincount(group, weights=scored, minlength=n)
+    quality = np.bincount(group, weights=np.where(scored, values[:, QUALITY], 0.0), minlength=n)
+    latency, cost, output_tokens = total(LATENCY), total(COST), total(OUTPUT_TOKENS)
+    judge_latency, judge_cost = total(JUDGE_LATENCY), total(JUDGE_COST)
+    percentiles = _group_percentiles(values[ok, LATENCY], group[ok], n)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_latency, avg_cost, avg_tokens = latency / successes, cost / successes, output_tokens / successes
+        avg_judge_latency = judge_latency / successes
+        mean_quality = quality / scored_cells
+        # Cost of one quality point: spend on scored cells over the score points they earned
+        cost_per_point = total(COST, scored) / quality
+        tokens_per_sec = output_tokens / (latency / 1000)
+        judge_cost_share = judge_cost / (cost + judge_cost)
+        judge_latency_share = judge_latency / (latency + judge_latency)
+
+    summary = {}
+    for i, name in enumerate(names):
+        summary[str(name)] = {
+            "runs": int(runs[i]),
+            "errors": int(runs[i] - successes[i]),
+            "error_rate": round(float(1 - successes[i] / runs[i]), 4),
+            "avg_latency": _num(avg_latency[i], 0),
+            "avg_cost": _num(avg_cost[i], 6),
+            "avg_tokens": _num(avg_tokens[i], 0),
+            "latency_p50": _num(percentiles[i, 0], 0),
+            "latency_p90": _num(percentiles[i, 1], 0),
+            "latency_p99": _num(percentiles[i, 2], 0),
+            "tokens_per_sec": _num(tokens_per_sec[i], 1),
+            "mean_quality": _num(mean_quality[i], 3),
+            "cost_per_quality_point": _num(cost_per_point[i], 8),
+            "judge_latency_ms": _num(avg_judge_latency[i], 0),
+            "judge_cost": _num(judge_cost[i], 6),
+            "judge_cost_share": _num(judge_cost_share[i], 4),
+            "judge_latency_share": _num(judge_latency_share[i], 4),
+        }
+    return summary
+
+
+def _agreement(pairs: List[tuple]) -> dict:
+    """Exact / within-one-point agreement and mean absolute difference over (score, score) pairs."""
+    if not pairs:
+        return {"pairs": 0, "exact": None, "within_1": None, "mean_abs_diff": None}
+    diffs = np.abs(np.array(pairs, dtype=np.float64)[:, 0] - np.array(pairs, dtype=np.float64)[:, 1])
+    return {
+        "pairs": len(pairs),
+        "exact": round(float(np.mean(diffs == 0)), 4),
+        "within_1": round(float(np.mean(diffs <= 1)), 4),
+        "mean_abs_diff": round(float(diffs.mean()), 3),
+    }
+
+
+def summarize_cascade(results: List[dict]) -> dict:
+    """Escalations, judge agreement and spend of a batch scored with the judge cascade; None otherwise."""
+    cells = [r["judge_cascade"] for r in results if r.get("judge_cascade")]
+    if not cells:
+        return None
+    escalated = [c for c in cells if c["tier"] == "expensive"]
+    reasons = {}
+    for c in escalated:
+        for reason in c["reasons"]:
+            reasons[reason] = reasons.get(reason, 0) + 1
+    # Criterion-level score pairs: the two cheap judges, and the first cheap judge vs the expensive one
+    cheap_pairs = [
+        (c["cheap_scores"][0][m], c["cheap_scores"][1][m])
+        for c in cells if len(c["cheap_scores"]) > 1
+        for m in c["cheap_scores"][0] if m in c["cheap_scores"][1]
+    ]
+    escalation_pairs = [
+        (c["cheap_scores"][0][m], c["final_scores"][m])
+        for c in escalated if "failed" not in c["reasons"]
+        for m in c["cheap_scores"][0] if m in c["final_scores"]
+    ]
+    cheap_cost = sum(c["cheap_cost"] for c in cells)
+    expensive_cost = sum(c["expensive_cost"] for c in cells)
+    expensive_only = sum(c["expensive_only_cost"] for c in cells)
+    spent = cheap_cost + expensive_cost
+    return {
+        "cells": len(cells),
+        "escalated": len(escalated),
+        "escalation_rate": round(len(escalated) / len(cells), 4),
+        "escalation_reasons": reasons,
+        "cheap_judge_agreement": _agreement(cheap_pairs),
+        "cheap_vs_expensive_agreement": _agreement(escalation_pairs),
+        "cost": {
+            "cheap_judges": round(cheap_cost, 6),
+            "expensive_judge": round(expensive_cost, 6),
+            "total": round(spent, 6),
+            # Estimated spend had the expensive judge scored every cell
+            "expensive_only_estimate": round(expensive_only, 6),
+            "saved": round(expensive_only - spent, 6),
+            "saved_share": round((expensive_only - spent) / expensive_only, 4) if expensive_only else None,
+        },
+    }
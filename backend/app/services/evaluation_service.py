@@ -3,9 +3,15 @@ Evaluation Service — parallel evaluation, AI Judge scoring, and manual form ge
 """
 import asyncio
 import json
-from typing import List, Dict, Any
+import re
+import time
+from typing import Any, Callable, Dict, List
+from app.core.cache import cache, cache_key
+from app.core.config import settings
+from app.core.json_extract import JSONExtractError, structured_result
+from app.core.metrics import EVAL_CELLS, EVAL_CELL_LATENCY
 from app.services.ai_service import ai_service
-from app.services.pricing_service import PricingService
+from app.services.token_service import estimate_cost
 
 
 # ── AI Judge System Prompt ─────────────────────────────────
@@ -40,120 +46,341 @@ Return output strictly in JSON format:
 }"""
 
 
+# ── Prompt Analysis System Prompt ──────────────────────────
+PROMPT_ANALYSIS_PROMPT = """Evaluate the prompt provided by the user for an AI model.
+How clear, detailed, and well-structured is it?
+What is the specific intent?
+
+Return output strictly in JSON:
+{
+  "score": <1-5>,
+  "summary": "<brief analysis>",
+  "clarity": "High/Medium/Low",
+  "intent_detected": "<what the user wants>"
+}"""
+
+PROMPT_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "score": {"type": "integer"},
+        "summary": {"type": "string"},
+        "clarity": {"type": "string", "enum": ["High", "Medium", "Low"]},
+        "intent_detected": {"type": "string"},
+    },
+    "required": ["score", "summary", "clarity", "intent_detected"],
+    "additionalProperties": False,
+}
+
+
+def judge_schema(metrics: List[str]) -> dict:
+    """Response schema for AI_JUDGE_PROMPT, restricting metric names to the selected ones."""
+    return {
+        "type": "object",
+        "properties": {
+            "prompt_analysis": {
+                "type": "object",
+                "properties": {"score": {"type": "integer"}, "summary": {"type": "string"}},
+                "required": ["score", "summary"],
+                "additionalProperties": False,
+            },
+            "ai_evaluation": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "metric": {"type": "string", "enum": list(metrics)},
+                        "score": {"type": "integer"},
+                        "reason": {"type": "string"},
+                    },
+                    "required": ["metric", "score", "reason"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["prompt_analysis", "ai_evaluation"],
+        "additionalProperties": False,
+    }
+
+
+# ── Judge cascade ──────────────────────────────────────────
+# Reason wording that contradicts a clearly high (negative cues) or low (positive cues) score
+_NEGATIVE_CUES = re.compile(
+    r"\b(incorrect|inaccurate|wrong|irrelevant|unclear|incomplete|lacks?)\b", re.I
+)
+_POSITIVE_CUES = re.compile(r"\b(correct|accurate|clear|complete|relevant|excellent|thorough)\b", re.I)
+# Fallback reasons get_ai_scores substitutes when a judge could not score
+_FALLBACK_REASONS = ("Error:", "Could not evaluate", "AI Judge response could not be parsed")
+
+
+def cascade_uncertainty(verdicts: List[Dict[str, Any]]) -> List[str]:
+    """Why the cheap judges' verdicts should not be trusted (empty when they can be).
+
+    failed        a judge errored or returned something unparseable
+    mid_score     a criterion scored strictly between JUDGE_CASCADE_LOW and JUDGE_CASCADE_HIGH
+    inconsistent  criteria spread more than JUDGE_CASCADE_MAX_SPREAD, or a reason contradicts its score
+    disagreement  two judges differ by more than JUDGE_CASCADE_MAX_DISAGREEMENT on a criterion
+    """
+    low, high = settings.JUDGE_CASCADE_LOW, settings.JUDGE_CASCADE_HIGH
+    reasons = []
+    items = [e for v in verdicts for e in v["ai_evaluation"]]
+    if any(str(e.get("reason", "")).startswith(_FALLBACK_REASONS) for e in items):
+        return ["failed"]
+    if any(low < e["score"] < high for e in items):
+        reasons.append("mid_score")
+    for verdict in verdicts:
+        scores = [e["score"] for e in verdict["ai_evaluation"]]
+        contradicts = any(
+            (e["score"] >= high and _NEGATIVE_CUES.search(e.get("reason", "")))
+            or (e["score"] <= low and _POSITIVE_CUES.search(e.get("reason", "")) and not _NEGATIVE_CUES.search(e.get("reason", "")))
+            for e in verdict["ai_evaluation"]
+        )
+        if contradicts or (scores and max(scores) - min(scores) > settings.JUDGE_CASCADE_MAX_SPREAD):
+            reasons.append("inconsistent")
+            break
+    if len(verdicts) > 1:
+        first = {e["metric"]: e["score"] for e in verdicts[0]["ai_evaluation"]}
+        for other in verdicts[1:]:
+            if any(
+                abs(e["score"] - first[e["metric"]]) > settings.JUDGE_CASCADE_MAX_DISAGREEMENT
+                for e in other["ai_evaluation"] if e["metric"] in first
+            ):
+                reasons.append("disagreement")
+                break
+    return reasons
+
+
+def _merge_verdicts(verdicts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Agreeing cheap verdicts as one: per-criterion mean score (rounded half up), first judge's reasons."""
+    by_metric = {}
+    for verdict in verdicts:
+        for e in verdict["ai_evaluation"]:
+            by_metric.setdefault(e["metric"], []).append(e["score"])
+    return {
+        "prompt_quality": verdicts[0]["prompt_quality"],
+        "ai_evaluation": [
+            {**e, "score": int(sum(by_metric[e["metric"]]) / len(by_metric[e["metric"]]) + 0.5)}
+            for e in verdicts[0]["ai_evaluation"]
+        ],
+    }
+
+
+def _clamp_score(value) -> int:
+    """A judge score clamped to 1-5, or 0 (not scored) when missing or not a number."""
+    try:
+        return max(1, min(5, int(value)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_judges(spec: str) -> List[Dict[str, str]]:
+    """"Provider:model_id,Provider:model_id" → judge configs."""
+    judges = []
+    for part in spec.split(","):
+        provider, _, model_id = part.strip().partition(":")
+        if provider and model_id:
+            judges.append({"provider": provider, "model_id": model_id})
+    return judges
+
+
 class EvaluationService:
-    async def evaluate_prompt(self, prompt: str, judge_provider: str, judge_model: str) -> Dict[str, Any]:
-        """Analyze the quality and clarity of the prompt once."""
-        analysis_prompt = f"""Evaluate the following prompt for an AI model. 
-        How clear, detailed, and well-structured is it? 
-        What is the specific intent?
-
-        Prompt: "{prompt}"
-
-        Return output strictly in JSON:
-        {{
-          "score": <1-5>,
-          "summary": "<brief analysis>",
-          "clarity": "High/Medium/Low",
-          "intent_detected": "<what the user wants>"
-        }}"""
+    async def evaluate_prompt(self, prompt: str, judge_provider: str, judge_model: str,
+                              on_spend: Callable[[float], None] = None) -> Dict[str, Any]:
+        """Analyze the quality and clarity of the prompt once; `on_spend(cost)` sees the call's cost."""
+        key = cache_key(judge_provider, judge_model, PROMPT_ANALYSIS_PROMPT, prompt)
+        cached = await cache.aget("prompt_analysis", key)
+        if cached is not None:
+            return cached
         try:
-            result = await ai_service.generate(judge_provider, judge_model, analysis_prompt)
-            text = result["text"].strip()
-            if text.startswith("```"):
-                text = text.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-            return json.loads(text)
+            # The fixed instructions go in the system prompt so providers can cache them
+            result = await ai_service.generate(
+                judge_provider, judge_model, f'Prompt: "{prompt}"',
+                system_prompt=PROMPT_ANALYSIS_PROMPT, task="prompt_analysis",
+                response_schema=PROMPT_ANALYSIS_SCHEMA,
+            )
+            if on_spend is not None:
+                on_spend(result["cost"] or estimate_cost(judge_model, result["input_tokens"], result["output_tokens"]))
+            analysis = structured_result(result, "prompt_analysis", judge_model)
+            await cache.aset("prompt_analysis", key, analysis)
+            return analysis
         except:
             return {"score": 3, "summary": "Prompt could not be analyzed", "clarity": "Unknown", "intent_detected": "Unknown"}
 
-    async def run_evaluation(self, prompts: List[str], models: List[Dict[str, str]], criteria: List[str], judge_cfg: Dict[str, str] = None) -> Dict[str, Any]:
-        """Run all prompts against all models in parallel, including a single-pass prompt analysis."""
-        
-        # 1. Analyze prompts (once per unique prompt)
-        prompt_tasks = []
+    async def analyze_prompts(self, prompts: List[str], judge_cfg: Dict[str, str] = None,
+                              known: Dict[str, Any] = None,
+                              on_spend: Callable[[float], None] = None) -> Dict[str, Any]:
+        """Prompt analyses by prompt (None without a judge), skipping prompts already in `known`."""
+        prompt_map = dict(known or {})
+        todo = [p for p in dict.fromkeys(prompts) if p not in prompt_map]
         if judge_cfg:
-            for p in prompts:
-                prompt_tasks.append(self.evaluate_prompt(p, judge_cfg["judge_provider"], judge_cfg["judge_model"]))
-        
-        prompt_analyses = await asyncio.gather(*prompt_tasks) if prompt_tasks else [None] * len(prompts)
-        prompt_map = {p: analysis for p, analysis in zip(prompts, prompt_analyses)}
+            analyses = await asyncio.gather(*(
+                self.evaluate_prompt(p, judge_cfg["judge_provider"], judge_cfg["judge_model"], on_spend)
+                for p in todo
+            ))
+        else:
+            analyses = [None] * len(todo)
+        prompt_map.update(zip(todo, analyses))
+        return prompt_map
+
+    async def run_evaluation(self, prompts: List[str], models: List[Dict[str, str]], criteria: List[str],
+                             judge_cfg: Dict[str, str] = None, cells: List[int] = None,
+                             on_cell: Callable[[int, Dict[str, Any]], None] = None,
+                             prompt_metadata: Dict[str, Any] = None,
+                             on_spend: Callable[[float], None] = None) -> Dict[str, Any]:
+        """Run all prompts against all models in parallel, including a single-pass prompt analysis.
+
+        Cell i is prompts[i // len(models)] x models[i % len(models)]; `cells` restricts the run
+        to those cells (a resume), and `on_cell(i, result)` is called as each one finishes.
+        `on_spend(cost)` sees the cost of prompt analyses made here.
+        """
+        # 1. Analyze prompts (once per unique prompt)
+        prompt_map = await self.analyze_prompts(prompts, judge_cfg, known=prompt_metadata, on_spend=on_spend)
 
         # 2. Run model generations
-        tasks = []
-        for prompt in prompts:
-            for model_cfg in models:
-                tasks.append(self._evaluate_single(prompt, model_cfg, criteria, judge_cfg))
-        
-        results = await asyncio.gather(*tasks)
+        if cells is None:
+            cells = list(range(len(prompts) * len(models)))
+
+        async def run_cell(i: int) -> Dict[str, Any]:
+            result = await self._evaluate_single(prompts[i // len(models)], models[i % len(models)], criteria, judge_cfg)
+            if on_cell is not None:
+                on_cell(i, result)
+            return result
+
+        results = await asyncio.gather(*(run_cell(i) for i in cells))
         
         return {
             "results": results,
+            "cells": cells,
             "prompt_metadata": prompt_map
         }
 
     async def _evaluate_single(self, prompt: str, model_cfg: Dict[str, str], criteria: List[str], judge_cfg: Dict[str, str] = None) -> Dict[str, Any]:
         provider = model_cfg["provider"]
         model_id = model_cfg["model_id"]
+        cell_start = time.perf_counter()
         
         try:
             # Generate response
             result = await ai_service.generate(provider, model_id, prompt)
             
-            # Calculate cost
-            cost = PricingService.calculate_cost(model_id, result["input_tokens"], result["output_tokens"])
+            # Cost (priced by the AI service)
+            cost = result["cost"]
             
             # Auto-run AI Judge if requested
             scores = {c: 0 for c in criteria}
             ai_evaluations = None
             prompt_quality = None
+            cascade = None
+            judge_latency_ms, judge_cost = 0, 0.0
             
             if judge_cfg and judge_cfg.get("judge_model") and judge_cfg.get("judge_provider"):
-                ai_data = await self.get_ai_scores(
-                    prompt=prompt,
-                    response=result["text"],
-                    metrics=criteria,
-                    judge_provider=judge_cfg["judge_provider"],
-                    judge_model=judge_cfg["judge_model"]
-                )
+                judge_start = time.perf_counter()
+                if judge_cfg.get("cascade"):
+                    ai_data = await self.cascade_scores(prompt, result["text"], criteria, judge_cfg)
+                    cascade = ai_data["cascade"]
+                else:
+                    ai_data = await self.get_ai_scores(
+                        prompt=prompt,
+                        response=result["text"],
+                        metrics=criteria,
+                        judge_provider=judge_cfg["judge_provider"],
+                        judge_model=judge_cfg["judge_model"]
+                    )
+                judge_latency_ms = int((time.perf_counter() - judge_start) * 1000)
+                judge_cost = ai_data.get("judge_cost", 0.0)
                 ai_evaluations = ai_data["ai_evaluation"]
                 prompt_quality = ai_data["prompt_quality"]
                 # Map AI scores back to the scores dict
                 for item in ai_evaluations:
                     scores[item["metric"]] = item["score"]
 
-            return {
+            EVAL_CELLS.labels("ok").inc()
+            EVAL_CELL_LATENCY.observe(time.perf_counter() - cell_start)
+            cell = {
                 "prompt": prompt,
                 "provider": provider,
                 "model_id": model_id,
                 "response": result["text"],
                 "metrics": {
                     "input_tokens": result["input_tokens"],
+                    "cached_input_tokens": result["cached_input_tokens"],
                     "output_tokens": result["output_tokens"],
                     "cost": cost,
-                    "latency_ms": result["latency_ms"]
+                    "latency_ms": result["latency_ms"],
+                    "judge_latency_ms": judge_latency_ms,
+                    "judge_cost": judge_cost,
                 },
                 "scores": scores,
                 "ai_evaluations": ai_evaluations, # Useful for justifications
                 "prompt_quality": prompt_quality
             }
+            if cascade is not None:
+                cell["judge_cascade"] = cascade
+            return cell
         except Exception as e:
+            EVAL_CELLS.labels("error").inc()
+            EVAL_CELL_LATENCY.observe(time.perf_counter() - cell_start)
             return {
                 "prompt": prompt,
                 "provider": provider,
                 "model_id": model_id,
                 "response": f"Error: {str(e)}",
-                "metrics": {"input_tokens": 0, "output_tokens": 0, "cost": 0, "latency_ms": 0},
-                "scores": {}
-            }
-        except Exception as e:
-            return {
-                "prompt": prompt,
-                "provider": provider,
-                "model_id": model_id,
-                "response": f"Error: {str(e)}",
-                "metrics": {"input_tokens": 0, "output_tokens": 0, "cost": 0, "latency_ms": 0},
-                "scores": {}
+                # Same keys as a successful cell: results are returned without a response-model pass
+                "metrics": {
+                    "input_tokens": 0,
+                    "cached_input_tokens": 0,
+                    "output_tokens": 0,
+                    "cost": 0,
+                    "latency_ms": 0,
+                    "judge_latency_ms": 0,
+                    "judge_cost": 0.0,
+                },
+                "scores": {},
+                "ai_evaluations": None,
+                "prompt_quality": None,
             }
 
+    async def cascade_scores(self, prompt: str, response: str, metrics: List[str],
+                             judge_cfg: Dict[str, Any]) -> Dict[str, Any]:
+        """Score with the cheap judges (in parallel) and escalate to the configured judge only
+        when they are uncertain (see `cascade_uncertainty`)."""
+        cheap = judge_cfg["cascade"]
+        verdicts = await asyncio.gather(*(
+            self.get_ai_scores(prompt, response, metrics, judge_provider=j["provider"], judge_model=j["model_id"])
+            for j in cheap
+        ))
+        reasons = cascade_uncertainty(verdicts)
+        cheap_cost = sum(v.get("judge_cost", 0.0) for v in verdicts)
+        if reasons:
+            final = await self.get_ai_scores(
+                prompt, response, metrics,
+                judge_provider=judge_cfg["judge_provider"], judge_model=judge_cfg["judge_model"],
+            )
+            expensive_cost = final.get("judge_cost", 0.0)
+            # A cached verdict charged nothing; the counterfactual still pays for the call
+            tokens = final.get("judge_tokens")
+            expensive_only_cost = expensive_cost or (estimate_cost(judge_cfg["judge_model"], *tokens) if tokens else 0.0)
+        else:
+            final = _merge_verdicts(verdicts)
+            expensive_cost = 0.0
+            # What the configured judge would have charged, priced at the cheap judge's token counts
+            # (cached cheap verdicts keep theirs)
+            tokens = verdicts[0].get("judge_tokens")
+            expensive_only_cost = estimate_cost(judge_cfg["judge_model"], *tokens) if tokens else 0.0
+        return {
+            "prompt_quality": final["prompt_quality"],
+            "ai_evaluation": final["ai_evaluation"],
+            "judge_cost": cheap_cost + expensive_cost,
+            "cascade": {
+                "tier": "expensive" if reasons else "cheap",
+                "reasons": reasons,
+                "cheap_scores": [{e["metric"]: e["score"] for e in v["ai_evaluation"]} for v in verdicts],
+                "final_scores": {e["metric"]: e["score"] for e in final["ai_evaluation"]},
+                "cheap_cost": cheap_cost,
+                "expensive_cost": expensive_cost,
+                "expensive_only_cost": expensive_only_cost,
+            },
+        }
+
     def generate_manual_form(self, metrics: List[str]) -> List[Dict[str, str]]:
         """Generate a structured manual scoring form for the given metrics."""
         return [
@@ -163,9 +390,7 @@ class EvaluationService:
 
     async def get_ai_scores(self, prompt: str, response: str, metrics: List[str], judge_provider: str = "Google", judge_model: str = "gemini-2.5-flash") -> Dict[str, Any]:
         """Use AI Judge to score the response on a 1-5 scale with justifications."""
-        judge_input = f"""{AI_JUDGE_PROMPT}
-
-User Prompt:
+        judge_input = f"""User Prompt:
 {prompt}
 
 Model Response:
@@ -174,53 +399,68 @@ Model Response:
 Selected Metrics:
 {json.dumps(metrics)}"""
 
+        # Judges run at temperature 0: an identical (judge, prompt, response, metrics)
+        # verdict is reused instead of paying for it again
+        key = cache_key(judge_provider, judge_model, AI_JUDGE_PROMPT, judge_input)
+        cached = await cache.aget("judge", key)
+        if cached is not None:
+            # A reused verdict costs nothing; its token counts still price counterfactuals
+            return {**cached, "judge_cost": 0.0}
         try:
-            result = await ai_service.generate(judge_provider, judge_model, judge_input)
-            
-            # Parse the JSON response
-            text = result["text"].strip()
-            # Handle markdown code blocks
-            if text.startswith("```"):
-                text = text.split("\n", 1)[1].rsplit("```", 1)[0].strip()
-            
-            parsed = json.loads(text)
-            evaluations = parsed.get("ai_evaluation", [])
-            prompt_analysis = parsed.get("prompt_analysis", {"score": 3, "summary": "Could not analyze prompt"})
-            
-            # Validate and clamp scores to 1-5
-            validated = []
-            for item in evaluations:
-                score = max(1, min(5, int(item.get("score", 3))))
-                validated.append({
-                    "metric": item.get("metric", "Unknown"),
-                    "score": score,
-                    "reason": item.get("reason", "No justification provided"),
-                })
-            
-            # Add any missing metrics with default scores
-            scored_metrics = {v["metric"] for v in validated}
-            for m in metrics:
-                if m not in scored_metrics:
-                    validated.append({"metric": m, "score": 3, "reason": "Could not evaluate"})
-            
-            return {
-                "prompt_quality": {
-                    "score": max(1, min(5, int(prompt_analysis.get("score", 3)))),
-                    "summary": prompt_analysis.get("summary", "No summary provided")
-                },
-                "ai_evaluation": validated
-            }
-        except json.JSONDecodeError:
-            # Return default scores if parsing fails
-            return {
-                "prompt_quality": {"score": 3, "summary": "AI Judge response could not be parsed"},
-                "ai_evaluation": [{"metric": m, "score": 3, "reason": "AI Judge response could not be parsed"} for m in metrics]
-            }
+            # AI_JUDGE_PROMPT is a fixed prefix on every judge call: send it as the
+            # system prompt so it is served from the provider's prompt cache
+            result = await ai_service.generate(
+                judge_provider, judge_model, judge_input, system_prompt=AI_JUDGE_PROMPT, task="judge",
+                response_schema=judge_schema(metrics),
+            )
         except Exception as e:
             return {
                 "prompt_quality": {"score": 0, "summary": f"Error: {str(e)}"},
                 "ai_evaluation": [{"metric": m, "score": 0, "reason": f"Error: {str(e)}"} for m in metrics]
             }
+        # The judge call's own spend, charged whether or not its output is usable
+        spend = {"judge_cost": result["cost"], "judge_tokens": (result["input_tokens"], result["output_tokens"])}
+        try:
+            parsed = structured_result(result, "judge", judge_model)
+        except JSONExtractError:
+            # Score 0 = not scored: summaries and the leaderboard skip it
+            return {
+                "prompt_quality": {"score": 0, "summary": "AI Judge response could not be parsed"},
+                "ai_evaluation": [{"metric": m, "score": 0, "reason": "AI Judge response could not be parsed"} for m in metrics],
+                **spend,
+            }
+        evaluations = parsed.get("ai_evaluation") or []
+        prompt_analysis = parsed.get("prompt_analysis") or {}
 
+        # Validate and clamp scores to 1-5; a missing or non-numeric score stays unscored (0)
+        validated = []
+        for item in evaluations:
+            score = _clamp_score(item.get("score"))
+            if not score and item.get("metric") not in metrics:
+                continue   # an entry cut off by truncation (e.g. {"metric": "Cla"})
+            validated.append({
+                "metric": item.get("metric", "Unknown"),
+                "score": score,
+                "reason": item.get("reason", "No justification provided"),
+            })
+
+        # Metrics the judge skipped (e.g. cut off by truncation) are not scored
+        scored_metrics = {v["metric"] for v in validated}
+        for m in metrics:
+            if m not in scored_metrics:
+                validated.append({"metric": m, "score": 0, "reason": "Could not evaluate"})
+
+        verdict = {
+            "prompt_quality": {
+                "score": _clamp_score(prompt_analysis.get("score")),
+                "summary": prompt_analysis.get("summary", "Could not analyze prompt"),
+            },
+            "ai_evaluation": validated,
+            "judge_tokens": spend["judge_tokens"],
+        }
+        # Only complete verdicts are reused; a partial one is retried next time
+        if verdict["prompt_quality"]["score"] and all(v["score"] for v in validated):
+            await cache.aset("judge", key, verdict)
+        return {**verdict, "judge_cost": spend["judge_cost"]}
 
 evaluation_service = EvaluationService()
@@ -0,0 +1,146 @@
+"""
+Export Service — stream telemetry / evaluation pages as NDJSON, CSV, Parquet or Arrow.
+
+Pages come from a TelemetryStore iterator and are encoded and yielded one at a
+time, so memory stays bounded by the page size whatever the table size.
+Parquet writes one row group per page; Arrow uses the IPC stream format.
+Both need the optional `pyarrow` package. Nested values (timings, scores,
+ai_evaluations, ...) are emitted as JSON strings in CSV, Parquet and Arrow.
+"""
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Callable, Iterable, Iterator
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+FORMATS = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+# Arrow types for known numeric columns; everything else is a string
+_NUMERIC = {
+    "id": "int64", "input_tokens": "int64", "output_tokens": "int64", "cached_input_tokens": "int64",
+    "latency_ms": "int64", "cost": "float64",
+}
+
+
+class ExportFormatError(ValueError):
+    """Unknown export format, or a format whose optional dependency is missing."""
+
+
+def resolve_columns(requested: str, allowed: tuple) -> list:
+    """Columns from a comma-separated `columns` query value (all of `allowed` when empty)."""
+    if not requested:
+        return list(allowed)
+    columns = [c.strip() for c in requested.split(",") if c.strip()]
+    unknown = [c for c in columns if c not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}; expected a subset of {', '.join(allowed)}")
+    return columns
+
+
+def check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ExportFormatError(f"Unsupported format '{fmt}'; expected one of {', '.join(FORMATS)}")
+    if fmt in ("parquet", "arrow"):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ExportFormatError(f"{fmt} export requires the `pyarrow` package") from e
+
+
+def _flat(value):
+    return json.dumps(value, default=str) if isinstance(value, (dict, list)) else value
+
+
+def _ndjson(pages: Iterable[list], columns: list) -> Iterator[bytes]:
+    for page in pages:
+        yield "".join(
+            json.dumps({c: row.get(c) for c in columns}, default=str) + "\n" for row in page
+        ).encode()
+
+
+def _csv(pages: Iterable[list], columns: list) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for page in pages:
+        writer.writerows([_flat(row.get(c)) for c in columns] for row in page)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object whose written bytes are drained after each page."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+def _arrow(pages: Iterable[list], columns: list, fmt: str) -> Iterator[bytes]:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(c, pa.type_for_alias(_NUMERIC[c]) if c in _NUMERIC else pa.string()) for c in columns])
+    sink = _ChunkSink()
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(sink, schema, compression="zstd")
+    else:
+        writer = pa.ipc.new_stream(sink, schema)
+    for page in pages:
+        arrays = []
+        for c in columns:
+            values = [row.get(c) for row in page]
+            if c not in _NUMERIC:
+                values = [None if v is None else str(_flat(v)) for v in values]
+            arrays.append(pa.array(values, type=schema.field(c).type))
+        writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream_export(pages: Iterable[list], columns: list, fmt: str) -> Iterator[bytes]:
+    """Encoded chunks of the export, one per page."""
+    if fmt == "ndjson":
+        return _ndjson(pages, columns)
+    if fmt == "csv":
+        return _csv(pages, columns)
+    return _arrow(pages, columns, fmt)
+
+
+def export_response(iter_pages: Callable, allowed: tuple, name: str, fmt: str, columns: str,
+                    since=None, until=None) -> StreamingResponse:
+    """StreamingResponse for an export endpoint; bad formats or columns are a 400."""
+    try:
+        check_format(fmt)
+        selected = resolve_columns(columns, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    media_type, extension = FORMATS[fmt]
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    # A sync iterator: Starlette pulls each page from the store in its threadpool
+    return StreamingResponse(
+        stream_export(iter_pages(since, until), selected, fmt),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{name}-{stamp}.{extension}"'},
+    )
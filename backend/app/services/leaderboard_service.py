@@ -0,0 +1,204 @@
+"""
+Leaderboard Service — per-model aggregates over the whole evaluation history.
+
+For every (provider, model_id) the service keeps the raw latency and cost of
+each evaluated cell and, per criterion, a histogram of the 1-5 scores. New
+rows are folded in incrementally by tailing the `evaluations` table from the
+last seen `created_at` (after each `log_evaluation` and every
+LEADERBOARD_REFRESH_INTERVAL seconds, so batches logged by other workers are
+picked up too). Statistics for changed models are recomputed with numpy and
+served from a precomputed snapshot, which is also written to
+LEADERBOARD_SNAPSHOT_PATH so a restarted worker can serve it immediately.
+
+Score confidence intervals are percentile bootstraps of the mean. Scores take
+only five values, so resampling n scores is a multinomial draw over the
+histogram: every resample costs O(5) rather than O(n), whatever the history
+size.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from array import array
+from datetime import datetime, timezone
+import numpy as np
+from app.core.config import settings
+from app.services.telemetry_store import telemetry_store
+
+SCORE_LEVELS = np.arange(1, 6, dtype=np.float64)
+PERCENTILES = (50, 90, 99)
+
+
+class _ModelStats:
+    """Raw per-cell measurements for one (provider, model_id)."""
+
+    __slots__ = ("latency", "cost", "errors", "histograms")
+
+    def __init__(self):
+        self.latency = array("d")
+        self.cost = array("d")
+        self.errors = 0
+        self.histograms = {}   # criterion → counts for scores 1..5
+
+    def add(self, row: dict):
+        metrics = row.get("metrics") or row
+        latency = metrics.get("latency_ms") or 0
+        if str(row.get("response", "")).startswith("Error:") or not latency:
+            self.errors += 1
+            return
+        self.latency.append(float(latency))
+        self.cost.append(float(metrics.get("cost") or 0))
+        for criterion, score in (row.get("scores") or {}).items():
+            if not score:
+                continue   # 0 = not scored
+            histogram = self.histograms.get(criterion)
+            if histogram is None:
+                histogram = self.histograms[criterion] = [0] * 5
+            histogram[min(max(int(round(float(score))), 1), 5) - 1] += 1
+
+
+def _distribution(values: array) -> dict:
+    if not values:
+        return {"mean": None, **{f"p{p}": None for p in PERCENTILES}}
+    data = np.frombuffer(values)   # array("d") is float64: a zero-copy view
+    quantiles = np.percentile(data, PERCENTILES)
+    return {"mean": float(data.mean()), **{f"p{p}": float(q) for p, q in zip(PERCENTILES, quantiles)}}
+
+
+def _score_stats(histogram: np.ndarray, rng: np.random.Generator, samples: int) -> dict:
+    n = int(histogram.sum())
+    cumulative = np.cumsum(histogram)
+    # Percentiles of an integer histogram: first level whose cumulative count reaches the rank
+    quartiles = {
+        f"p{q}": int(SCORE_LEVELS[np.searchsorted(cumulative, max(1, int(np.ceil(q / 100 * n))))])
+        for q in (25, 50, 75)
+    }
+    resampled = rng.multinomial(n, histogram / n, size=samples) @ SCORE_LEVELS / n
+    low, high = np.percentile(resampled, (2.5, 97.5))
+    return {
+        "n": n,
+        "mean": round(float(histogram @ SCORE_LEVELS / n), 4),
+        **quartiles,
+        "ci95": [round(float(low), 4), round(float(high), 4)],
+    }
+
+
+def _row_key(row: dict) -> str:
+    if row.get("id") is not None:
+        return str(row["id"])
+    return hashlib.sha256(json.dumps(row, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class LeaderboardService:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._models = {}         # (provider, model_id) → _ModelStats
+        self._entries = {}        # (provider, model_id) → computed leaderboard entry
+        self._dirty = set()
+        self._cursor = None       # created_at of the newest ingested row
+        self._seen_at_cursor = set()
+        self._rng = np.random.default_rng(0)
+        self.snapshot = {"updated_at": None, "rows": 0, "models": []}
+
+    # ── Ingestion ───────────────────────────────────────────
+
+    def ingest(self, rows: list) -> int:
+        """Fold evaluation rows (as stored by log_evaluation) into the aggregates."""
+        with self._lock:
+            for row in rows:
+                key = (row.get("provider"), row.get("model_id"))
+                stats = self._models.get(key)
+                if stats is None:
+                    stats = self._models[key] = _ModelStats()
+                stats.add(row)
+                self._dirty.add(key)
+            self.snapshot["rows"] += len(rows)
+        return len(rows)
+
+    def refresh(self) -> int:
+        """Ingest rows logged since the last refresh (by any worker), then rebuild the snapshot."""
+        with self._refresh_lock:
+            ingested = 0
+            for page in telemetry_store.iter_evaluations(since=self._cursor, hydrate=False):
+                new = []
+                for row in page:
+                    created_at, key = row.get("created_at"), _row_key(row)
+                    if created_at == self._cursor and key in self._seen_at_cursor:
+                        continue   # `since` is inclusive: skip rows already ingested at the cursor
+                    if created_at != self._cursor:
+                        self._cursor, self._seen_at_cursor = created_at, set()
+                    self._seen_at_cursor.add(key)
+                    new.append(row)
+                ingested += self.ingest(new)
+            if ingested or self.snapshot["updated_at"] is None:
+                self._rebuild()
+            return ingested
+
+    # ── Snapshot ────────────────────────────────────────────
+
+    def _rebuild(self):
+        """Recompute entries of models that received rows, then swap in a new snapshot."""
+        samples = settings.LEADERBOARD_BOOTSTRAP_SAMPLES
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            for key in dirty:
+                stats = self._models[key]
+                cells = len(stats.latency) + stats.errors
+                histograms = {c: np.array(h, dtype=np.int64) for c, h in stats.histograms.items()}
+                criteria = {c: _score_stats(h, self._rng, samples) for c, h in histograms.items()}
+                overall = sum(histograms.values()) if histograms else None
+                cost = _distribution(stats.cost)
+                cost["total"] = float(np.frombuffer(stats.cost).sum()) if stats.cost else 0.0
+                self._entries[key] = {
+                    "provider": key[0],
+                    "model_id": key[1],
+                    "runs": cells,
+                    "error_rate": round(stats.errors / cells, 4) if cells else 0.0,
+                    "latency_ms": _distribution(stats.latency),
+                    "cost": cost,
+                    "overall_score": _score_stats(overall, self._rng, samples) if overall is not None else None,
+                    "criteria": criteria,
+                }
+            models = sorted(
+                self._entries.values(),
+                key=lambda e: (-(e["overall_score"] or {"mean": 0})["mean"], e["latency_ms"]["p50"] or float("inf")),
+            )
+            self.snapshot = {
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+                "rows": self.snapshot["rows"],
+                "models": models,
+            }
+        self._persist()
+
+    def _persist(self):
+        path = settings.LEADERBOARD_SNAPSHOT_PATH
+        if not path:
+            return
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.snapshot, f)
+        os.replace(tmp, path)
+
+    def load_snapshot(self):
+        """Serve the last persisted snapshot until the first refresh completes."""
+        path = settings.LEADERBOARD_SNAPSHOT_PATH
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.snapshot = {**json.load(f), "rows": 0}
+
+    async def run_refresh(self):
+        """Background task: full load on startup, then tail new rows until cancelled."""
+        while True:
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                print(f"Leaderboard refresh error: {e}")
+            await asyncio.sleep(settings.LEADERBOARD_REFRESH_INTERVAL)
+
+
+leaderboard_service = LeaderboardService()
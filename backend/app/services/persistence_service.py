@@ -0,0 +1,123 @@
+"""
+Persistence Service — background, chunked writes of evaluation batches.
+
+`/eval/run` hands its rows to `submit()` and responds straight away. The rows
+are split into chunks of EVAL_PERSIST_CHUNK_SIZE and inserted by up to
+EVAL_PERSIST_CONCURRENCY concurrent workers (blocking store calls run in the
+thread pool), each chunk retried EVAL_PERSIST_RETRIES times with backoff. The
+batch record is written last and carries the outcome: `state` ("done",
+"partial" or "failed"), `rows` (rows submitted) and `rows_written`.
+
+Each batch's progress is kept in memory (the most recent MAX_TRACKED batches)
+and served by `status()`; batches this worker does not know about are looked up
+in the store. Pending writes are drained on shutdown.
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Callable, Optional
+from app.core.config import settings
+from app.core.metrics import EVAL_PERSIST_CHUNKS, TELEMETRY_QUEUE_DEPTH
+from app.services.telemetry_store import telemetry_store
+
+MAX_TRACKED = 1000
+
+
+class PersistenceService:
+    def __init__(self):
+        self._status = OrderedDict()   # batch_id → progress dict
+        self._tasks = set()
+
+    def submit(self, batch_id: str, rows: list, batch: dict, after: Callable = None) -> dict:
+        """Schedule the batch's writes on the running loop and return its initial status."""
+        chunk_size = max(1, settings.EVAL_PERSIST_CHUNK_SIZE)
+        status = {
+            "batch_id": batch_id,
+            "state": "pending",
+            "rows": len(rows),
+            "rows_written": 0,
+            "chunks": (len(rows) + chunk_size - 1) // chunk_size,
+            "chunks_failed": 0,
+            "error": None,
+            "submitted_at": time.time(),
+            "finished_at": None,
+        }
+        self._status[batch_id] = status
+        while len(self._status) > MAX_TRACKED:
+            self._status.popitem(last=False)
+        TELEMETRY_QUEUE_DEPTH.inc(len(rows))
+        task = asyncio.create_task(self._persist(status, rows, batch, chunk_size, after))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return dict(status)
+
+    async def _write_chunk(self, status: dict, chunk: list, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            for attempt in range(settings.EVAL_PERSIST_RETRIES + 1):
+                try:
+                    # Stores report failures by returning None rather than raising
+                    if await asyncio.to_thread(telemetry_store.log_evaluation, chunk) is not None:
+                        status["rows_written"] += len(chunk)
+                        EVAL_PERSIST_CHUNKS.labels("ok").inc()
+                        return
+                    error = "store rejected the insert"
+                except Exception as e:
+                    error = f"{type(e).__name__}: {e}"
+                EVAL_PERSIST_CHUNKS.labels("retry" if attempt < settings.EVAL_PERSIST_RETRIES else "error").inc()
+                if attempt < settings.EVAL_PERSIST_RETRIES:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+            status["chunks_failed"] += 1
+            status["error"] = error
+
+    async def _persist(self, status: dict, rows: list, batch: dict, chunk_size: int, after: Optional[Callable]):
+        status["state"] = "running"
+        semaphore = asyncio.Semaphore(max(1, settings.EVAL_PERSIST_CONCURRENCY))
+        try:
+            await asyncio.gather(*(
+                self._write_chunk(status, rows[i:i + chunk_size], semaphore)
+                for i in range(0, len(rows), chunk_size)
+            ))
+            if status["chunks_failed"]:
+                status["state"] = "partial" if status["rows_written"] else "failed"
+            else:
+                status["state"] = "done"
+            await asyncio.to_thread(telemetry_store.log_evaluation_batch, {
+                **batch, "state": status["state"], "rows": status["rows"], "rows_written": status["rows_written"],
+            })
+            if after is not None and status["rows_written"]:
+                await asyncio.to_thread(after)
+        except Exception as e:
+            status["state"], status["error"] = "failed", f"{type(e).__name__}: {e}"
+        finally:
+            status["finished_at"] = time.time()
+            TELEMETRY_QUEUE_DEPTH.dec(len(rows))
+            if status["state"] != "done":
+                print(f"Evaluation batch {status['batch_id']} persistence {status['state']}: {status['error']}")
+
+    def status(self, batch_id: str) -> Optional[dict]:
+        """Progress of a batch submitted by this worker, else the outcome recorded with its batch record."""
+        status = self._status.get(batch_id)
+        if status is not None:
+            return dict(status)
+        batch = telemetry_store.get_evaluation_batch(batch_id)
+        if batch is None:
+            return None
+        # Records written before the outcome was stored only exist for batches that finished
+        return {
+            "batch_id": batch_id,
+            "state": batch.get("state") or "done",
+            "rows": batch.get("rows"),
+            "rows_written": batch.get("rows_written", batch.get("rows")),
+        }
+
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, timeout: float = 30.0):
+        """Wait for in-flight batches (shutdown)."""
+        if self._tasks:
+            await asyncio.wait(set(self._tasks), timeout=timeout)
+
+
+# Singleton instance
+persistence_service = PersistenceService()
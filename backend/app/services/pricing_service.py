@@ -1,10 +1,15 @@
 import json
 import os
+from functools import lru_cache
 
-# Load pricing data from JSON
 _pricing_path = os.path.join(os.path.dirname(__file__), "..", "..", "model-pricing.json")
-with open(_pricing_path, "r") as f:
-    PRICING_DATA = json.load(f)
+
+
+@lru_cache(maxsize=1)
+def load_pricing_data() -> dict:
+    """Load pricing data from JSON on first use."""
+    with open(_pricing_path, "r") as f:
+        return json.load(f)
 
 
 class PricingService:
@@ -12,18 +17,29 @@ class PricingService:
     
     Pricing is per 1,000,000 tokens (as defined in the JSON).
     Cost = (input_tokens * input_cost + output_tokens * output_cost) / 1,000,000
+
+    Input tokens served from a provider prompt cache are billed at
+    `cached_input_cost` and tokens written to it at `cache_write_cost`; both
+    default to `input_cost` for models without cache pricing.
     """
 
     @staticmethod
-    def calculate_cost(model_id: str, input_tokens: int, output_tokens: int) -> float:
-        """Calculate the cost for a model invocation."""
+    def calculate_cost(
+        model_id: str, input_tokens: int, output_tokens: int,
+        cached_input_tokens: int = 0, cache_write_tokens: int = 0,
+    ) -> float:
+        """Calculate the cost for a model invocation.
+
+        `input_tokens` is the total prompt size, including any cached and cache-write tokens.
+        """
         # Strip provider prefixes for lookup (e.g., "meta/llama-3.3..." → check as-is first)
-        pricing = PRICING_DATA.get(model_id)
+        pricing_data = load_pricing_data()
+        pricing = pricing_data.get(model_id)
 
         # Try without provider prefix (e.g., "mistral.mistral-small-2402-v1:0")
         if not pricing:
             # Try matching by partial key
-            for key, val in PRICING_DATA.items():
+            for key, val in pricing_data.items():
                 if key in model_id or model_id in key:
                     pricing = val
                     break
@@ -33,17 +49,26 @@ class PricingService:
 
         input_cost = pricing.get("input_cost") or 0.0
         output_cost = pricing.get("output_cost") or 0.0
+        cached_cost = pricing.get("cached_input_cost", input_cost)
+        write_cost = pricing.get("cache_write_cost", input_cost)
         per_tokens = pricing.get("tokens", 1_000_000)
 
-        cost = (input_tokens * input_cost + output_tokens * output_cost) / per_tokens
+        uncached = max(input_tokens - cached_input_tokens - cache_write_tokens, 0)
+        cost = (
+            uncached * input_cost
+            + cached_input_tokens * cached_cost
+            + cache_write_tokens * write_cost
+            + output_tokens * output_cost
+        ) / per_tokens
         return round(cost, 8)
 
     @staticmethod
     def get_pricing_info(model_id: str) -> dict:
         """Get raw pricing info for a model."""
-        pricing = PRICING_DATA.get(model_id, {})
+        pricing_data = load_pricing_data()
+        pricing = pricing_data.get(model_id, {})
         if not pricing:
-            for key, val in PRICING_DATA.items():
+            for key, val in pricing_data.items():
                 if key in model_id or model_id in key:
                     return val
         return pricing
@@ -0,0 +1,274 @@
+"""
+Profiling Service — on-demand sampling CPU profiles and tracemalloc snapshots.
+
+Nothing here runs until an admin asks for it. The sampler is a background
+thread that reads `sys._current_frames()` at a fixed interval and aggregates
+identical stacks, so it works on a live worker without instrumenting code.
+Results are kept in memory (bounded) and exported as collapsed stacks
+(flamegraph.pl / speedscope import) or speedscope JSON.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import OrderedDict
+from app.core.security import is_admin_token
+
+MAX_STORED_PROFILES = 20
+MAX_STORED_SNAPSHOTS = 10
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads (except its own) every `interval` seconds."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.started_at = None
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.duration = time.time() - self.started_at
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                key = tuple(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            self.samples += 1
+
+    @staticmethod
+    def _frame_label(frame: tuple) -> str:
+        name, filename, line = frame
+        return f"{name} ({os.path.basename(filename)}:{line})"
+
+    def collapsed(self) -> str:
+        """Brendan Gregg collapsed-stack format: `root;child;leaf <count>` per line."""
+        lines = [
+            ";".join(self._frame_label(f) for f in stack) + f" {count}"
+            for stack, count in sorted(list(self.stacks.items()), key=lambda kv: -kv[1])
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> dict:
+        """speedscope 'sampled' profile with one weighted sample per unique stack."""
+        frame_index = {}
+        frames = []
+        samples = []
+        weights = []
+        for stack, count in list(self.stacks.items()):
+            indices = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indices.append(frame_index[frame])
+            samples.append(indices)
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "ai-governance-profiler",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(sum(weights), 6),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+    def summary(self, top: int = 10) -> dict:
+        """Hottest leaf frames by sample share."""
+        leaves = {}
+        total = 0
+        for stack, count in list(self.stacks.items()):
+            if stack:
+                label = self._frame_label(stack[-1])
+                leaves[label] = leaves.get(label, 0) + count
+                total += count
+        hottest = sorted(leaves.items(), key=lambda kv: -kv[1])[:top]
+        return {
+            "samples": self.samples,
+            "duration_s": round(self.duration, 3),
+            "interval_ms": self.interval * 1000,
+            "top_frames": [
+                {"frame": label, "share": round(count / total, 4) if total else 0.0}
+                for label, count in hottest
+            ],
+        }
+
+
+class ProfilingService:
+    """Keeps recent CPU profiles and tracemalloc snapshots for the admin API."""
+
+    def __init__(self):
+        self._profiles = OrderedDict()
+        self._snapshots = OrderedDict()
+        self._cpu_lock = threading.Lock()
+
+    # ── CPU profiles ────────────────────────────────────────
+
+    def start_sampler(self, interval: float) -> SamplingProfiler:
+        profiler = SamplingProfiler(interval)
+        profiler.start()
+        return profiler
+
+    def store_profile(self, profiler: SamplingProfiler, label: str) -> str:
+        profile_id = uuid.uuid4().hex[:12]
+        self._profiles[profile_id] = {
+            "id": profile_id,
+            "label": label,
+            "created_at": profiler.started_at,
+            "profiler": profiler,
+        }
+        while len(self._profiles) > MAX_STORED_PROFILES:
+            self._profiles.popitem(last=False)
+        return profile_id
+
+    def try_acquire_cpu(self) -> bool:
+        """Only one time-boxed worker profile may run at once."""
+        return self._cpu_lock.acquire(blocking=False)
+
+    def release_cpu(self):
+        self._cpu_lock.release()
+
+    def list_profiles(self) -> list:
+        return [
+            {"id": p["id"], "label": p["label"], "created_at": p["created_at"], **p["profiler"].summary(top=3)}
+            for p in reversed(self._profiles.values())
+        ]
+
+    def get_profile(self, profile_id: str):
+        entry = self._profiles.get(profile_id)
+        return entry["profiler"] if entry else None
+
+    # ── tracemalloc ─────────────────────────────────────────
+
+    def tracemalloc_start(self, frames: int = 25) -> dict:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        return self.tracemalloc_status()
+
+    def tracemalloc_stop(self) -> dict:
+        tracemalloc.stop()
+        self._snapshots.clear()
+        return self.tracemalloc_status()
+
+    def tracemalloc_status(self) -> dict:
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        return {
+            "tracing": tracemalloc.is_tracing(),
+            "current_bytes": current,
+            "peak_bytes": peak,
+            "snapshots": list(self._snapshots.keys()),
+        }
+
+    def tracemalloc_snapshot(self, top: int = 20) -> dict:
+        if not tracemalloc.is_tracing():
+            raise ValueError("tracemalloc is not running")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        snapshot_id = uuid.uuid4().hex[:12]
+        self._snapshots[snapshot_id] = snapshot
+        while len(self._snapshots) > MAX_STORED_SNAPSHOTS:
+            self._snapshots.popitem(last=False)
+        stats = snapshot.statistics("lineno")
+        return {
+            "id": snapshot_id,
+            "total_bytes": sum(s.size for s in stats),
+            "top": [
+                {"location": str(s.traceback), "size_bytes": s.size, "count": s.count}
+                for s in stats[:top]
+            ],
+        }
+
+    def tracemalloc_diff(self, from_id: str, to_id: str, top: int = 20) -> dict:
+        old = self._snapshots.get(from_id)
+        new = self._snapshots.get(to_id)
+        if old is None or new is None:
+            raise KeyError("Unknown snapshot id")
+        diff = new.compare_to(old, "lineno")
+        return {
+            "from": from_id,
+            "to": to_id,
+            "size_diff_bytes": sum(d.size_diff for d in diff),
+            "top": [
+                {
+                    "location": str(d.traceback),
+                    "size_diff_bytes": d.size_diff,
+                    "count_diff": d.count_diff,
+                    "size_bytes": d.size,
+                }
+                for d in diff[:top]
+            ],
+        }
+
+
+profiling_service = ProfilingService()
+
+
+class RequestProfilingMiddleware:
+    """Profile individual requests flagged with `X-Profile-Request: 1` plus a valid admin token.
+
+    Only installed when PROFILING_ENABLED is set, so it costs nothing otherwise.
+    The sampler sees every thread in the worker, so concurrent requests show up
+    in the profile too. The stored profile id is returned in `X-Profile-Id`.
+    """
+
+    def __init__(self, app, interval: float = 0.005):
+        self.app = app
+        self.interval = interval
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        flagged = headers.get(b"x-profile-request", b"").lower() in (b"1", b"true")
+        if not flagged or not is_admin_token(headers.get(b"x-admin-token", b"").decode()):
+            await self.app(scope, receive, send)
+            return
+
+        profiler = profiling_service.start_sampler(self.interval)
+        profile_id = profiling_service.store_profile(profiler, f"{scope['method']} {scope['path']}")
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"x-profile-id", profile_id.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # Joins the sampler thread: keep that off the event loop
+            await asyncio.to_thread(profiler.stop)
@@ -0,0 +1,235 @@
+"""
+Region Service — candidate regions per model, health probing and failover.
+
+Vertex MaaS (Meta, DeepSeek) and Bedrock models can be served from several
+regions. Candidates come from `MODEL_REGIONS` in the model matrix, overridden
+per model by the MODEL_REGIONS setting; Bedrock models default to
+BEDROCK_REGIONS (or AWS_REGION).
+
+Health is tracked two ways:
+
+    probes   every REGION_PROBE_INTERVAL seconds each regional host gets a cheap
+             unauthenticated GET. Any HTTP answer below 500 counts as up, and its
+             round trip feeds a per-region latency EWMA. Probes also keep a warm
+             connection to every candidate host in the shared pool.
+    calls    a provider call that fails with a connection error, timeout, 429/5xx
+             or throttling puts that (model, region) into a cooldown that doubles
+             on each consecutive failure, capped at 8x REGION_COOLDOWN. A success
+             clears it.
+
+`call()` tries candidates fastest-first, skipping regions that are down or
+cooling down (they are still tried last, so a model never becomes unreachable
+because of stale health), and moves to the next region on a retryable error.
+Other errors (bad request, auth, context length) are raised straight away.
+"""
+import asyncio
+import threading
+import time
+from typing import Callable
+from app.core.config import settings
+from app.core.metrics import REGION_FAILOVERS, REGION_PROBE_LATENCY
+from app.core.model_matrix import DEFAULT_REGIONS, MODEL_REGIONS, MODEL_REGISTRY, get_live_gateway
+from app.services.connection_manager import connection_manager
+
+EWMA_ALPHA = 0.3
+MAX_COOLDOWN_FACTOR = 8
+
+# Gateways whose calls are routed per region, and the host family their probes go to
+REGIONAL_GATEWAYS = {"vertex_openai": "vertex", "vertex_openai_deepseek": "vertex", "bedrock": "bedrock"}
+
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504, 529}
+_RETRYABLE_AWS_CODES = {
+    "ThrottlingException", "ServiceUnavailableException", "ModelNotReadyException",
+    "InternalServerException", "ServiceQuotaExceededException", "ModelTimeoutException",
+}
+_RETRYABLE_NAMES = ("Connection", "Timeout", "Connect", "RateLimit", "InternalServer", "ServiceUnavailable")
+
+
+def vertex_root(region: str) -> str:
+    if settings.VERTEX_MAAS_BASE_URL:
+        return settings.VERTEX_MAAS_BASE_URL.rstrip("/")
+    if region == "global":
+        return "https://aiplatform.googleapis.com"
+    return f"https://{region}-aiplatform.googleapis.com"
+
+
+def bedrock_root(region: str) -> str:
+    return (settings.BEDROCK_ENDPOINT_URL or f"https://bedrock-runtime.{region}.amazonaws.com").rstrip("/")
+
+
+_PROBE_ROOTS = {"vertex": vertex_root, "bedrock": bedrock_root}
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for errors another region might not have: transport failures, capacity, 5xx."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in _RETRYABLE_STATUS
+    response = getattr(error, "response", None)
+    if isinstance(response, dict):   # botocore ClientError
+        code = response.get("Error", {}).get("Code", "")
+        http_status = response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+        return code in _RETRYABLE_AWS_CODES or http_status in _RETRYABLE_STATUS
+    return any(name in type(error).__name__ for name in _RETRYABLE_NAMES)
+
+
+class RegionHealth:
+    """Probe and call outcomes for one regional host, or one model in one region."""
+
+    __slots__ = ("latency_ms", "up", "failures", "cooldown_until", "last_error", "last_probe")
+
+    def __init__(self):
+        self.latency_ms = None     # EWMA of probe round trips
+        self.up = True
+        self.failures = 0          # Consecutive failed calls
+        self.cooldown_until = 0.0
+        self.last_error = None
+        self.last_probe = None
+
+    def available(self, now: float) -> bool:
+        return self.up and now >= self.cooldown_until
+
+    def snapshot(self, now: float) -> dict:
+        return {
+            "latency_ms": round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            "up": self.up,
+            "failures": self.failures,
+            "cooldown_s": round(max(0.0, self.cooldown_until - now), 1),
+            "last_error": self.last_error,
+        }
+
+
+class RegionRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hosts = {}     # (family, region) → RegionHealth (probes)
+        self._models = {}    # (model_id, region) → RegionHealth (call outcomes)
+
+    # ── Candidates ──────────────────────────────────────────
+
+    def regions(self, gateway: str, model_id: str) -> list:
+        """Configured candidate regions for a model, in preference order."""
+        configured = settings.MODEL_REGIONS.get(model_id) or MODEL_REGIONS.get(model_id)
+        if configured:
+            return list(configured)
+        if gateway == "bedrock":
+            return [r.strip() for r in settings.BEDROCK_REGIONS.split(",") if r.strip()] or [settings.AWS_REGION]
+        return list(DEFAULT_REGIONS.get(gateway, ["us-central1"]))
+
+    def _health(self, table: dict, key: tuple) -> RegionHealth:
+        health = table.get(key)
+        if health is None:
+            with self._lock:
+                health = table.setdefault(key, RegionHealth())
+        return health
+
+    def ranked(self, gateway: str, model_id: str) -> list:
+        """Candidates fastest-first; unavailable ones last, in configured order."""
+        family, now = REGIONAL_GATEWAYS[gateway], time.time()
+        candidates = self.regions(gateway, model_id)
+
+        def key(indexed):
+            index, region = indexed
+            host = self._health(self._hosts, (family, region))
+            model = self._health(self._models, (model_id, region))
+            available = host.available(now) and model.available(now)
+            latency = host.latency_ms if host.latency_ms is not None else float("inf")
+            return (not available, latency if available else 0, index)
+
+        return [region for _, region in sorted(enumerate(candidates), key=key)]
+
+    # ── Calls ───────────────────────────────────────────────
+
+    def record_success(self, model_id: str, region: str):
+        health = self._health(self._models, (model_id, region))
+        health.failures, health.cooldown_until = 0, 0.0
+
+    def record_failure(self, model_id: str, region: str, error: Exception):
+        health = self._health(self._models, (model_id, region))
+        with self._lock:
+            health.failures += 1
+            factor = min(2 ** (health.failures - 1), MAX_COOLDOWN_FACTOR)
+            health.cooldown_until = time.time() + settings.REGION_COOLDOWN * factor
+            health.last_error = f"{type(error).__name__}: {error}"[:200]
+
+    def call(self, gateway: str, model_id: str, fn: Callable[[str, bool], dict]) -> dict:
+        """Run `fn(region, last)` in the best region, failing over to the next on retryable errors.
+
+        `last` is True for the final candidate: only then should the SDK spend time
+        on its own retries, earlier attempts are better spent in another region.
+        """
+        regions = self.ranked(gateway, model_id)
+        for attempt, region in enumerate(regions):
+            try:
+                result = fn(region, attempt == len(regions) - 1)
+            except Exception as e:
+                if not is_retryable(e):
+                    raise
+                self.record_failure(model_id, region, e)
+                if attempt == len(regions) - 1:
+                    raise
+                REGION_FAILOVERS.labels(gateway, region).inc()
+                print(f"Region {region} failed for {model_id} ({type(e).__name__}); failing over")
+                continue
+            self.record_success(model_id, region)
+            result["region"] = region
+            return result
+
+    # ── Probes ──────────────────────────────────────────────
+
+    def probe_targets(self, gateways: list) -> set:
+        """(family, region) pairs hosting a candidate of any registry model on the given gateways."""
+        targets = set()
+        for entry in MODEL_REGISTRY:
+            gateway = get_live_gateway(entry["provider"])
+            if gateway in gateways and gateway in REGIONAL_GATEWAYS:
+                family = REGIONAL_GATEWAYS[gateway]
+                targets.update((family, r) for r in self.regions(gateway, entry["model_id"]))
+        return targets
+
+    def probe(self, family: str, region: str):
+        health = self._health(self._hosts, (family, region))
+        start = time.perf_counter()
+        try:
+            response = connection_manager.http_client().get(
+                _PROBE_ROOTS[family](region), timeout=settings.REGION_PROBE_TIMEOUT
+            )
+            response.close()
+            up = response.status_code < 500
+            error = None if up else f"HTTP {response.status_code}"
+        except Exception as e:
+            up, error = False, f"{type(e).__name__}: {e}"[:200]
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            health.up, health.last_error, health.last_probe = up, error, time.time()
+            if up:
+                health.latency_ms = elapsed_ms if health.latency_ms is None else (
+                    EWMA_ALPHA * elapsed_ms + (1 - EWMA_ALPHA) * health.latency_ms
+                )
+        REGION_PROBE_LATENCY.labels(family, region).observe(elapsed_ms / 1000)
+
+    async def probe_all(self, gateways: list):
+        await asyncio.gather(*(asyncio.to_thread(self.probe, f, r) for f, r in self.probe_targets(gateways)))
+
+    async def run_prober(self, gateways: list):
+        """Background task: probe every candidate region until cancelled."""
+        while True:
+            try:
+                await self.probe_all(gateways)
+            except Exception as e:
+                print(f"Region probe error: {e}")
+            await asyncio.sleep(settings.REGION_PROBE_INTERVAL)
+
+    def stats(self) -> dict:
+        now = time.time()
+        return {
+            "hosts": {f"{f}:{r}": h.snapshot(now) for (f, r), h in sorted(self._hosts.items())},
+            "models": {
+                f"{m}@{r}": h.snapshot(now)
+                for (m, r), h in sorted(self._models.items()) if h.failures or h.last_error
+            },
+        }
+
+
+# Singleton instance
+region_router = RegionRouter()
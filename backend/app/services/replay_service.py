@@ -0,0 +1,121 @@
+"""
+Replay Service — record/replay cassettes for deterministic gateway runs.
+
+In `record` mode every live provider call is written to a cassette: a SQLite
+file keyed by a hash of the normalized request, holding the zlib-compressed
+response, token usage and observed latency. In `replay` mode `get_gateway`
+routes every provider to the `replay` gateway, which serves responses from the
+cassette (optionally sleeping for the recorded latency) without any network
+call. Repeated recordings of the same request are replayed round-robin.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from app.core.config import settings
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+    key TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    provider TEXT NOT NULL,
+    model_id TEXT NOT NULL,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    latency_ms INTEGER,
+    response BLOB NOT NULL,
+    recorded_at REAL NOT NULL,
+    PRIMARY KEY (key, seq)
+)
+"""
+
+
+def cassette_key(provider: str, model_id: str, prompt: str, image_bytes: bytes = None, **params) -> str:
+    """Stable hash of everything that influences a provider response."""
+    request = {
+        "provider": provider,
+        "model_id": model_id,
+        "prompt": prompt,
+        "image": hashlib.sha256(image_bytes).hexdigest() if image_bytes else None,
+        **{k: v for k, v in params.items() if v is not None},
+    }
+    canonical = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class CassetteMiss(ValueError):
+    """Raised in replay mode when no recording matches the request."""
+
+
+class ReplayService:
+    def __init__(self, path: str = None):
+        self._path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._cursors = {}
+
+    @property
+    def path(self) -> str:
+        return self._path or settings.CASSETTE_PATH
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def record(self, key: str, provider: str, model_id: str, result: dict):
+        """Append a live response to the cassette."""
+        payload = zlib.compress(json.dumps(result, default=str).encode())
+        with self._lock:
+            db = self._db()
+            (seq,) = db.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM interactions WHERE key = ?", (key,)).fetchone()
+            db.execute(
+                "INSERT INTO interactions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, seq, provider, model_id, result.get("input_tokens"), result.get("output_tokens"),
+                 result.get("latency_ms"), payload, time.time()),
+            )
+            db.commit()
+
+    def lookup(self, key: str) -> dict:
+        """Next recorded response for a key (round-robin over recordings)."""
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT response, latency_ms FROM interactions WHERE key = ? ORDER BY seq", (key,)
+            ).fetchall()
+            if not rows:
+                raise CassetteMiss("No cassette recording matches this request")
+            index = self._cursors.get(key, 0)
+            self._cursors[key] = index + 1
+        response, latency_ms = rows[index % len(rows)]
+        result = json.loads(zlib.decompress(response))
+        result["recorded_latency_ms"] = latency_ms
+        return result
+
+    async def replay(self, key: str) -> dict:
+        result = await asyncio.to_thread(self.lookup, key)
+        if settings.REPLAY_LATENCY and result.get("recorded_latency_ms"):
+            await asyncio.sleep(result["recorded_latency_ms"] / 1000)
+        return result
+
+    def stats(self) -> dict:
+        info = {"mode": settings.GATEWAY_MODE, "path": self.path}
+        if not os.path.exists(self.path):
+            return {**info, "interactions": 0, "unique_requests": 0}
+        with self._lock:
+            total, unique = self._db().execute(
+                "SELECT COUNT(*), COUNT(DISTINCT key) FROM interactions"
+            ).fetchone()
+        return {**info, "interactions": total, "unique_requests": unique, "size_bytes": os.path.getsize(self.path)}
+
+
+replay_service = ReplayService()
@@ -1,53 +1,194 @@
-from supabase import create_client, Client
+import threading
+from collections import OrderedDict
+from typing import Optional
 from app.core.config import settings
+from app.services.telemetry_store import (
+    BLOB_FIELDS, EXPORT_PAGE_SIZE, KNOWN_BLOBS_MAX, TEXT_CACHE_MAX, TelemetryStore, blob_digest,
+)
 
+PAGE_SIZE = 1000  # PostgREST's default max rows per response
+# Hashes per `in` filter, so blob lookups stay within request URL limits
+BLOB_IN_CHUNK = 100
 
-class SupabaseService:
-    """Service for logging telemetry data to Supabase."""
+
+class SupabaseService(TelemetryStore):
+    """Service for logging telemetry data to Supabase.
+
+    Like the SQLite store, prompt and response text is content-addressed: rows of
+    `telemetry`, `evaluations` and `evaluation_checkpoints` carry `prompt_hash` /
+    `response_hash` (hex SHA-256 prefixes) and each distinct text is stored once in
+    `blobs`, where Postgres compresses it. Rows written before that keep their inline text.
+    """
+
+    backend = "supabase"
 
     def __init__(self):
-        self.client: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        self._client = None
+        self._lock = threading.Lock()
+        self._known_blobs = OrderedDict()
+        self._texts = OrderedDict()    # Recently hydrated digest → text
+
+    @property
+    def client(self):
+        """Supabase client, created on first use so imports never touch the network."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from supabase import create_client
+                    self._client = create_client(settings.SUPABASE_URL, settings.SUPABASE_KEY)
+        return self._client
+
+    def is_configured(self) -> bool:
+        return bool(settings.SUPABASE_URL and settings.SUPABASE_KEY)
+
+    def warm_up(self) -> bool:
+        """Create the client ahead of the first request if Supabase is configured."""
+        if not self.is_configured():
+            return False
+        try:
+            self.client
+            return True
+        except Exception as e:
+            print(f"WARNING: could not initialise Supabase client: {e}")
+            return False
+
+    # ── Blobs ───────────────────────────────────────────────
+
+    @staticmethod
+    def _blob_refs(record: dict, texts: dict) -> dict:
+        """Swap a record's blob fields for `<field>_hash` digests (None without text), collecting the
+        texts into `texts`. Every record gets both keys, as bulk inserts need uniform columns."""
+        for field in BLOB_FIELDS:
+            text = record.pop(field, None)
+            if text is None:
+                record[f"{field}_hash"] = None
+                continue
+            text = text if isinstance(text, str) else str(text)
+            digest = blob_digest(text).hex()
+            texts[digest] = text
+            record[f"{field}_hash"] = digest
+        return record
+
+    def _store_blobs(self, texts: dict):
+        """Upsert the blobs not known to be stored, before the rows that reference them."""
+        rows = [{"hash": d, "size": len(text), "data": text} for d, text in texts.items() if d not in self._known_blobs]
+        if not rows:
+            return
+        self.client.table("blobs").upsert(rows, on_conflict="hash", ignore_duplicates=True).execute()
+        with self._lock:
+            for row in rows:
+                self._known_blobs[row["hash"]] = None
+            while len(self._known_blobs) > KNOWN_BLOBS_MAX:
+                self._known_blobs.popitem(last=False)
+
+    def _load_blobs(self, digests: set) -> dict:
+        """digest → text, from the hydrated-text cache or one `in` lookup per chunk."""
+        texts = {d: self._texts[d] for d in digests if d in self._texts}
+        missing = [d for d in digests if d not in texts]
+        loaded = {}
+        for i in range(0, len(missing), BLOB_IN_CHUNK):
+            rows = (
+                self.client.table("blobs").select("hash, data")
+                .in_("hash", missing[i:i + BLOB_IN_CHUNK]).execute().data or []
+            )
+            loaded.update((row["hash"], row["data"]) for row in rows)
+        if loaded:
+            with self._lock:
+                self._texts.update(loaded)
+                while len(self._texts) > TEXT_CACHE_MAX:
+                    self._texts.popitem(last=False)
+        return {**texts, **loaded}
+
+    def _hydrate(self, records: list, hydrate: bool = True) -> list:
+        """Fill the blob fields of a page from its hashes in one lookup, or keep only the hashes
+        with hydrate=False. Rows written before blobs existed keep their inline text."""
+        keys = [(field, f"{field}_hash") for field in BLOB_FIELDS]
+        texts = self._load_blobs({r[k] for r in records for _, k in keys if r.get(k)}) if hydrate else {}
+        for record in records:
+            for field, key in keys:
+                digest = record.pop(key, None)
+                if digest is None:
+                    continue
+                if hydrate:
+                    record[field] = texts.get(digest)
+                else:
+                    record.pop(field, None)
+                    record[key] = digest
+        return records
+
+    def get_blob(self, digest: str) -> Optional[str]:
+        return self._load_blobs({digest.lower()}).get(digest.lower())
+
+    # ── Telemetry ───────────────────────────────────────────
 
     def log_telemetry(self, data: dict) -> dict:
         """Insert a telemetry record into the database."""
-        result = self.client.table("telemetry").insert(data).execute()
+        texts = {}
+        row = self._blob_refs(dict(data), texts)
+        self._store_blobs(texts)
+        result = self.client.table("telemetry").insert(row).execute()
         return result.data[0] if result.data else {}
 
-    def get_all_telemetry(self) -> list:
+    def get_all_telemetry(self, limit: int = None, hydrate: bool = True) -> list:
         """Fetch all telemetry records, newest first."""
-        result = (
+        query = (
             self.client.table("telemetry")
             .select("*")
             .order("created_at", desc=True)
-            .execute()
         )
-        return result.data or []
+        if limit:
+            query = query.limit(limit)
+        result = query.execute()
+        return self._hydrate(result.data or [], hydrate)
 
-    def get_analytics_summary(self) -> dict:
-        """Get aggregated analytics."""
-        data = self.get_all_telemetry()
+    def _pages(self, table: str, columns: str, since=None, until=None, page_size: int = PAGE_SIZE,
+               desc: bool = False):
+        """Rows of `table` in [since, until), filtered server-side and fetched page by page."""
+        start = 0
+        while True:
+            # Builders accumulate params, so each page gets a fresh query
+            query = self.client.table(table).select(columns)
+            if since is not None:
+                query = query.gte("created_at", since.isoformat() if hasattr(since, "isoformat") else since)
+            if until is not None:
+                query = query.lt("created_at", until.isoformat() if hasattr(until, "isoformat") else until)
+            query = query.order("created_at", desc=desc)
+            page = query.range(start, start + page_size - 1).execute().data or []
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            start += page_size
 
-        total_cost = sum(float(r.get("cost", 0) or 0) for r in data)
-        total_input = sum(int(r.get("input_tokens", 0) or 0) for r in data)
-        total_output = sum(int(r.get("output_tokens", 0) or 0) for r in data)
+    def _rows(self, since=None, until=None):
+        for page in self._pages(
+            "telemetry",
+            "created_at, provider, model_id, use_case, input_tokens, output_tokens, cached_input_tokens, cost, "
+            "latency_ms",
+            since, until, desc=True,
+        ):
+            yield from page
 
-        return {
-            "total_requests": len(data),
-            "total_cost": round(total_cost, 6),
-            "total_input_tokens": total_input,
-            "total_output_tokens": total_output,
-            "data": data,
-        }
+    def iter_telemetry(self, since=None, until=None, page_size: int = EXPORT_PAGE_SIZE, hydrate: bool = True):
+        for page in self._pages("telemetry", "*", since, until, min(page_size, PAGE_SIZE)):
+            yield self._hydrate(page, hydrate)
+
+    def iter_evaluations(self, since=None, until=None, page_size: int = EXPORT_PAGE_SIZE, hydrate: bool = True):
+        for page in self._pages("evaluations", "*", since, until, min(page_size, PAGE_SIZE)):
+            yield self._hydrate(page, hydrate)
 
     def log_evaluation(self, data: list):
         """Insert evaluation results into the database."""
+        texts = {}
+        rows = [self._blob_refs(dict(r), texts) for r in data]
         try:
-            return self.client.table("evaluations").insert(data).execute()
+            self._store_blobs(texts)
+            return self.client.table("evaluations").insert(rows).execute()
         except Exception as e:
             print(f"Supabase evaluation logging error: {e}")
             return None
 
-    def get_evaluations(self, limit: int = 100):
+    def get_evaluations(self, limit: int = 100, hydrate: bool = True):
         """Fetch evaluation history."""
         try:
             result = (
@@ -57,11 +198,92 @@ class SupabaseService:
                 .limit(limit)
                 .execute()
             )
-            return result.data or []
+            return self._hydrate(result.data or [], hydrate)
         except Exception as e:
             print(f"Supabase fetch evaluations error: {e}")
             return []
 
+    def log_evaluation_batch(self, batch: dict):
+        """Upsert a batch record (summary metrics and write outcome) into `evaluation_batches`;
+        a resumed batch rewrites its record."""
+        try:
+            return self.client.table("evaluation_batches").upsert(batch).execute()
+        except Exception as e:
+            print(f"Supabase batch logging error: {e}")
+            return None
+
+    def get_evaluation_batch(self, batch_id: str):
+        try:
+            result = self.client.table("evaluation_batches").select("*").eq("batch_id", batch_id).limit(1).execute()
+            return result.data[0] if result.data else None
+        except Exception as e:
+            print(f"Supabase fetch batch error: {e}")
+            return None
+
+    def save_evaluation_run(self, batch_id: str, run: dict):
+        """Upsert a resumable run spec into `evaluation_runs`."""
+        try:
+            return self.client.table("evaluation_runs").upsert({"batch_id": batch_id, "data": run}).execute()
+        except Exception as e:
+            print(f"Supabase run logging error: {e}")
+            return None
+
+    def get_evaluation_run(self, batch_id: str):
+        try:
+            result = self.client.table("evaluation_runs").select("*").eq("batch_id", batch_id).limit(1).execute()
+            if not result.data:
+                return None
+            row = result.data[0]
+            return {"created_at": row.get("created_at"), **(row.get("data") or {})}
+        except Exception as e:
+            print(f"Supabase fetch run error: {e}")
+            return None
+
+    def checkpoint_cells(self, batch_id: str, cells: list):
+        """Upsert completed cells into `evaluation_checkpoints` (primary key batch_id, cell)."""
+        rows, texts = [], {}
+        for cell, ok, result in cells:
+            refs = self._blob_refs({f: result.get(f) for f in BLOB_FIELDS}, texts)
+            rows.append({
+                "batch_id": batch_id, "cell": cell, "ok": bool(ok), "persisted": False,
+                "data": {k: v for k, v in result.items() if k not in BLOB_FIELDS},
+                **refs,
+            })
+        try:
+            self._store_blobs(texts)
+            return self.client.table("evaluation_checkpoints").upsert(rows).execute()
+        except Exception as e:
+            print(f"Supabase checkpoint error: {e}")
+            return None
+
+    def get_checkpoints(self, batch_id: str) -> list:
+        rows = []
+        start = 0
+        while True:
+            page = (
+                self.client.table("evaluation_checkpoints")
+                .select("cell, ok, persisted, data, prompt_hash, response_hash")
+                .eq("batch_id", batch_id).order("cell").range(start, start + PAGE_SIZE - 1).execute().data or []
+            )
+            rows.extend(page)
+            if len(page) < PAGE_SIZE:
+                break
+            start += PAGE_SIZE
+        results = self._hydrate([
+            {**(r["data"] or {}), **{f"{f}_hash": r.get(f"{f}_hash") for f in BLOB_FIELDS}} for r in rows
+        ])
+        return [
+            {"cell": r["cell"], "ok": r["ok"], "persisted": r["persisted"], "result": result}
+            for r, result in zip(rows, results)
+        ]
+
+    def mark_checkpoints_persisted(self, batch_id: str, cells: list):
+        for start in range(0, len(cells), PAGE_SIZE):
+            (
+                self.client.table("evaluation_checkpoints").update({"persisted": True})
+                .eq("batch_id", batch_id).in_("cell", cells[start:start + PAGE_SIZE]).execute()
+            )
+
 
 # Singleton instance
 supabase_service = SupabaseService()
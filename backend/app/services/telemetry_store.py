@@ -0,0 +1,830 @@
+"""
+Telemetry Store — where chat telemetry and evaluation results are written and analysed.
+
+TELEMETRY_BACKEND selects the implementation behind `telemetry_store`:
+
+    supabase   SupabaseService: the hosted Postgres tables, via the REST client
+    sqlite     SQLiteTelemetryStore: an embedded file at TELEMETRY_DB_PATH
+
+Both answer the same analytical queries — totals, group-bys, percentiles and
+time buckets — with optional [since, until) bounds. The base class computes
+them over fetched rows; the SQLite store runs them in SQL. Totals, group-bys
+and buckets whose bounds align to an hour (or minute) are read from hourly
+(or per-minute) rollups maintained on insert, so they stay in milliseconds
+over millions of rows. Unaligned windows and percentiles scan the raw rows
+through the time index.
+
+The SQLite store keeps prompt and response text out of its rows: each distinct
+text is stored once, zlib-compressed, in `blobs` under a 128-bit SHA-256 prefix,
+and rows reference it by hash. A prompt repeated across models, batches and
+re-runs costs one blob plus a 16-byte reference per row. Reads hydrate a page
+with a single lookup of its distinct hashes; `hydrate=False` skips that and
+returns the hex hashes instead (`get_blob` resolves one on demand).
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, Optional
+from app.core.config import settings
+
+GROUP_COLUMNS = ("provider", "model_id", "use_case")
+METRIC_COLUMNS = ("latency_ms", "cost", "input_tokens", "output_tokens", "cached_input_tokens")
+TELEMETRY_EXPORT_COLUMNS = (
+    "id", "created_at", "provider", "model_id", "use_case", "prompt", "response", "input_tokens",
+    "output_tokens", "cached_input_tokens", "cost", "latency_ms", "timings",
+)
+EVALUATION_EXPORT_COLUMNS = (
+    "id", "created_at", "batch_id", "prompt", "provider", "model_id", "response", "input_tokens",
+    "output_tokens", "cost", "latency_ms", "scores", "ai_evaluations", "prompt_quality", "criteria",
+)
+EXPORT_PAGE_SIZE = 1000
+# Row fields stored as content-addressed blobs (SQLite and Supabase stores)
+BLOB_FIELDS = ("prompt", "response")
+
+
+def _ts(value) -> Optional[float]:
+    """Epoch seconds for a datetime or ISO string (naive values are UTC)."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat()
+
+
+def _check_column(column: str, allowed: tuple):
+    if column not in allowed:
+        raise ValueError(f"Unsupported column '{column}'; expected one of {', '.join(allowed)}")
+
+
+def blob_digest(text: str) -> bytes:
+    """Content address of a text: the first 16 bytes of its SHA-256."""
+    return hashlib.sha256(text.encode()).digest()[:16]
+
+
+def _nearest_rank(sorted_values: list, p: float):
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+class TelemetryStore:
+    """Interface shared by the telemetry backends, with row-based analytics."""
+
+    backend = "base"
+
+    def is_configured(self) -> bool:
+        raise NotImplementedError
+
+    def warm_up(self) -> bool:
+        return self.is_configured()
+
+    def log_telemetry(self, data: dict) -> dict:
+        raise NotImplementedError
+
+    def get_all_telemetry(self, limit: int = None, hydrate: bool = True) -> list:
+        """Telemetry records, newest first. With hydrate=False, stores that keep prompt and
+        response text as blobs return `prompt_hash` / `response_hash` in their place."""
+        raise NotImplementedError
+
+    def log_evaluation(self, data: list):
+        raise NotImplementedError
+
+    def get_evaluations(self, limit: int = 100, hydrate: bool = True) -> list:
+        raise NotImplementedError
+
+    def get_blob(self, digest: str) -> Optional[str]:
+        """Text stored under a hex content hash, for stores that keep blobs."""
+        return None
+
+    def log_evaluation_batch(self, batch: dict):
+        """Persist one /eval/run batch record (batch_id, criteria, summary_metrics, ...)."""
+        raise NotImplementedError
+
+    def get_evaluation_batch(self, batch_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def save_evaluation_run(self, batch_id: str, run: dict):
+        """Persist the spec of an /eval/run (prompts, models, criteria, judge) so it can be resumed."""
+        raise NotImplementedError
+
+    def get_evaluation_run(self, batch_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def checkpoint_cells(self, batch_id: str, cells: list):
+        """Upsert completed cells as (cell index, ok, result) triples; returns None on failure."""
+        raise NotImplementedError
+
+    def get_checkpoints(self, batch_id: str) -> list:
+        """Checkpointed cells of a batch: {"cell", "ok", "persisted", "result"} dicts, by cell index."""
+        raise NotImplementedError
+
+    def mark_checkpoints_persisted(self, batch_id: str, cells: list):
+        """Flag cells whose evaluation rows have been written."""
+        raise NotImplementedError
+
+    def iter_telemetry(self, since=None, until=None, page_size: int = EXPORT_PAGE_SIZE,
+                       hydrate: bool = True) -> Iterator[list]:
+        """Telemetry in [since, until), oldest first, one page of records at a time."""
+        raise NotImplementedError
+
+    def iter_evaluations(self, since=None, until=None, page_size: int = EXPORT_PAGE_SIZE,
+                         hydrate: bool = True) -> Iterator[list]:
+        """Evaluation results in [since, until), oldest first, one page of records at a time."""
+        raise NotImplementedError
+
+    def _rows(self, since=None, until=None) -> Iterable[dict]:
+        """Telemetry rows with since <= created_at < until."""
+        lo, hi = _ts(since), _ts(until)
+        for row in self.get_all_telemetry():
+            ts = _ts(row.get("created_at"))
+            if (lo is None or ts >= lo) and (hi is None or ts < hi):
+                yield row
+
+    # ── Analytics ───────────────────────────────────────────
+
+    def get_analytics_summary(self, limit: int = None) -> dict:
+        """Aggregated totals plus the most recent records."""
+        return {**self.totals(), "data": self.get_all_telemetry(limit)}
+
+    def totals(self, since=None, until=None) -> dict:
+        groups = self.group_by(None, since, until)
+        total = groups[0] if groups else {"requests": 0, "total_cost": 0.0, "input_tokens": 0, "output_tokens": 0}
+        return {
+            "total_requests": total["requests"],
+            "total_cost": total["total_cost"],
+            "total_input_tokens": total["input_tokens"],
+            "total_output_tokens": total["output_tokens"],
+        }
+
+    def group_by(self, column: Optional[str], since=None, until=None) -> list:
+        """Requests, cost, tokens and mean latency per value of `column` (or overall when None)."""
+        if column is not None:
+            _check_column(column, GROUP_COLUMNS)
+        acc = defaultdict(lambda: [0, 0.0, 0, 0, 0])
+        for row in self._rows(since, until):
+            a = acc[row.get(column) if column else None]
+            a[0] += 1
+            a[1] += float(row.get("cost") or 0)
+            a[2] += int(row.get("input_tokens") or 0)
+            a[3] += int(row.get("output_tokens") or 0)
+            a[4] += int(row.get("latency_ms") or 0)
+        return sorted(
+            (self._group_row(column, key, *values) for key, values in acc.items()),
+            key=lambda r: -r["requests"],
+        )
+
+    def percentiles(self, column: str = "latency_ms", ps: tuple = (50, 95, 99), group_by: str = None,
+                    since=None, until=None) -> list:
+        """Nearest-rank percentiles of a metric column, overall or per group."""
+        _check_column(column, METRIC_COLUMNS)
+        if group_by is not None:
+            _check_column(group_by, GROUP_COLUMNS)
+        values = defaultdict(list)
+        for row in self._rows(since, until):
+            if row.get(column) is not None:
+                values[row.get(group_by) if group_by else None].append(float(row[column]))
+        out = []
+        for key, vals in values.items():
+            vals.sort()
+            entry = {group_by: key} if group_by else {}
+            entry.update({"count": len(vals), **{f"p{p:g}": _nearest_rank(vals, p) for p in ps}})
+            out.append(entry)
+        return sorted(out, key=lambda r: -r["count"])
+
+    def time_buckets(self, bucket_seconds: int = 3600, group_by: str = None, since=None, until=None) -> list:
+        """Per-bucket totals (bucket_start aligned to multiples of bucket_seconds since the epoch)."""
+        if group_by is not None:
+            _check_column(group_by, GROUP_COLUMNS)
+        acc = defaultdict(lambda: [0, 0.0, 0, 0, 0])
+        for row in self._rows(since, until):
+            bucket = int(_ts(row.get("created_at")) // bucket_seconds) * bucket_seconds
+            a = acc[(bucket, row.get(group_by) if group_by else None)]
+            a[0] += 1
+            a[1] += float(row.get("cost") or 0)
+            a[2] += int(row.get("input_tokens") or 0)
+            a[3] += int(row.get("output_tokens") or 0)
+            a[4] += int(row.get("latency_ms") or 0)
+        return [
+            {"bucket_start": _iso(bucket), **self._group_row(group_by, key, *values)}
+            for (bucket, key), values in sorted(acc.items(), key=lambda kv: (kv[0][0], str(kv[0][1])))
+        ]
+
+    @staticmethod
+    def _group_row(column, key, requests, cost, input_tokens, output_tokens, latency_sum) -> dict:
+        row = {column: key} if column else {}
+        row.update({
+            "requests": requests,
+            "total_cost": round(cost, 6),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "avg_latency_ms": round(latency_sum / requests) if requests else 0,
+        })
+        return row
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS telemetry (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    created_ts REAL NOT NULL,
+    provider TEXT,
+    model_id TEXT,
+    use_case TEXT,
+    prompt TEXT,
+    response TEXT,
+    input_tokens INTEGER,
+    output_tokens INTEGER,
+    cached_input_tokens INTEGER,
+    cost REAL,
+    latency_ms INTEGER,
+    extra TEXT,
+    prompt_hash BLOB,
+    response_hash BLOB
+);
+CREATE INDEX IF NOT EXISTS telemetry_ts ON telemetry (created_ts);
+CREATE INDEX IF NOT EXISTS telemetry_latency ON telemetry (latency_ms);
+CREATE INDEX IF NOT EXISTS telemetry_model_latency ON telemetry (model_id, latency_ms);
+CREATE TABLE IF NOT EXISTS telemetry_rollup (
+    granularity INTEGER NOT NULL,
+    period INTEGER NOT NULL,
+    provider TEXT NOT NULL DEFAULT '',
+    model_id TEXT NOT NULL DEFAULT '',
+    use_case TEXT NOT NULL DEFAULT '',
+    requests INTEGER NOT NULL,
+    cost REAL NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    latency_sum INTEGER NOT NULL,
+    PRIMARY KEY (granularity, period, provider, model_id, use_case)
+);
+CREATE TABLE IF NOT EXISTS evaluations (
+    id INTEGER PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    batch_id TEXT,
+    provider TEXT,
+    model_id TEXT,
+    data TEXT NOT NULL,
+    prompt_hash BLOB,
+    response_hash BLOB
+);
+CREATE INDEX IF NOT EXISTS evaluations_created ON evaluations (created_at);
+CREATE INDEX IF NOT EXISTS evaluations_batch ON evaluations (batch_id);
+CREATE TABLE IF NOT EXISTS evaluation_batches (
+    batch_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evaluation_runs (
+    batch_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evaluation_checkpoints (
+    batch_id TEXT NOT NULL,
+    cell INTEGER NOT NULL,
+    ok INTEGER NOT NULL,
+    persisted INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    prompt_hash BLOB,
+    response_hash BLOB,
+    PRIMARY KEY (batch_id, cell)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS blobs (
+    hash BLOB PRIMARY KEY,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL
+) WITHOUT ROWID;
+"""
+# Columns added after the first release, for files created before them
+_MIGRATIONS = {
+    "telemetry": ("prompt_hash BLOB", "response_hash BLOB"),
+    "evaluations": ("prompt_hash BLOB", "response_hash BLOB"),
+}
+# Hashes known to be in `blobs`, so repeated texts skip the existence lookup
+KNOWN_BLOBS_MAX = 100_000
+# Decompressed texts kept for repeated history reads
+TEXT_CACHE_MAX = 4096
+# Host parameters per IN (...) lookup
+_IN_CHUNK = 500
+_TELEMETRY_COLUMNS = (
+    "provider", "model_id", "use_case", "prompt", "response", "input_tokens", "output_tokens",
+    "cached_input_tokens", "cost", "latency_ms",
+)
+_ROLLUP_UPSERT = """
+INSERT INTO telemetry_rollup VALUES (?, ?, ?, ?, ?, 1, ?, ?, ?, ?)
+ON CONFLICT (granularity, period, provider, model_id, use_case) DO UPDATE SET
+    requests = requests + 1,
+    cost = cost + excluded.cost,
+    input_tokens = input_tokens + excluded.input_tokens,
+    output_tokens = output_tokens + excluded.output_tokens,
+    latency_sum = latency_sum + excluded.latency_sum
+"""
+# Rollup granularities in seconds, coarsest first: a query reads the coarsest one its window
+# bounds and bucket width are aligned to
+ROLLUP_GRANULARITIES = (3600, 60)
+_AGGREGATES = "SUM(requests), SUM(cost), SUM(input_tokens), SUM(output_tokens), SUM(latency_sum)"
+_RAW_AGGREGATES = (
+    "COUNT(*), COALESCE(SUM(cost), 0), COALESCE(SUM(input_tokens), 0), "
+    "COALESCE(SUM(output_tokens), 0), COALESCE(SUM(latency_ms), 0)"
+)
+
+
+class SQLiteTelemetryStore(TelemetryStore):
+    """Embedded store: telemetry and evaluations in a local WAL-mode SQLite file."""
+
+    backend = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._lock = threading.Lock()
+        self._known_blobs = OrderedDict()
+        self._texts = OrderedDict()    # Recently hydrated digest → text
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=10.0)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            for table, columns in _MIGRATIONS.items():
+                existing = {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for column in columns:
+                    if column.split()[0] not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column}")
+            self._conn = conn
+        return self._conn
+
+    def is_configured(self) -> bool:
+        return True
+
+    def warm_up(self) -> bool:
+        with self._lock:
+            self._db()
+        return True
+
+    # ── Blobs ───────────────────────────────────────────────
+
+    @staticmethod
+    def _blob_refs(record: dict, texts: dict) -> tuple:
+        """Pop the blob fields off a record: their digests, with the texts collected into `texts`."""
+        refs = []
+        for field in BLOB_FIELDS:
+            text = record.pop(field, None)
+            if text is None:
+                refs.append(None)
+                continue
+            text = text if isinstance(text, str) else str(text)
+            digest = blob_digest(text)
+            texts[digest] = text
+            refs.append(digest)
+        return tuple(refs)
+
+    def _compress_blobs(self, texts: dict) -> dict:
+        """digest → (size, zlib data) for texts not known to be stored; runs outside the lock."""
+        return {
+            d: (len(text), zlib.compress(text.encode())) for d, text in texts.items() if d not in self._known_blobs
+        }
+
+    def _store_blobs(self, db: sqlite3.Connection, blobs: dict) -> list:
+        """Insert the blobs not stored yet (inside the caller's transaction); returns their digests."""
+        digests = list(blobs)
+        stored = set()
+        for i in range(0, len(digests), _IN_CHUNK):
+            chunk = digests[i:i + _IN_CHUNK]
+            stored.update(row[0] for row in db.execute(
+                f"SELECT hash FROM blobs WHERE hash IN ({', '.join('?' * len(chunk))})", chunk
+            ))
+        db.executemany(
+            "INSERT OR IGNORE INTO blobs VALUES (?, ?, ?)",
+            ((d, *blobs[d]) for d in digests if d not in stored),
+        )
+        return digests
+
+    def _remember_blobs(self, digests: list):
+        """Mark digests as stored, once their transaction has committed."""
+        for digest in digests:
+            self._known_blobs[digest] = None
+        while len(self._known_blobs) > KNOWN_BLOBS_MAX:
+            self._known_blobs.popitem(last=False)
+
+    def _load_blobs(self, digests: set) -> dict:
+        """digest → text, from the decompressed-text cache or one IN (...) query per chunk."""
+        texts, missing = {}, []
+        for digest in digests:
+            text = self._texts.get(digest)
+            if text is None:
+                missing.append(digest)
+            else:
+                texts[digest] = text
+        loaded = {}
+        for i in range(0, len(missing), _IN_CHUNK):
+            chunk = missing[i:i + _IN_CHUNK]
+            for digest, data in self._query(
+                f"SELECT hash, data FROM blobs WHERE hash IN ({', '.join('?' * len(chunk))})", chunk
+            ):
+                loaded[digest] = zlib.decompress(data).decode()
+        if loaded:
+            with self._lock:
+                self._texts.update(loaded)
+                while len(self._texts) > TEXT_CACHE_MAX:
+                    self._texts.popitem(last=False)
+        return {**texts, **loaded}
+
+    def _hydrate(self, records: list, refs: list, hydrate: bool) -> list:
+        """Fill each record's blob fields from its (prompt, response) digests, in one lookup per page.
+        Rows written before blobs existed keep their inline text and have no digests."""
+        texts = self._load_blobs({d for pair in refs for d in pair if d is not None}) if hydrate else {}
+        for record, pair in zip(records, refs):
+            for field, digest in zip(BLOB_FIELDS, pair):
+                if digest is None:
+                    continue
+                if hydrate:
+                    record[field] = texts.get(digest)
+                else:
+                    record.pop(field, None)
+                    record[f"{field}_hash"] = digest.hex()
+        return records
+
+    def get_blob(self, digest: str) -> Optional[str]:
+        try:
+            key = bytes.fromhex(digest)
+        except ValueError:
+            return None
+        return self._load_blobs({key}).get(key)
+
+    # ── Writes ──────────────────────────────────────────────
+
+    def log_telemetry(self, data: dict) -> dict:
+        self.log_telemetry_many([data])
+        return data
+
+    def log_telemetry_many(self, rows: list):
+        """Insert telemetry records and fold them into the per-minute rollup in one transaction."""
+        now = datetime.now(timezone.utc)
+        records, rollups, texts = [], [], {}
+        for data in rows:
+            created_at = data.get("created_at") or now.isoformat()
+            ts = _ts(created_at)
+            extra = {k: v for k, v in data.items() if k not in _TELEMETRY_COLUMNS and k != "created_at"}
+            refs = self._blob_refs({f: data.get(f) for f in BLOB_FIELDS}, texts)
+            records.append((
+                created_at, ts, *(None if c in BLOB_FIELDS else data.get(c) for c in _TELEMETRY_COLUMNS),
+                json.dumps(extra, default=str) if extra else None, *refs,
+            ))
+            key = (data.get("provider") or "", data.get("model_id") or "", data.get("use_case") or "")
+            values = (
+                float(data.get("cost") or 0), int(data.get("input_tokens") or 0),
+                int(data.get("output_tokens") or 0), int(data.get("latency_ms") or 0),
+            )
+            rollups.extend((g, int(ts // g), *key, *values) for g in ROLLUP_GRANULARITIES)
+        placeholders = ", ".join("?" * (len(_TELEMETRY_COLUMNS) + 5))
+        blobs = self._compress_blobs(texts)
+        with self._lock:
+            db = self._db()
+            with db:
+                stored = self._store_blobs(db, blobs)
+                db.executemany(
+                    f"INSERT INTO telemetry (created_at, created_ts, {', '.join(_TELEMETRY_COLUMNS)}, extra, "
+                    f"prompt_hash, response_hash) VALUES ({placeholders})",
+                    records,
+                )
+                db.executemany(_ROLLUP_UPSERT, rollups)
+            self._remember_blobs(stored)
+
+    def log_evaluation(self, data: list):
+        created_at = datetime.now(timezone.utc).isoformat()
+        rows, texts = [], {}
+        for r in data:
+            r = dict(r)
+            refs = self._blob_refs(r, texts)
+            rows.append((
+                created_at, r.get("batch_id"), r.get("provider"), r.get("model_id"),
+                json.dumps(r, default=str), *refs,
+            ))
+        try:
+            blobs = self._compress_blobs(texts)
+            with self._lock:
+                db = self._db()
+                with db:
+                    stored = self._store_blobs(db, blobs)
+                    db.executemany(
+                        "INSERT INTO evaluations (created_at, batch_id, provider, model_id, data, prompt_hash, "
+                        "response_hash) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        rows,
+                    )
+                self._remember_blobs(stored)
+            return rows
+        except Exception as e:
+            print(f"Telemetry store evaluation logging error: {e}")
+            return None
+
+    def log_evaluation_batch(self, batch: dict):
+        created_at = batch.get("created_at") or datetime.now(timezone.utc).isoformat()
+        try:
+            with self._lock:
+                db = self._db()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO evaluation_batches VALUES (?, ?, ?)",
+                        (batch["batch_id"], created_at, json.dumps(batch, default=str)),
+                    )
+            return batch
+        except Exception as e:
+            print(f"Telemetry store batch logging error: {e}")
+            return None
+
+    # ── Reads ───────────────────────────────────────────────
+
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        with self._lock:
+            return self._db().execute(sql, params).fetchall()
+
+    def _telemetry_page(self, rows: list, hydrate: bool) -> list:
+        """Records from (id, created_at, *columns, extra, prompt_hash, response_hash, ...) rows."""
+        width = len(_TELEMETRY_COLUMNS)
+        records, refs = [], []
+        for row in rows:
+            record = {"id": row[0], "created_at": row[1], **dict(zip(_TELEMETRY_COLUMNS, row[2:2 + width]))}
+            extra = row[2 + width]
+            if extra:
+                record.update(json.loads(extra))
+            records.append(record)
+            refs.append(row[3 + width:5 + width])
+        return self._hydrate(records, refs, hydrate)
+
+    def _evaluation_page(self, rows: list, hydrate: bool) -> list:
+        """Records from (id, created_at, data, prompt_hash, response_hash) rows."""
+        records = [{"id": row[0], "created_at": row[1], **json.loads(row[2])} for row in rows]
+        return self._hydrate(records, [row[3:5] for row in rows], hydrate)
+
+    def get_all_telemetry(self, limit: int = None, hydrate: bool = True) -> list:
+        rows = self._query(
+            f"SELECT id, created_at, {', '.join(_TELEMETRY_COLUMNS)}, extra, prompt_hash, response_hash "
+            "FROM telemetry ORDER BY created_ts DESC, id DESC" + (" LIMIT ?" if limit else ""),
+            (limit,) if limit else (),
+        )
+        return self._telemetry_page(rows, hydrate)
+
+    def iter_telemetry(self, since=None, until=None, page_size: int = EXPORT_PAGE_SIZE,
+                       hydrate: bool = True) -> Iterator[list]:
+        # Keyset pagination on (created_ts, id): each page is an index range scan
+        where, params = self._window(_ts(since), _ts(until), "created_ts")
+        where = f"{where} AND" if where else " WHERE"
+        cursor = (float("-inf"), -1)
+        while True:
+            rows = self._query(
+                f"SELECT id, created_at, {', '.join(_TELEMETRY_COLUMNS)}, extra, prompt_hash, response_hash, "
+                f"created_ts FROM telemetry{where} (created_ts, id) > (?, ?) ORDER BY created_ts, id LIMIT ?",
+                params + cursor + (page_size,),
+            )
+            if not rows:
+                return
+            yield self._telemetry_page(rows, hydrate)
+            cursor = (rows[-1][-1], rows[-1][0])
+
+    def iter_evaluations(self, since=None, until=None, page_size: int = EXPORT_PAGE_SIZE,
+                         hydrate: bool = True) -> Iterator[list]:
+        # Stored created_at strings pass through unchanged (exact cursors); datetimes are normalised
+        def bound(value):
+            return value if value is None or isinstance(value, str) else _iso(_ts(value))
+        where, params = self._window(bound(since), bound(until), "created_at")
+        where = f"{where} AND" if where else " WHERE"
+        cursor = ("", -1)
+        while True:
+            rows = self._query(
+                f"SELECT id, created_at, data, prompt_hash, response_hash FROM evaluations{where} "
+                "(created_at, id) > (?, ?) ORDER BY created_at, id LIMIT ?",
+                params + cursor + (page_size,),
+            )
+            if not rows:
+                return
+            yield self._evaluation_page(rows, hydrate)
+            cursor = (rows[-1][1], rows[-1][0])
+
+    def get_evaluations(self, limit: int = 100, hydrate: bool = True) -> list:
+        rows = self._query(
+            "SELECT id, created_at, data, prompt_hash, response_hash FROM evaluations "
+            "ORDER BY created_at DESC, id DESC LIMIT ?", (limit,)
+        )
+        return self._evaluation_page(rows, hydrate)
+
+    def get_evaluation_batch(self, batch_id: str) -> Optional[dict]:
+        rows = self._query("SELECT created_at, data FROM evaluation_batches WHERE batch_id = ?", (batch_id,))
+        if not rows:
+            return None
+        return {"created_at": rows[0][0], **json.loads(rows[0][1])}
+
+    # ── Checkpoints ─────────────────────────────────────────
+
+    def save_evaluation_run(self, batch_id: str, run: dict):
+        created_at = run.get("created_at") or datetime.now(timezone.utc).isoformat()
+        try:
+            with self._lock:
+                db = self._db()
+                with db:
+                    db.execute(
+                        "INSERT OR REPLACE INTO evaluation_runs VALUES (?, ?, ?)",
+                        (batch_id, created_at, json.dumps(run, default=str)),
+                    )
+            return run
+        except Exception as e:
+            print(f"Telemetry store run logging error: {e}")
+            return None
+
+    def get_evaluation_run(self, batch_id: str) -> Optional[dict]:
+        rows = self._query("SELECT created_at, data FROM evaluation_runs WHERE batch_id = ?", (batch_id,))
+        if not rows:
+            return None
+        return {"created_at": rows[0][0], **json.loads(rows[0][1])}
+
+    def checkpoint_cells(self, batch_id: str, cells: list):
+        rows, texts = [], {}
+        for cell, ok, result in cells:
+            result = dict(result)
+            refs = self._blob_refs(result, texts)
+            rows.append((batch_id, cell, int(bool(ok)), json.dumps(result, default=str), *refs))
+        try:
+            blobs = self._compress_blobs(texts)
+            with self._lock:
+                db = self._db()
+                with db:
+                    stored = self._store_blobs(db, blobs)
+                    # A re-run cell replaces its checkpoint and needs writing again
+                    db.executemany(
+                        "INSERT OR REPLACE INTO evaluation_checkpoints (batch_id, cell, ok, persisted, data, "
+                        "prompt_hash, response_hash) VALUES (?, ?, ?, 0, ?, ?, ?)",
+                        rows,
+                    )
+                self._remember_blobs(stored)
+            return rows
+        except Exception as e:
+            print(f"Telemetry store checkpoint error: {e}")
+            return None
+
+    def get_checkpoints(self, batch_id: str) -> list:
+        rows = self._query(
+            "SELECT cell, ok, persisted, data, prompt_hash, response_hash FROM evaluation_checkpoints "
+            "WHERE batch_id = ? ORDER BY cell",
+            (batch_id,),
+        )
+        results = self._hydrate([json.loads(row[3]) for row in rows], [row[4:6] for row in rows], True)
+        return [
+            {"cell": row[0], "ok": bool(row[1]), "persisted": bool(row[2]), "result": result}
+            for row, result in zip(rows, results)
+        ]
+
+    def mark_checkpoints_persisted(self, batch_id: str, cells: list):
+        with self._lock:
+            db = self._db()
+            with db:
+                db.executemany(
+                    "UPDATE evaluation_checkpoints SET persisted = 1 WHERE batch_id = ? AND cell = ?",
+                    [(batch_id, cell) for cell in cells],
+                )
+
+    @staticmethod
+    def _window(lo: Optional[float], hi: Optional[float], column: str) -> tuple:
+        clauses, params = [], []
+        if lo is not None:
+            clauses.append(f"{column} >= ?")
+            params.append(lo)
+        if hi is not None:
+            clauses.append(f"{column} < ?")
+            params.append(hi)
+        return (" WHERE " + " AND ".join(clauses)) if clauses else "", tuple(params)
+
+    def _aggregate(self, key_sql: Optional[str], since, until, bucket_seconds: int = None) -> list:
+        """(bucket?, key?, requests, cost, input, output, latency_sum) rows, read from the
+        coarsest rollup the window and bucket width align to, otherwise from raw rows."""
+        lo, hi = _ts(since), _ts(until)
+        granularity = next(
+            (g for g in ROLLUP_GRANULARITIES
+             if all(t is None or t % g == 0 for t in (lo, hi)) and (bucket_seconds or g) % g == 0),
+            None,
+        )
+        if granularity:
+            where, params = self._window(
+                None if lo is None else lo // granularity, None if hi is None else hi // granularity, "period"
+            )
+            where = f"{where} AND granularity = ?" if where else " WHERE granularity = ?"
+            params += (granularity,)
+            bucket_sql = f"(period / {bucket_seconds // granularity}) * {bucket_seconds}" if bucket_seconds else None
+            # Rollups store NULL group values as '' so they can be part of the primary key
+            key_sql = f"NULLIF({key_sql}, '')" if key_sql else None
+            table, aggregates = "telemetry_rollup", _AGGREGATES
+        else:
+            where, params = self._window(lo, hi, "created_ts")
+            bucket_sql = f"CAST(created_ts / {bucket_seconds} AS INTEGER) * {bucket_seconds}" if bucket_seconds else None
+            table, aggregates = "telemetry", _RAW_AGGREGATES
+        keys = [k for k in (bucket_sql, key_sql) if k]
+        group = f" GROUP BY {', '.join(keys)}" if keys else ""
+        return self._query(f"SELECT {', '.join(keys + [aggregates])} FROM {table}{where}{group}", params)
+
+    def group_by(self, column: Optional[str], since=None, until=None) -> list:
+        if column is not None:
+            _check_column(column, GROUP_COLUMNS)
+        rows = self._aggregate(column, since, until)
+        out = [
+            self._group_row(column, row[0] if column else None, *row[-5:])
+            for row in rows if row[-5]
+        ]
+        return sorted(out, key=lambda r: -r["requests"])
+
+    def time_buckets(self, bucket_seconds: int = 3600, group_by: str = None, since=None, until=None) -> list:
+        if group_by is not None:
+            _check_column(group_by, GROUP_COLUMNS)
+        rows = self._aggregate(group_by, since, until, bucket_seconds=int(bucket_seconds))
+        rows = sorted(rows, key=lambda r: (r[0], str(r[1]) if group_by else ""))
+        return [
+            {"bucket_start": _iso(row[0]), **self._group_row(group_by, row[1] if group_by else None, *row[-5:])}
+            for row in rows
+        ]
+
+    def percentiles(self, column: str = "latency_ms", ps: tuple = (50, 95, 99), group_by: str = None,
+                    since=None, until=None) -> list:
+        _check_column(column, METRIC_COLUMNS)
+        if group_by is not None:
+            _check_column(group_by, GROUP_COLUMNS)
+        lo, hi = _ts(since), _ts(until)
+        if lo is None and hi is None and column == "latency_ms":
+            return self._indexed_latency_percentiles(ps, group_by)
+        # Bounded windows: one time-indexed scan of the window, ranked in Python
+        where, params = self._window(lo, hi, "created_ts")
+        values = defaultdict(list)
+        for key, value in self._query(f"SELECT {group_by or 'NULL'}, {column} FROM telemetry{where}", params):
+            if value is not None:
+                values[key].append(value)
+        out = []
+        for key, vals in values.items():
+            vals.sort()
+            entry = {group_by: key} if group_by else {}
+            entry.update({"count": len(vals), **{f"p{p:g}": _nearest_rank(vals, p) for p in ps}})
+            out.append(entry)
+        return sorted(out, key=lambda r: -r["count"])
+
+    def _indexed_latency_percentiles(self, ps: tuple, group_by: Optional[str]) -> list:
+        """All-time latency percentiles via indexed ORDER BY ... OFFSET, without loading the column."""
+        if group_by:
+            groups = self._query(f"SELECT {group_by}, COUNT(latency_ms) FROM telemetry GROUP BY {group_by}")
+        else:
+            groups = [(None, self._query("SELECT COUNT(latency_ms) FROM telemetry")[0][0])]
+        out = []
+        for key, count in groups:
+            if not count:
+                continue
+            where, params = " WHERE latency_ms IS NOT NULL", ()
+            if group_by:
+                where += f" AND {group_by} IS ?"
+                params = (key,)
+            entry = {group_by: key} if group_by else {}
+            entry["count"] = count
+            for p in ps:
+                offset = max(1, math.ceil(p / 100 * count)) - 1
+                (value,) = self._query(
+                    f"SELECT latency_ms FROM telemetry{where} ORDER BY latency_ms LIMIT 1 OFFSET ?",
+                    params + (offset,),
+                )[0]
+                entry[f"p{p:g}"] = value
+            out.append(entry)
+        return sorted(out, key=lambda r: -r["count"])
+
+    def stats(self) -> dict:
+        (rows,) = self._query("SELECT COUNT(*) FROM telemetry")[0]
+        blobs, text_bytes, stored_bytes = self._query(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(LENGTH(data)), 0) FROM blobs"
+        )[0]
+        return {
+            "backend": self.backend, "path": self.path, "telemetry_rows": rows,
+            "blobs": blobs, "blob_text_bytes": text_bytes, "blob_stored_bytes": stored_bytes,
+            "size_bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+def _build_store() -> TelemetryStore:
+    backend = settings.TELEMETRY_BACKEND
+    if backend == "sqlite":
+        return SQLiteTelemetryStore(settings.TELEMETRY_DB_PATH)
+    if backend == "supabase":
+        from app.services.supabase_service import supabase_service
+        return supabase_service
+    raise ValueError(f"Unknown TELEMETRY_BACKEND: {backend}")
+
+
+telemetry_store = _build_store()
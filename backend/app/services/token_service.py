@@ -0,0 +1,217 @@
+"""
+Token Service — fast local token estimation and context-window pre-flight checks.
+
+Estimates are a few regex passes over the text: words cost roughly one token
+per `chars_per_token` characters for the model family's tokenizer, while
+punctuation, digit runs and non-Latin characters are counted separately. Each
+family has a calibration scale, learned as an exponentially weighted average
+of real/estimated input tokens from provider-reported usage (online, on every
+call) or from logged telemetry (offline, via `calibrate`).
+"""
+import math
+import re
+import threading
+from dataclasses import dataclass
+from app.core.model_matrix import GENERATION_PROFILES, get_generation_profile, get_model_info
+from app.services.pricing_service import PricingService
+
+# Output budget of the default generation profile
+DEFAULT_MAX_OUTPUT_TOKENS = GENERATION_PROFILES[("*", "*")]["max_tokens"]
+
+_WORDS = re.compile(r"[A-Za-z]+")
+_DIGITS = re.compile(r"\d+")
+_SYMBOLS = re.compile(r"[^\sA-Za-z\d]")   # Punctuation and every non-ASCII character
+_MAX_PIECE = 64
+
+# family → (chars per token for Latin words, tokens per image, per-message overhead)
+FAMILY_PARAMS = {
+    "openai": (4.2, 765, 4),
+    "gemini": (4.0, 258, 0),
+    "claude": (3.8, 1600, 3),
+    "llama": (3.9, 1600, 4),
+    "mistral": (3.4, 1600, 4),
+    "nova": (4.0, 1000, 3),
+    "deepseek": (3.9, 0, 4),
+    "generic": (4.0, 1000, 4),
+}
+
+# Calibration: minimum observations before a learned scale is applied, and EWMA weight
+MIN_CALIBRATION_SAMPLES = 5
+CALIBRATION_ALPHA = 0.05
+
+
+def model_family(model_id: str) -> str:
+    m = model_id.lower()
+    if "gemini" in m:
+        return "gemini"
+    if m.startswith(("gpt", "o1", "o3", "o4")):
+        return "openai"
+    if "claude" in m:
+        return "claude"
+    if "llama" in m:
+        return "llama"
+    if "mistral" in m or "pixtral" in m:
+        return "mistral"
+    if "nova" in m:
+        return "nova"
+    if "deepseek" in m:
+        return "deepseek"
+    return "generic"
+
+
+def estimate_cost(model_id: str, input_tokens: int, output_tokens: int) -> float:
+    """PricingService cost, falling back to the registry's blended rate for unpriced models."""
+    cost = PricingService.calculate_cost(model_id, input_tokens, output_tokens)
+    if not cost:
+        info = get_model_info(model_id)
+        if info:
+            cost = round((input_tokens + output_tokens) / 1000 * info["cost_per_1k"], 8)
+    return cost
+
+
+class ContextWindowExceeded(ValueError):
+    """The prompt plus its output budget does not fit the model's context window."""
+
+
+@dataclass
+class Preflight:
+    model_id: str
+    raw_input_tokens: int        # Uncalibrated estimate, used to learn the calibration scale
+    input_tokens: int            # Calibrated estimate
+    max_output_tokens: int
+    context_window: int | None
+    predicted_cost: float        # Upper bound: assumes the full output budget is used
+
+    @property
+    def fits(self) -> bool:
+        return self.context_window is None or self.input_tokens + self.max_output_tokens <= self.context_window
+
+    def as_dict(self) -> dict:
+        return {
+            "model_id": self.model_id,
+            "estimated_input_tokens": self.input_tokens,
+            "max_output_tokens": self.max_output_tokens,
+            "context_window": self.context_window,
+            "fits": self.fits,
+            "predicted_cost": self.predicted_cost,
+        }
+
+
+class TokenEstimator:
+    def __init__(self):
+        self._scales = {}   # family → (scale, samples)
+        self._lock = threading.Lock()
+        # Tokens per piece length, precomputed so estimation is a few C-level passes
+        self._word_costs = {
+            family: [0] + [max(1, math.ceil(n / params[0])) for n in range(1, _MAX_PIECE + 1)]
+            for family, params in FAMILY_PARAMS.items()
+        }
+        self._digit_costs = [math.ceil(n / 3) for n in range(_MAX_PIECE + 1)]
+
+    @staticmethod
+    def _cost(table: list, pieces: list) -> int:
+        cap = len(table) - 1
+        return sum(table[n] if n <= cap else table[cap] * (n / cap) for n in map(len, pieces))
+
+    def raw_estimate(self, text: str, family: str = "generic") -> int:
+        """Uncalibrated token estimate for a piece of text."""
+        if not text:
+            return 0
+        tokens = (
+            self._cost(self._word_costs[family], _WORDS.findall(text))
+            + self._cost(self._digit_costs, _DIGITS.findall(text))
+            + len(_SYMBOLS.findall(text))
+        )
+        return int(math.ceil(tokens))
+
+    def scale(self, family: str) -> float:
+        scale, samples = self._scales.get(family, (1.0, 0))
+        return scale if samples >= MIN_CALIBRATION_SAMPLES else 1.0
+
+    def estimate(self, text: str, model_id: str) -> int:
+        family = model_family(model_id)
+        return int(round(self.raw_estimate(text, family) * self.scale(family)))
+
+    def estimate_prompt(self, model_id: str, prompt: str, has_image: bool = False, system_prompt: str = None) -> tuple:
+        """(raw, calibrated) input-token estimate including message framing and images."""
+        family = model_family(model_id)
+        _, image_tokens, overhead = FAMILY_PARAMS[family]
+        raw = self.raw_estimate(prompt, family) + overhead
+        if system_prompt:
+            raw += self.raw_estimate(system_prompt, family) + overhead
+        calibrated = int(round(raw * self.scale(family)))
+        if has_image:
+            calibrated += image_tokens
+        return raw, calibrated
+
+    def preflight(self, model_id: str, prompt: str, has_image: bool = False,
+                  max_output_tokens: int = None, system_prompt: str = None,
+                  task: str = None, overrides: dict = None) -> Preflight:
+        """Estimate a call; the output budget defaults to the call's generation profile."""
+        if max_output_tokens is None:
+            max_output_tokens = get_generation_profile(model_id, task, overrides)["max_tokens"]
+        raw, calibrated = self.estimate_prompt(model_id, prompt, has_image, system_prompt)
+        info = get_model_info(model_id)
+        return Preflight(
+            model_id=model_id,
+            raw_input_tokens=raw,
+            input_tokens=calibrated,
+            max_output_tokens=max_output_tokens,
+            context_window=info.get("context_window") if info else None,
+            predicted_cost=estimate_cost(model_id, calibrated, max_output_tokens),
+        )
+
+    def check(self, preflight: Preflight):
+        if not preflight.fits:
+            raise ContextWindowExceeded(
+                f"Prompt is ~{preflight.input_tokens} tokens; with a {preflight.max_output_tokens}-token "
+                f"output budget it exceeds the {preflight.context_window}-token context window of {preflight.model_id}"
+            )
+
+    def observe(self, model_id: str, raw_estimate: int, actual_tokens: int):
+        """Learn from a provider-reported input token count (text-only prompts)."""
+        if raw_estimate <= 0 or not actual_tokens:
+            return
+        family = model_family(model_id)
+        ratio = actual_tokens / raw_estimate
+        with self._lock:
+            scale, samples = self._scales.get(family, (ratio, 0))
+            self._scales[family] = (scale + CALIBRATION_ALPHA * (ratio - scale), samples + 1)
+
+    def calibrate(self, rows: list) -> dict:
+        """Fit per-family scales from logged telemetry rows (prompt, model_id, input_tokens)."""
+        by_family = {}
+        for row in rows:
+            prompt, actual = row.get("prompt"), row.get("input_tokens")
+            if not prompt or not actual or not row.get("model_id"):
+                continue
+            family = model_family(row["model_id"])
+            raw = self.raw_estimate(prompt, family) + FAMILY_PARAMS[family][2]
+            by_family.setdefault(family, []).append((raw, int(actual)))
+
+        report = {}
+        with self._lock:
+            for family, pairs in by_family.items():
+                # Ratio of sums is robust to very short prompts dominating the fit
+                scale = sum(a for _, a in pairs) / sum(r for r, _ in pairs)
+                self._scales[family] = (scale, max(len(pairs), MIN_CALIBRATION_SAMPLES))
+                report[family] = {
+                    "samples": len(pairs),
+                    "scale": round(scale, 4),
+                    "mape_before": round(_mape(pairs, 1.0), 4),
+                    "mape_after": round(_mape(pairs, scale), 4),
+                }
+        return report
+
+    def stats(self) -> dict:
+        return {
+            family: {"scale": round(scale, 4), "samples": samples, "applied": samples >= MIN_CALIBRATION_SAMPLES}
+            for family, (scale, samples) in self._scales.items()
+        }
+
+
+def _mape(pairs: list, scale: float) -> float:
+    return sum(abs(r * scale - a) / a for r, a in pairs) / len(pairs)
+
+
+token_estimator = TokenEstimator()
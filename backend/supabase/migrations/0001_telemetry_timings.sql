@@ -0,0 +1,2 @@
+-- Per-stage timings (classify, route, budget, provider, serialize, ...) of each chat request
+ALTER TABLE telemetry ADD COLUMN IF NOT EXISTS timings jsonb;
@@ -0,0 +1,2 @@
+-- Input tokens served from the provider's prompt cache (/api/analytics/percentiles?column=cached_input_tokens)
+ALTER TABLE telemetry ADD COLUMN IF NOT EXISTS cached_input_tokens integer;
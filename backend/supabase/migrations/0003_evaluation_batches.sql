@@ -0,0 +1,17 @@
+-- One record per evaluation batch: its spec, per-model summary metrics and how many result rows were written
+CREATE TABLE IF NOT EXISTS evaluation_batches (
+    batch_id text PRIMARY KEY,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    prompts integer,
+    models jsonb,
+    criteria jsonb,
+    judge text,
+    summary_metrics jsonb
+);
+-- Added by later releases; kept separate so tables created by hand before this file pick them up
+ALTER TABLE evaluation_batches ADD COLUMN IF NOT EXISTS resumed_cells integer;
+ALTER TABLE evaluation_batches ADD COLUMN IF NOT EXISTS adaptive jsonb;
+ALTER TABLE evaluation_batches ADD COLUMN IF NOT EXISTS judge_cascade jsonb;
+ALTER TABLE evaluation_batches ADD COLUMN IF NOT EXISTS state text;
+ALTER TABLE evaluation_batches ADD COLUMN IF NOT EXISTS rows integer;
+ALTER TABLE evaluation_batches ADD COLUMN IF NOT EXISTS rows_written integer;
@@ -0,0 +1,14 @@
+-- Resumable evaluation runs: the spec saved before the first call, and each finished cell (prompt x model)
+CREATE TABLE IF NOT EXISTS evaluation_runs (
+    batch_id text PRIMARY KEY,
+    created_at timestamptz NOT NULL DEFAULT now(),
+    data jsonb NOT NULL
+);
+CREATE TABLE IF NOT EXISTS evaluation_checkpoints (
+    batch_id text NOT NULL,
+    cell integer NOT NULL,
+    ok boolean NOT NULL,
+    persisted boolean NOT NULL DEFAULT false,
+    data jsonb NOT NULL,
+    PRIMARY KEY (batch_id, cell)
+);
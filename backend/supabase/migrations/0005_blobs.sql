@@ -0,0 +1,14 @@
+-- Content-addressed prompt and response text: each distinct text once, keyed by the hex of its
+-- SHA-256's first 16 bytes. Postgres compresses large values itself (TOAST).
+CREATE TABLE IF NOT EXISTS blobs (
+    hash text PRIMARY KEY,
+    size integer NOT NULL,
+    data text NOT NULL
+);
+-- Rows reference their texts by hash; rows written before this keep prompt/response inline
+ALTER TABLE telemetry ADD COLUMN IF NOT EXISTS prompt_hash text;
+ALTER TABLE telemetry ADD COLUMN IF NOT EXISTS response_hash text;
+ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS prompt_hash text;
+ALTER TABLE evaluations ADD COLUMN IF NOT EXISTS response_hash text;
+ALTER TABLE evaluation_checkpoints ADD COLUMN IF NOT EXISTS prompt_hash text;
+ALTER TABLE evaluation_checkpoints ADD COLUMN IF NOT EXISTS response_hash text;
@@ -0,0 +1,2 @@
+-- Every attempt of a routing_mode="cascade" chat request: model, tokens, cost, latency, verifier rating, rejection reason
+ALTER TABLE telemetry ADD COLUMN IF NOT EXISTS cascade_path jsonb;
@@ -0,0 +1,159 @@
+"""
+Storage benchmark for content-addressed prompt/response blobs.
+
+Writes the same synthetic evaluation history (prompts x models x re-runs, so
+every prompt repeats once per model per batch and again per re-run) to two
+SQLite files:
+
+    inline   the previous layout: prompt and response inside each row's JSON
+    blobs    SQLiteTelemetryStore: texts stored once in `blobs`, rows hold hashes
+
+and reports write time, file size, and the time to read the latest history
+page (hydrated cold, hydrated again from the text cache, and as hashes only)
+and to scan every row without text (leaderboard refresh).
+
+Usage (from backend/):
+    python tests/bench_blob_storage.py [--prompts 200] [--models 8] [--reruns 5]
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.telemetry_store import SQLiteTelemetryStore  # noqa: E402
+
+WORDS = "the model answered with a detailed and well structured explanation of cloud governance".split()
+CRITERIA = ["Correctness", "Relevance", "Clarity", "Completeness"]
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def batches(args) -> list:
+    rng = random.Random(args.seed)
+    prompts = [f"Prompt {i}: " + text(rng, 120) for i in range(args.prompts)]
+    models = [f"model-{m}" for m in range(args.models)]
+    # Cached or deterministic answers repeat across re-runs; the rest are fresh text
+    answers = {(p, m): text(rng, 300) for p in range(args.prompts) for m in models}
+    out = []
+    for run in range(args.reruns):
+        rows = []
+        for p, prompt in enumerate(prompts):
+            for m in models:
+                response = answers[(p, m)] if rng.random() < args.repeat_share else text(rng, 300)
+                rows.append({
+                    "batch_id": f"batch-{run}", "prompt": prompt, "provider": "Bench", "model_id": m,
+                    "response": response, "input_tokens": 150, "output_tokens": 400, "cost": 0.001,
+                    "latency_ms": rng.randint(200, 4000), "scores": {c: rng.randint(1, 5) for c in CRITERIA},
+                })
+        out.append(rows)
+    return out
+
+
+def write_inline(path: str, data: list) -> float:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(
+        "CREATE TABLE evaluations (id INTEGER PRIMARY KEY, created_at TEXT NOT NULL, batch_id TEXT, "
+        "provider TEXT, model_id TEXT, data TEXT NOT NULL)"
+    )
+    conn.execute("CREATE INDEX evaluations_created ON evaluations (created_at)")
+    start = time.perf_counter()
+    for i, rows in enumerate(data):
+        with conn:
+            conn.executemany(
+                "INSERT INTO evaluations (created_at, batch_id, provider, model_id, data) VALUES (?, ?, ?, ?, ?)",
+                [(f"2026-01-01T00:00:{i:02d}", r["batch_id"], r["provider"], r["model_id"], json.dumps(r))
+                 for r in rows],
+            )
+    elapsed = time.perf_counter() - start
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    return elapsed
+
+
+def inline_reads(path: str, limit: int) -> tuple:
+    conn = sqlite3.connect(path)
+    start = time.perf_counter()
+    rows = conn.execute(
+        "SELECT id, created_at, data FROM evaluations ORDER BY created_at DESC, id DESC LIMIT ?", (limit,)
+    ).fetchall()
+    [{"id": i, "created_at": c, **json.loads(d)} for i, c, d in rows]
+    page = time.perf_counter() - start
+    start = time.perf_counter()
+    for _, _, d in conn.execute("SELECT id, created_at, data FROM evaluations ORDER BY created_at, id"):
+        json.loads(d)
+    scan = time.perf_counter() - start
+    conn.close()
+    return page, page, page, scan
+
+
+def blob_reads(store: SQLiteTelemetryStore, limit: int) -> tuple:
+    start = time.perf_counter()
+    store.get_evaluations(limit)
+    hydrated = time.perf_counter() - start
+    start = time.perf_counter()
+    store.get_evaluations(limit)
+    warm = time.perf_counter() - start
+    start = time.perf_counter()
+    store.get_evaluations(limit, hydrate=False)
+    light = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in store.iter_evaluations(hydrate=False):
+        pass
+    scan = time.perf_counter() - start
+    return hydrated, warm, light, scan
+
+
+def size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare inline and content-addressed evaluation storage")
+    parser.add_argument("--prompts", type=int, default=200)
+    parser.add_argument("--models", type=int, default=8)
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--repeat-share", type=float, default=0.3,
+                        help="Share of re-run responses identical to an earlier one")
+    parser.add_argument("--limit", type=int, default=1000, help="History page size")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    data = batches(args)
+    rows = sum(len(b) for b in data)
+    with tempfile.TemporaryDirectory() as tmp:
+        inline_path, blob_path = os.path.join(tmp, "inline.sqlite"), os.path.join(tmp, "blobs.sqlite")
+        inline_write = write_inline(inline_path, data)
+
+        store = SQLiteTelemetryStore(blob_path)
+        start = time.perf_counter()
+        for rows_ in data:
+            store.log_evaluation(rows_)
+        blob_write = time.perf_counter() - start
+        stats = store.stats()
+        store._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        results = {
+            "inline": (inline_write, size(inline_path), *inline_reads(inline_path, args.limit)),
+            "blobs": (blob_write, size(blob_path), *blob_reads(store, args.limit)),
+        }
+
+    print(f"rows={rows:,} prompts={args.prompts} models={args.models} reruns={args.reruns} "
+          f"blobs={stats['blobs']:,} text={stats['blob_text_bytes']:,}B stored={stats['blob_stored_bytes']:,}B")
+    print(f"{'layout':<8} {'write s':>8} {'file MB':>8} {'page ms':>8} {'warm ms':>8} {'hashes ms':>10} "
+          f"{'scan ms':>8}")
+    for name, (write, nbytes, page, warm, light, scan) in results.items():
+        print(f"{name:<8} {write:>8.2f} {nbytes / 1e6:>8.1f} {page * 1000:>8.1f} {warm * 1000:>8.1f} "
+              f"{light * 1000:>10.1f} {scan * 1000:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Serialization benchmark for large API payloads.
+
+Builds a synthetic /eval/run result (prompts x models cells with long
+responses and judge verdicts) and a synthetic /evaluation/history page, then
+serves both from two in-process FastAPI apps:
+
+    before   response_model=EvalResponse with an EvalResponseItem round trip;
+             history returned as a plain list (default encoder), uncompressed
+    after    FastJSONResponse (orjson) straight from the dicts, behind
+             CompressionMiddleware (brotli if installed, else gzip)
+
+and reports the median time per request and bytes on the wire. "after" is
+measured twice: without compression (serialization only) and with it.
+
+Usage (from backend/):
+    python tests/bench_serialization.py [--cells 2000] [--history 5000] [--runs 7]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from app.core.responses import CompressionMiddleware, FastJSONResponse, brotli  # noqa: E402
+from app.models.schemas import EvalResponse, EvalResponseItem  # noqa: E402
+
+CRITERIA = ["Correctness", "Relevance", "Clarity", "Completeness"]
+WORDS = "the model answered with a detailed and well structured explanation of cloud governance".split()
+
+
+def text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def eval_cell(rng: random.Random, i: int) -> dict:
+    return {
+        "prompt": f"Prompt {i % 50}: " + text(rng, 40),
+        "provider": rng.choice(["Google", "OpenAI", "Amazon"]),
+        "model_id": rng.choice(["gemini-2.5-flash", "gpt-4o", "amazon.nova-pro-v1:0"]),
+        "response": text(rng, 350),
+        "metrics": {
+            "input_tokens": rng.randint(50, 400), "cached_input_tokens": 0, "output_tokens": rng.randint(100, 900),
+            "cost": rng.random() / 100, "latency_ms": rng.randint(200, 5000),
+            "judge_latency_ms": rng.randint(100, 900), "judge_cost": rng.random() / 1000,
+        },
+        "scores": {c: rng.randint(1, 5) for c in CRITERIA},
+        "ai_evaluations": [{"metric": c, "score": rng.randint(1, 5), "reason": text(rng, 25)} for c in CRITERIA],
+        "prompt_quality": {"score": 4, "summary": text(rng, 15)},
+    }
+
+
+def build_apps(cells: list, history: list) -> tuple:
+    summary = {"Google:gemini-2.5-flash": {"avg_latency": 1200.0, "latency_p99": 4800.0}}
+    before, after = FastAPI(), FastAPI()
+
+    @before.post("/eval", response_model=EvalResponse)
+    def eval_before():
+        results = [EvalResponseItem(**r) for r in cells]
+        return EvalResponse(batch_id="b", results=results, summary_metrics=summary, prompt_metadata={})
+
+    @before.get("/history")
+    def history_before():
+        return history
+
+    @after.post("/eval", response_model=EvalResponse)
+    def eval_after():
+        return FastJSONResponse(
+            {"batch_id": "b", "results": cells, "summary_metrics": summary, "prompt_metadata": {}, "persistence": None}
+        )
+
+    @after.get("/history")
+    def history_after():
+        return FastJSONResponse(history)
+
+    after.add_middleware(CompressionMiddleware, minimum_size=1024)
+    return before, after
+
+
+def measure(client: TestClient, method: str, path: str, runs: int, encoding: str) -> tuple:
+    timings, wire = [], 0
+    headers = {"Accept-Encoding": encoding}
+    for _ in range(runs):
+        start = time.perf_counter()
+        response = client.request(method, path, headers=headers)
+        timings.append((time.perf_counter() - start) * 1000)
+        response.raise_for_status()
+        wire = response.num_bytes_downloaded
+    return statistics.median(timings), wire, len(response.content)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare payload size and serialization time before/after")
+    parser.add_argument("--cells", type=int, default=2000, help="Evaluation cells in the /eval/run payload")
+    parser.add_argument("--history", type=int, default=5000, help="Rows in the history payload")
+    parser.add_argument("--runs", type=int, default=7)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    cells = [eval_cell(rng, i) for i in range(args.cells)]
+    history = [{"id": i, "created_at": "2026-01-01T00:00:00+00:00", "batch_id": "b", **eval_cell(rng, i)}
+               for i in range(args.history)]
+    before, after = build_apps(cells, history)
+    encoding = "br, gzip" if brotli is not None else "gzip"
+
+    print(f"cells={args.cells} history_rows={args.history} runs={args.runs} encoding={encoding.split(',')[0]}")
+    print(f"{'payload':<10} {'variant':<12} {'median ms':>10} {'wire bytes':>12} {'json bytes':>12}")
+    with TestClient(before) as old, TestClient(after) as new:
+        for name, method, path in (("eval/run", "POST", "/eval"), ("history", "GET", "/history")):
+            rows = [
+                ("before", *measure(old, method, path, args.runs, "identity")),
+                ("after", *measure(new, method, path, args.runs, "identity")),
+                ("after+" + encoding.split(",")[0], *measure(new, method, path, args.runs, encoding)),
+            ]
+            for variant, ms, wire, raw in rows:
+                print(f"{name:<10} {variant:<12} {ms:>10.1f} {wire:>12,} {raw:>12,}")
+            before_ms, before_wire = rows[0][1], rows[0][2]
+            for variant, ms, wire, _ in rows[1:]:
+                print(f"{'':<10} {'vs ' + variant:<12} {before_ms / ms:>9.1f}x {before_wire / wire:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Startup-time benchmark for the API process.
+
+Runs `python -X importtime -c "import app.main"` in a fresh interpreter and
+reports the total import time, the slowest top-level imports and whether any
+heavy provider SDK was imported eagerly.
+
+Usage (from backend/):
+    python tests/bench_startup.py [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# SDKs that should only load on first use / warm-up of their gateway
+HEAVY_MODULES = ["google.genai", "openai", "boto3", "botocore", "supabase", "google.auth"]
+
+
+def run_importtime(module: str) -> list:
+    """Import `module` in a fresh interpreter and return parsed (self_us, cumulative_us, name) rows."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        print(proc.stderr[-2000:])
+        raise SystemExit(f"Importing {module} failed")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        head, cumulative_us, name = line.split("|")
+        self_us = head.split(":", 1)[1]
+        # Keep the leading spaces of `name`: they encode nesting depth
+        rows.append((int(self_us), int(cumulative_us), name[1:].rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import/startup time")
+    parser.add_argument("--module", default="app.main")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    totals = []
+    rows = []
+    for _ in range(args.runs):
+        rows = run_importtime(args.module)
+        top_level = [r for r in rows if not r[2].startswith(" ")]
+        totals.append(sum(r[1] for r in top_level) / 1000)
+
+    print(f"Import of {args.module} over {args.runs} runs:")
+    print(f"  median {statistics.median(totals):.1f} ms | min {min(totals):.1f} ms | max {max(totals):.1f} ms\n")
+
+    print("Slowest imports up to two levels deep (cumulative, last run):")
+    shallow = sorted((r for r in rows if not r[2].startswith("   ")), key=lambda r: -r[1])
+    for self_us, cumulative_us, name in shallow[: args.top]:
+        print(f"  {cumulative_us / 1000:9.1f} ms  {name.strip()}")
+
+    imported = {r[2].strip() for r in rows}
+    eager = [m for m in HEAVY_MODULES if m in imported]
+    print()
+    if eager:
+        print(f"Eagerly imported SDKs: {', '.join(eager)}")
+    else:
+        print("No provider SDK imported at startup.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+"""
+Load generator for the gateway API.
+
+Drives /api/chat, /api/chat/vision and /api/eval/run with a seeded, weighted
+request mix at fixed concurrency, then reports throughput, p50/p95/p99
+latency, error counts and gateway memory (scraped from /metrics).
+
+With --spawn it starts tests/loadtest/mock_provider.py and a gateway wired to
+it, so a full run needs no credentials and costs nothing:
+
+    python tests/loadtest/loadgen.py --spawn --requests 500 --concurrency 32
+
+Against an already running gateway:
+
+    python tests/loadtest/loadgen.py --base-url http://127.0.0.1:8000 --requests 200
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROVIDERS = ["Google", "OpenAI", "Meta", "Mistral AI", "Amazon", "DeepSeek"]
+USE_CASES = ["reasoning", "summarization", "structured output", "rag"]
+EVAL_MODELS = [
+    {"provider": "Google", "model_id": "gemini-2.5-flash"},
+    {"provider": "OpenAI", "model_id": "gpt-4o-mini"},
+    {"provider": "Amazon", "model_id": "amazon.nova-lite-v1:0"},
+]
+PROMPTS = [
+    "Summarize the key risks of deploying LLMs in regulated industries.",
+    "Explain the difference between RAG and fine-tuning in three bullet points.",
+    "Return a JSON object describing a purchase order with three line items.",
+    "Compare vector databases for a 10M document corpus and recommend one.",
+    "Draft a short policy on acceptable use of generative AI for employees.",
+]
+
+
+def mock_gateway_env(mock_url: str) -> dict:
+    """Environment that points every gateway at the mock provider."""
+    return {
+        "OPENAI_API_KEY": "mock",
+        "OPENAI_BASE_URL": f"{mock_url}/v1",
+        "GOOGLE_API_KEY": "mock",
+        "GENAI_BASE_URL": f"{mock_url}/",
+        "GOOGLE_CLOUD_PROJECT": "mock-project",
+        "GOOGLE_ACCESS_TOKEN": "mock",
+        "VERTEX_MAAS_BASE_URL": mock_url,
+        "AWS_ACCESS_KEY_ID": "mock",
+        "AWS_SECRET_ACCESS_KEY": "mock",
+        "BEDROCK_ENDPOINT_URL": mock_url,
+        "SUPABASE_URL": "",
+        "SUPABASE_KEY": "",
+    }
+
+
+def wait_until_up(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1.0)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise SystemExit(f"{url} did not come up within {timeout}s")
+
+
+def spawn(args) -> list:
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    mock = subprocess.Popen(
+        [sys.executable, "tests/loadtest/mock_provider.py", "--port", str(args.mock_port),
+         "--latency-ms", str(args.mock_latency_ms), "--sigma", str(args.mock_sigma),
+         "--error-rate", str(args.mock_error_rate), "--seed", str(args.seed)],
+        cwd=BACKEND_DIR,
+    )
+    wait_until_up(f"{mock_url}/stats")
+    gateway = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(args.gateway_port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        env={**os.environ, **mock_gateway_env(mock_url)},
+    )
+    wait_until_up(f"http://127.0.0.1:{args.gateway_port}/")
+    args.base_url = f"http://127.0.0.1:{args.gateway_port}"
+    return [gateway, mock]
+
+
+def build_plan(args) -> list:
+    """Deterministic list of (scenario, payload) pairs."""
+    rng = random.Random(args.seed)
+    weights = dict(part.split("=") for part in args.mix.split(","))
+    scenarios = list(weights.keys())
+    cumulative = [float(weights[s]) for s in scenarios]
+    plan = []
+    for _ in range(args.requests):
+        scenario = rng.choices(scenarios, weights=cumulative)[0]
+        prompt = rng.choice(PROMPTS)
+        if scenario == "chat":
+            payload = {"provider": rng.choice(PROVIDERS), "use_case": rng.choice(USE_CASES), "prompt": prompt}
+        elif scenario == "vision":
+            payload = {"provider": rng.choice(["Google", "OpenAI", "Amazon"]), "prompt": prompt}
+        else:
+            payload = {
+                "prompts": rng.sample(PROMPTS, k=args.eval_prompts),
+                "models": EVAL_MODELS,
+                "scoring_type": "AI",
+                "judge_provider": "Google",
+                "judge_model": "gemini-2.5-flash",
+            }
+        plan.append((scenario, payload))
+    return plan
+
+
+async def send(client: httpx.AsyncClient, scenario: str, payload: dict, image: bytes) -> int:
+    if scenario == "chat":
+        response = await client.post("/api/chat", json=payload)
+    elif scenario == "vision":
+        response = await client.post(
+            "/api/chat/vision", data=payload, files={"image": ("load.png", image, "image/png")}
+        )
+    else:
+        response = await client.post("/api/eval/run", json=payload)
+    return response.status_code
+
+
+async def scrape_rss(client: httpx.AsyncClient):
+    try:
+        text = (await client.get("/metrics")).text
+    except httpx.HTTPError:
+        return None
+    for line in text.splitlines():
+        if line.startswith("process_resident_memory_bytes"):
+            return float(line.split()[-1])
+    return None
+
+
+async def run(args) -> dict:
+    plan = build_plan(args)
+    image = random.Random(args.seed).randbytes(args.image_kb * 1024)
+    latencies = {}
+    errors = {}
+    rss_samples = []
+    queue = asyncio.Queue()
+    for item in plan:
+        queue.put_nowait(item)
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        rss_before = await scrape_rss(client)
+
+        async def worker():
+            while not queue.empty():
+                scenario, payload = queue.get_nowait()
+                start = time.perf_counter()
+                try:
+                    status = await send(client, scenario, payload, image)
+                except httpx.HTTPError:
+                    status = 0
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                latencies.setdefault(scenario, []).append(elapsed_ms)
+                if status != 200:
+                    errors[scenario] = errors.get(scenario, 0) + 1
+
+        async def memory_sampler():
+            while True:
+                rss = await scrape_rss(client)
+                if rss is not None:
+                    rss_samples.append(rss)
+                await asyncio.sleep(0.5)
+
+        sampler = asyncio.create_task(memory_sampler())
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+        wall_s = time.perf_counter() - started
+        sampler.cancel()
+        rss_after = await scrape_rss(client)
+
+    def percentiles(values: list) -> dict:
+        if len(values) < 2:
+            value = round(values[0], 1) if values else 0.0
+            return {"p50": value, "p95": value, "p99": value, "max": value}
+        q = statistics.quantiles(values, n=100, method="inclusive")
+        return {"p50": round(q[49], 1), "p95": round(q[94], 1), "p99": round(q[98], 1), "max": round(max(values), 1)}
+
+    all_latencies = [ms for values in latencies.values() for ms in values]
+    mb = lambda b: round(b / 1024 / 1024, 1) if b else None  # noqa: E731
+    return {
+        "config": {
+            "requests": args.requests, "concurrency": args.concurrency, "mix": args.mix, "seed": args.seed,
+            "mock_latency_ms": args.mock_latency_ms if args.spawn else None,
+        },
+        "wall_s": round(wall_s, 2),
+        "throughput_rps": round(len(all_latencies) / wall_s, 2) if wall_s else 0.0,
+        "overall_ms": percentiles(all_latencies),
+        "scenarios": {
+            scenario: {
+                "count": len(values),
+                "errors": errors.get(scenario, 0),
+                "rps": round(len(values) / wall_s, 2) if wall_s else 0.0,
+                **{f"{k}_ms": v for k, v in percentiles(values).items()},
+            }
+            for scenario, values in sorted(latencies.items())
+        },
+        "memory_mb": {
+            "before": mb(rss_before),
+            "peak": mb(max(rss_samples)) if rss_samples else None,
+            "after": mb(rss_after),
+        },
+    }
+
+
+def print_report(report: dict):
+    print(f"\nRequests: {report['config']['requests']}  concurrency: {report['config']['concurrency']}  "
+          f"wall: {report['wall_s']}s  throughput: {report['throughput_rps']} req/s")
+    o = report["overall_ms"]
+    print(f"Overall latency  p50 {o['p50']} ms | p95 {o['p95']} ms | p99 {o['p99']} ms | max {o['max']} ms\n")
+    print(f"{'scenario':<10}{'count':>7}{'errors':>8}{'rps':>8}{'p50':>10}{'p95':>10}{'p99':>10}")
+    for name, s in report["scenarios"].items():
+        print(f"{name:<10}{s['count']:>7}{s['errors']:>8}{s['rps']:>8}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+    m = report["memory_mb"]
+    print(f"\nGateway RSS  before {m['before']} MB | peak {m['peak']} MB | after {m['after']} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gateway load generator")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default="chat=0.7,vision=0.2,eval=0.1")
+    parser.add_argument("--eval-prompts", type=int, default=3)
+    parser.add_argument("--image-kb", type=int, default=64)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--spawn", action="store_true", help="Start the mock provider and a gateway wired to it")
+    parser.add_argument("--mock-port", type=int, default=9100)
+    parser.add_argument("--gateway-port", type=int, default=8100)
+    parser.add_argument("--mock-latency-ms", type=float, default=400.0)
+    parser.add_argument("--mock-sigma", type=float, default=0.35)
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    processes = spawn(args) if args.spawn else []
+    try:
+        report = asyncio.run(run(args))
+    finally:
+        for proc in processes:
+            proc.terminate()
+            proc.wait()
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,267 @@
+"""
+Mock provider server for offline load tests.
+
+Speaks just enough of each provider's wire format for the gateway SDKs:
+  - OpenAI chat completions     POST /v1/chat/completions
+  - Vertex MaaS (OpenAI-compat) POST /v1beta1/projects/{p}/locations/{l}/endpoints/openapi/chat/completions
+  - Vertex / Gemini genai       POST /{version}/.../models/{model}:generateContent
+  - Bedrock Converse            POST /model/{model_id}/converse
+
+Latency is drawn from a log-normal distribution (median + sigma), errors are
+injected at a fixed rate and output token counts are drawn uniformly, all from
+a seeded RNG so runs are reproducible. Judge, prompt-analysis and classifier
+prompts get well-formed JSON back so /eval/run and auto-select work end to end.
+System prompts seen before are reported as cached input tokens, in each
+provider's usage format, so prompt-cache accounting can be exercised offline.
+Regions listed in --down-regions answer 503 (Vertex location from the path,
+Bedrock region from the SigV4 scope) to exercise region failover.
+
+Usage (from backend/):
+    python tests/loadtest/mock_provider.py --port 9100 --latency-ms 400 --sigma 0.35 --error-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class MockConfig:
+    def __init__(self, latency_ms: float = 400.0, sigma: float = 0.35, error_rate: float = 0.0,
+                 min_output_tokens: int = 50, max_output_tokens: int = 400, seed: int = 42,
+                 down_regions: tuple = ()):
+        self.latency_ms = latency_ms
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.min_output_tokens = min_output_tokens
+        self.max_output_tokens = max_output_tokens
+        self.rng = random.Random(seed)
+        self.seen_prefixes = set()
+        self.down_regions = set(down_regions)
+
+    def latency_s(self) -> float:
+        if self.latency_ms <= 0:
+            return 0.0
+        return self.rng.lognormvariate(math.log(self.latency_ms / 1000), self.sigma)
+
+    def should_fail(self) -> bool:
+        return self.rng.random() < self.error_rate
+
+    def output_tokens(self) -> int:
+        return self.rng.randint(self.min_output_tokens, self.max_output_tokens)
+
+    def cached_tokens(self, system: str) -> int:
+        """Tokens of `system` served from the (simulated) prefix cache; first sight writes it."""
+        if not system:
+            return 0
+        if system in self.seen_prefixes:
+            return estimate_tokens(system)
+        self.seen_prefixes.add(system)
+        return 0
+
+
+def request_region(request: Request) -> str:
+    """Vertex location from the path, or the region in the Bedrock SigV4 credential scope."""
+    if "location" in request.path_params:
+        return request.path_params["location"]
+    auth = request.headers.get("authorization", "")
+    if "Credential=" in auth:
+        return auth.split("Credential=", 1)[1].split("/")[2]
+    return ""
+
+
+def region_down(region: str) -> JSONResponse:
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"message": f"mock region {region} is unavailable", "type": "server_error", "code": None},
+                 "message": f"mock region {region} is unavailable"},
+        headers={"x-amzn-ErrorType": "ServiceUnavailableException"},
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def completion_text(prompt: str, output_tokens: int) -> str:
+    """Shape the reply after the caller: judges and classifiers expect JSON."""
+    if '"ai_evaluation"' in prompt:
+        metrics = ["Correctness", "Relevance", "Clarity", "Completeness"]
+        marker = "Selected Metrics:"
+        if marker in prompt:
+            try:
+                metrics = json.loads(prompt.rsplit(marker, 1)[1].strip())
+            except ValueError:
+                pass
+        return json.dumps({
+            "prompt_analysis": {"score": 4, "summary": "Clear prompt."},
+            "ai_evaluation": [{"metric": m, "score": 4, "reason": "Mock verdict."} for m in metrics],
+        })
+    if '"intent_detected"' in prompt:
+        return json.dumps({"score": 4, "summary": "Clear prompt.", "clarity": "High", "intent_detected": "mock"})
+    if "Workload Tagging Engine" in prompt:
+        return json.dumps({"tags": ["reasoning"]})
+    if '"confidence"' in prompt:
+        return json.dumps({"confidence": 4})
+    return " ".join(["lorem"] * output_tokens)
+
+
+def create_app(config: MockConfig) -> FastAPI:
+    app = FastAPI(title="Mock AI Provider")
+    app.state.config = config
+    app.state.requests = 0
+
+    async def simulate():
+        app.state.requests += 1
+        await asyncio.sleep(config.latency_s())
+        return config.should_fail()
+
+    async def openai_chat(request: Request):
+        if request_region(request) in config.down_regions:
+            return region_down(request_region(request))
+        body = await request.json()
+        prompt = " ".join(
+            part if isinstance(part, str) else part.get("text", "")
+            for m in body.get("messages", [])
+            for part in ([m["content"]] if isinstance(m.get("content"), str) else m.get("content") or [])
+        )
+        system = " ".join(m["content"] for m in body.get("messages", []) if m.get("role") == "system")
+        if await simulate():
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "mock upstream error", "type": "server_error", "code": None}},
+            )
+        output_tokens = config.output_tokens()
+        prompt_tokens = estimate_tokens(prompt)
+        cached = config.cached_tokens(system)
+        return {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "mock"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": completion_text(prompt, output_tokens)},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": output_tokens,
+                "total_tokens": prompt_tokens + output_tokens,
+                "prompt_tokens_details": {"cached_tokens": cached},
+            },
+        }
+
+    app.post("/v1/chat/completions")(openai_chat)
+    app.post("/v1beta1/projects/{project}/locations/{location}/endpoints/openapi/chat/completions")(openai_chat)
+
+    @app.post("/model/{model_id}/converse")
+    async def bedrock_converse(model_id: str, request: Request):
+        if request_region(request) in config.down_regions:
+            return region_down(request_region(request))
+        body = await request.json()
+        system = " ".join(block.get("text", "") for block in body.get("system", []))
+        prompt = " ".join(
+            [system] + [block.get("text", "") for m in body.get("messages", []) for block in m.get("content", [])]
+        )
+        cache_point = any("cachePoint" in block for block in body.get("system", []))
+        if await simulate():
+            return JSONResponse(
+                status_code=500,
+                content={"message": "mock upstream error"},
+                headers={"x-amzn-ErrorType": "InternalServerException"},
+            )
+        output_tokens = config.output_tokens()
+        prompt_tokens = estimate_tokens(prompt)
+        # Converse reports cache reads/writes outside inputTokens
+        cache_read = cache_write = 0
+        if cache_point:
+            cache_read = config.cached_tokens(system)
+            cache_write = 0 if cache_read else estimate_tokens(system)
+            prompt_tokens -= cache_read + cache_write
+        text = completion_text(prompt, output_tokens)
+        content, stop_reason = [{"text": text}], "end_turn"
+        forced = ((body.get("toolConfig") or {}).get("toolChoice") or {}).get("tool")
+        if forced:
+            # A forced tool answers through toolUse input, as Converse does for structured output
+            content = [{"toolUse": {"toolUseId": uuid.uuid4().hex[:12], "name": forced["name"], "input": json.loads(text)}}]
+            stop_reason = "tool_use"
+        return {
+            "output": {"message": {"role": "assistant", "content": content}},
+            "stopReason": stop_reason,
+            "usage": {
+                "inputTokens": prompt_tokens,
+                "outputTokens": output_tokens,
+                "totalTokens": prompt_tokens + cache_read + cache_write + output_tokens,
+                "cacheReadInputTokens": cache_read,
+                "cacheWriteInputTokens": cache_write,
+            },
+            "metrics": {"latencyMs": 0},
+        }
+
+    @app.post("/{path:path}")
+    async def genai_generate(path: str, request: Request):
+        if not path.endswith(":generateContent"):
+            return JSONResponse(status_code=404, content={"error": {"code": 404, "message": f"Unknown route {path}"}})
+        body = await request.json()
+        system = " ".join(part.get("text", "") for part in (body.get("systemInstruction") or {}).get("parts", []))
+        prompt = " ".join(
+            [system] + [part.get("text", "") for content in body.get("contents", []) for part in content.get("parts", [])]
+        )
+        if await simulate():
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"code": 500, "message": "mock upstream error", "status": "INTERNAL"}},
+            )
+        output_tokens = config.output_tokens()
+        prompt_tokens = estimate_tokens(prompt)
+        cached = config.cached_tokens(system)
+        return {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": completion_text(prompt, output_tokens)}]},
+                "finishReason": "STOP",
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "cachedContentTokenCount": cached,
+                "candidatesTokenCount": output_tokens,
+                "totalTokenCount": prompt_tokens + output_tokens,
+            },
+            "modelVersion": path.rsplit("/", 1)[-1].split(":")[0],
+        }
+
+    @app.get("/stats")
+    async def stats():
+        return {"requests": app.state.requests}
+
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock AI provider server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--latency-ms", type=float, default=400.0, help="Median latency")
+    parser.add_argument("--sigma", type=float, default=0.35, help="Log-normal spread of latency")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--min-output-tokens", type=int, default=50)
+    parser.add_argument("--max-output-tokens", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--down-regions", default="", help="Comma-separated regions that answer 503 (failover tests)")
+    args = parser.parse_args()
+
+    import uvicorn
+    config = MockConfig(
+        latency_ms=args.latency_ms, sigma=args.sigma, error_rate=args.error_rate,
+        min_output_tokens=args.min_output_tokens, max_output_tokens=args.max_output_tokens, seed=args.seed,
+        down_regions=tuple(r for r in args.down_regions.split(",") if r),
+    )
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Error rate of the adaptive race's eliminations, by simulation (no network).
+
+Usage (from backend/):
+    python -m pytest tests/test_adaptive_eval.py
+"""
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.adaptive_eval import Race  # noqa: E402
+
+RUNS = 400
+
+
+def _race(means, rng, n_prompts=60, round_prompts=5, confidence=0.95, min_prompts=10) -> Race:
+    race = Race(n_prompts, len(means), "latency", confidence, min_prompts, round_prompts)
+    while True:
+        cells = race.next_cells(round_prompts)
+        if not cells:
+            return race
+        race.observe(cells, [
+            {"response": "ok", "metrics": {"latency_ms": rng.gauss(means[c % len(means)], 200)}} for c in cells
+        ])
+        race.eliminate()
+
+
+def _false_elimination_rate(n_models: int, seed: int) -> float:
+    rng = random.Random(seed)
+    return sum(bool(_race([1000] * n_models, rng).eliminated) for _ in range(RUNS)) / RUNS
+
+
+def test_identical_models_survive_two():
+    # 1 - confidence = 0.05 family-wise; allow Monte Carlo noise on top
+    assert _false_elimination_rate(2, seed=1) <= 0.07
+
+
+def test_identical_models_survive_three():
+    assert _false_elimination_rate(3, seed=2) <= 0.07
+
+
+def test_dominated_model_is_still_eliminated():
+    rng = random.Random(3)
+    races = [_race([1000, 1400, 1800], rng) for _ in range(100)]
+    assert sum(2 in race.eliminated for race in races) >= 90
+    assert not any(0 in race.eliminated for race in races)
@@ -0,0 +1,77 @@
+"""
+Budget ledger reservations under concurrency (no network).
+
+Usage (from backend/):
+    python -m pytest tests/test_budget_service.py
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from app.core.config import settings  # noqa: E402
+from app.services.budget_service import BudgetExceeded, BudgetService  # noqa: E402
+
+KEY = "test-key"
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    budgets = tmp_path / "budgets.json"
+    budgets.write_text(json.dumps({"keys": {KEY: {"name": "alice", "daily": 1.0}}}))
+    monkeypatch.setattr(settings, "BUDGETS_FILE", str(budgets))
+    monkeypatch.setattr(settings, "BUDGET_LEDGER_PATH", str(tmp_path / "ledger.sqlite"))
+    return tmp_path
+
+
+def _service() -> BudgetService:
+    service = BudgetService()
+    service.load()
+    return service
+
+
+def test_concurrent_reservations_cannot_overspend(ledger):
+    account = _service().account(KEY)
+
+    async def race():
+        return await asyncio.gather(*(account.areserve(0.6) for _ in range(2)), return_exceptions=True)
+
+    outcomes = asyncio.run(race())
+    assert sum(isinstance(o, BudgetExceeded) for o in outcomes) == 1
+    assert account.remaining() == pytest.approx(0.4)
+
+
+def test_workers_share_the_ledger(ledger):
+    # One service per worker process, all on the same ledger file
+    accounts = [_service().account(KEY) for _ in range(4)]
+    held, rejected, barrier = [], [], threading.Barrier(len(accounts))
+
+    def reserve(account):
+        barrier.wait()
+        try:
+            held.append(account.reserve(0.3))
+        except BudgetExceeded:
+            rejected.append(account)
+
+    threads = [threading.Thread(target=reserve, args=(a,)) for a in accounts]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert (len(held), len(rejected)) == (3, 1)
+
+
+def test_settled_spend_replaces_the_hold(ledger):
+    account = _service().account(KEY)
+
+    async def run():
+        async with await account.areserve(0.6) as hold:
+            await hold.asettle(0.1)
+        return await account.aremaining()
+
+    assert asyncio.run(run()) == pytest.approx(0.9)
@@ -0,0 +1,67 @@
+"""
+Gemini explicit context caching with a stubbed client (no network).
+
+Usage (from backend/):
+    python -m pytest tests/test_gemini_context_cache.py
+"""
+import os
+import sys
+import uuid
+
+os.environ.setdefault("CACHE_BACKEND", "memory")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings  # noqa: E402
+from app.services.ai_service import ai_service  # noqa: E402
+
+
+class _Caches:
+    def __init__(self, fail: bool = False):
+        self.created = []
+        self.fail = fail
+
+    def create(self, model, config):
+        if self.fail:
+            raise RuntimeError("caching not supported")
+        self.created.append((model, config))
+        return type("CachedContent", (), {"name": f"cachedContents/{len(self.created)}"})()
+
+
+class _Client:
+    def __init__(self, fail: bool = False):
+        self.caches = _Caches(fail)
+
+
+def _long_prompt() -> str:
+    # Unique per test so entries in the process-wide cache don't leak between tests
+    return f"{uuid.uuid4()} " + "You are a meticulous evaluation judge. " * 50
+
+
+def test_long_system_prompt_creates_and_reuses_cache(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_MIN_TOKENS", 16)
+    client, prompt = _Client(), _long_prompt()
+
+    first = ai_service._gemini_cached_content(client, "gemini-2.5-flash", prompt)
+    second = ai_service._gemini_cached_content(client, "gemini-2.5-flash", prompt)
+
+    assert first == second == "cachedContents/1"
+    assert len(client.caches.created) == 1
+
+
+def test_short_system_prompt_is_not_cached(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_MIN_TOKENS", 10_000_000)
+    client = _Client()
+
+    assert ai_service._gemini_cached_content(client, "gemini-2.5-flash", _long_prompt()) is None
+    assert client.caches.created == []
+
+
+def test_failed_creation_is_remembered(monkeypatch):
+    monkeypatch.setattr(settings, "GEMINI_CONTEXT_CACHE_MIN_TOKENS", 16)
+    client, prompt = _Client(fail=True), _long_prompt()
+
+    assert ai_service._gemini_cached_content(client, "gemini-2.5-flash", prompt) is None
+    client.caches.fail = False
+    # Not retried until the remembered failure expires
+    assert ai_service._gemini_cached_content(client, "gemini-2.5-flash", prompt) is None
+    assert client.caches.created == []
@@ -0,0 +1,54 @@
+"""
+JSON recovery from free-text and truncated model output (no network).
+
+Usage (from backend/):
+    python -m pytest tests/test_json_extract.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest  # noqa: E402
+
+from app.core.json_extract import JSONExtractError, JSONExtractor, extract_json  # noqa: E402
+
+
+def test_fenced_object_with_trailing_comma():
+    assert extract_json('```json\n{"score": 4, "reason": "ok",}\n```') == {"score": 4, "reason": "ok"}
+
+
+def test_braces_in_prose_and_strings_are_skipped():
+    assert extract_json('Here: {name} then {"a": {"b": "x}"}, "c": 2} tail') == {"a": {"b": "x}"}, "c": 2}
+
+
+def test_truncated_string_is_closed():
+    text = '{"ai_evaluation": [{"metric": "Clarity", "score": 4, "reason": "Clear and conc'
+    assert extract_json(text) == {
+        "ai_evaluation": [{"metric": "Clarity", "score": 4, "reason": "Clear and conc"}]
+    }
+
+
+def test_truncated_array_is_closed():
+    assert extract_json('Sure! {"a": [1, 2,') == {"a": [1, 2]}
+
+
+def test_dangling_key_after_colon_is_dropped():
+    text = '{"ai_evaluation": [{"metric": "Clarity", "score": 4}], "prompt_analysis":'
+    assert extract_json(text) == {"ai_evaluation": [{"metric": "Clarity", "score": 4}]}
+
+
+def test_key_cut_off_mid_name_is_dropped():
+    text = '{"ai_evaluation": [], "prompt_analysis": {"score": 3, "summ'
+    assert extract_json(text) == {"ai_evaluation": [], "prompt_analysis": {"score": 3}}
+
+
+def test_streamed_chunks():
+    extractor = JSONExtractor()
+    assert [extractor.feed(c) for c in ('{"a": ', '[1, {"b": "}"}', ']} trailing')] == [False, False, True]
+    assert extractor.result() == {"a": [1, {"b": "}"}]}
+
+
+def test_no_json_raises():
+    with pytest.raises(JSONExtractError):
+        extract_json("I cannot score this response.")
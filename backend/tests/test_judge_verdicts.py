@@ -0,0 +1,68 @@
+"""
+AI judge verdicts from partial or unparseable output, with a stubbed provider (no network).
+
+Usage (from backend/):
+    python -m pytest tests/test_judge_verdicts.py
+"""
+import asyncio
+import json
+import os
+import sys
+import uuid
+
+os.environ.setdefault("CACHE_BACKEND", "memory")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import evaluation_service as es  # noqa: E402
+
+METRICS = ["Correctness", "Clarity"]
+
+
+def _stub(monkeypatch, text: str) -> list:
+    calls = []
+
+    async def generate(provider, model_id, prompt, **kwargs):
+        calls.append(model_id)
+        return {"text": text, "parsed": None, "cost": 0.002, "input_tokens": 900, "output_tokens": 80, "latency_ms": 5}
+
+    monkeypatch.setattr(es.ai_service, "generate", generate)
+    return calls
+
+
+def _score(response: str) -> dict:
+    return asyncio.run(es.evaluation_service.get_ai_scores("prompt", response, METRICS))
+
+
+def test_skipped_metric_is_unscored_and_not_cached(monkeypatch):
+    # Cut off after the first criterion
+    calls = _stub(monkeypatch, '{"prompt_analysis": {"score": 4, "summary": "ok"}, "ai_evaluation": '
+                               '[{"metric": "Correctness", "score": 5, "reason": "right"}, {"metric": "Cla')
+    response = str(uuid.uuid4())
+
+    verdict = _score(response)
+    assert {e["metric"]: e["score"] for e in verdict["ai_evaluation"]} == {"Correctness": 5, "Clarity": 0}
+    assert verdict["judge_cost"] == 0.002
+    # Incomplete verdicts are not reused: the judge is asked again
+    _score(response)
+    assert len(calls) == 2
+
+
+def test_complete_verdict_is_cached(monkeypatch):
+    calls = _stub(monkeypatch, json.dumps({
+        "prompt_analysis": {"score": 4, "summary": "ok"},
+        "ai_evaluation": [{"metric": m, "score": 4, "reason": "fine"} for m in METRICS],
+    }))
+    response = str(uuid.uuid4())
+
+    assert _score(response)["judge_cost"] == 0.002
+    cached = _score(response)
+    assert len(calls) == 1
+    assert cached["judge_cost"] == 0.0 and list(cached["judge_tokens"]) == [900, 80]
+
+
+def test_unparseable_output_is_unscored_but_charged(monkeypatch):
+    _stub(monkeypatch, "I am unable to grade this.")
+
+    verdict = _score(str(uuid.uuid4()))
+    assert all(e["score"] == 0 for e in verdict["ai_evaluation"])
+    assert verdict["judge_cost"] == 0.002 and verdict["judge_tokens"] == (900, 80)